@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the predictors (see predictors.py) on dev: wall time of fit and
+predict, languages predicted per second, peak RSS and accuracy in one table.
+Every predictor runs in its own fresh process, so that the peak RSS is its own.
+
+python3 benchmark.py --predictors majority family_majority knn \
+    --precomputed lang_embedding ../outputs/lang_embedding.csv ../outputs/lang_embedding_probs.csv
+"""
+import argparse
+import json
+import multiprocessing
+import time
+
+import dataset_cache
+import evaluate
+import instrumentation
+import predictors
+
+
+def run(spec, train_path, input_path, golden_path):
+    """
+    Fits and evaluates one predictor given as (name, kwargs) or ('precomputed', (name, predictions, scores)), returns its record.
+    """
+    if instrumentation.enabled:
+        # the worker collects without writing a trace of its own, its timers go to the record
+        instrumentation.enable()
+    train = dataset_cache.read_csv(train_path)
+    masked = dataset_cache.read_csv(input_path)
+    golden = dataset_cache.read_csv(golden_path)
+    name, arguments = spec
+    if name == 'precomputed':
+        predictor = predictors.PrecomputedPredictor(*arguments)
+    else:
+        predictor = predictors.create(name, **arguments)
+
+    start = time.perf_counter()
+    with instrumentation.timer('benchmark.fit'):
+        predictor.fit(train)
+    fitted = time.perf_counter()
+    with instrumentation.timer('benchmark.predict'):
+        values, _ = predictor.predict(masked)
+    predicted = time.perf_counter()
+
+    record = {
+        'predictor': predictor.name,
+        'fit_seconds': fitted - start,
+        'predict_seconds': predicted - fitted,
+        'languages_per_second': len(masked) / (predicted - fitted),
+        'peak_rss_mb': instrumentation.peak_rss_mb(),
+        'accuracy': float(evaluate.evaluate(masked.to_numpy(), values.to_numpy(), golden.to_numpy())),
+    }
+    if instrumentation.enabled:
+        trace = instrumentation.trace()
+        record.update(timers=trace['timers'], counters=trace['counters'])
+    return record
+
+
+def benchmark(specs, train_path, input_path, golden_path):
+    # a fresh spawned process for every predictor, a forked one would inherit the memory of the previous ones
+    context = multiprocessing.get_context('spawn')
+    records = []
+    for spec in specs:
+        with context.Pool(1) as pool:
+            records.append(pool.apply(run, (spec, train_path, input_path, golden_path)))
+        if 'timers' in records[-1]:
+            # the trace of the main process sums up the timers of all the predictors
+            instrumentation.merge(records[-1]['timers'], records[-1]['counters'])
+    return records
+
+
+def print_table(records):
+    print('predictor', 'fit [s]', 'predict [s]', 'languages/s', 'peak RSS [MB]', 'accuracy', sep='\t')
+    for record in records:
+        print(record['predictor'], '{:.3f}'.format(record['fit_seconds']), '{:.3f}'.format(record['predict_seconds']),
+              '{:.0f}'.format(record['languages_per_second']), '{:.0f}'.format(record['peak_rss_mb']),
+              '{:.2%}'.format(record['accuracy']), sep='\t')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train", type=str, default="../data/train_y.csv", help="Path to the train file with all the values.")
+    parser.add_argument("--input_file", type=str, default="../data/dev_x.csv", help="Path to the masked dev file.")
+    parser.add_argument("--golden_file", type=str, default="../data/dev_y.csv", help="Path to the dev file with golden values.")
+    parser.add_argument("--predictors", type=str, nargs="*", default=list(predictors.PREDICTORS), help="Names of the predictors.")
+    parser.add_argument("--precomputed", type=str, nargs=3, action="append", default=[], metavar=("NAME", "PREDICTIONS", "SCORES"),
+                        help="Written predictions (and scores or none) of a method trained by its own script.")
+    parser.add_argument("--json", type=str, help="Write the records to this file.")
+    args = parser.parse_args()
+
+    specs = [(name, {}) for name in args.predictors]
+    specs += [('precomputed', (name, path, None if scores == 'none' else scores)) for name, path, scores in args.precomputed]
+    records = benchmark(specs, args.train, args.input_file, args.golden_file)
+    print_table(records)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(records, f, indent=1)
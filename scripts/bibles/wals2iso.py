@@ -3,15 +3,18 @@
 
 # Rudolf Rosa
 
+import os
 import sys
 import csv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import wals_cldf
+
+wals = wals_cldf.load_wals('data/wals-2020/cldf')
 wals2iso = dict()
-with open('data/wals.tsv') as wals:
-    for line in wals:
-        wals_code, iso_code = line.split()[:2]
-        if iso_code:
-            wals2iso[wals_code] = iso_code
+for wals_code, iso_code in zip(wals.languages['ID'], wals.languages['ISO639P3code']):
+    if iso_code:
+        wals2iso[wals_code] = iso_code
     
 with open('data/dev_y.csv') as dev:
     d2 = csv.DictReader(dev)
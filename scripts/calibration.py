@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+#coding: utf-8
+
+"""
+Calibrates the scores of the systems (the Perl -scores.csv files,
+lang_embedding_probs.csv, ...) to probabilities of the prediction being
+correct, so that the scores of different systems become comparable.
+
+A monotone map is fit on the dev cells of every system (isotonic regression or
+Platt scaling, optionally one per feature with the map of all features for the
+features with fewer than --min_cells dev cells) and reported with the
+reliability table and the expected calibration error (ECE) before and after,
+both in-sample and cross-fitted over the languages. The maps are then applied
+to any prediction/score files and written as score files in the same format,
+so merge_systems.py, compare_scores.py etc. read them directly, and with
+--merge the most confident calibrated system is picked in every cell.
+
+python3 calibration.py --method isotonic --per_feature \
+    --dev ../outputs/cond_prob_info_nous_latlon2d-dev.csv ../outputs/cond_prob_info_nous_latlon2d-dev-scores.csv \
+    --dev ../outputs/lang_embedding.csv ../outputs/lang_embedding_probs.csv \
+    --apply_input ../data/test_x.csv \
+    --apply ../outputs/cond_prob_info_nous_latlon2d-test.csv ../outputs/cond_prob_info_nous_latlon2d-test-scores.csv ../outputs/cond_prob-test-calibrated.csv \
+    --apply ../outputs/lang_embedding_test.csv ../outputs/lang_embedding_test_probs.csv ../outputs/lang_embedding_test-calibrated.csv \
+    --merge ../outputs/calibrated-merge-test.csv
+"""
+
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
+
+import dataset_cache
+import error_analysis
+import merge_systems
+
+import logging
+logging.basicConfig(
+    format='%(asctime)s %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+    level=logging.INFO)
+
+GLOBAL = '*'
+
+
+def fit_map(scores, correct, method='isotonic'):
+    """
+    Fits the map of the scores to the probability of being correct, returns it as a JSON serializable dict.
+    """
+    if len(scores) == 0 or correct.all() or not correct.any():
+        return {'method': 'constant', 'p': float(correct.mean()) if len(scores) else 0.5}
+    if method == 'isotonic':
+        isotonic = IsotonicRegression(y_min=0, y_max=1, out_of_bounds='clip').fit(scores, correct)
+        return {'method': 'isotonic', 'x': isotonic.X_thresholds_.tolist(), 'y': isotonic.y_thresholds_.tolist()}
+    if method == 'platt':
+        platt = LogisticRegression(C=1e6).fit(scores.reshape(-1, 1), correct)
+        return {'method': 'platt', 'a': float(platt.coef_[0, 0]), 'b': float(platt.intercept_[0])}
+    raise ValueError('Unknown calibration method {}'.format(method))
+
+
+def apply_map(mapping, scores):
+    """
+    Calibrated probabilities of the scores, nan where there is no (finite) score.
+    """
+    scores = np.where(np.isfinite(scores), scores, np.nan)
+    if mapping['method'] == 'constant':
+        result = np.full(scores.shape, mapping['p'])
+    elif mapping['method'] == 'isotonic':
+        result = np.interp(scores, mapping['x'], mapping['y'])
+    else:
+        result = 1 / (1 + np.exp(-(mapping['a'] * scores + mapping['b'])))
+    return np.where(np.isnan(scores), np.nan, result)
+
+
+def fit_system(scores, correct, groups, method='isotonic', min_cells=50):
+    """
+    Fits the maps of one system from the scores and correctness of its dev cells, {group name: map}
+    with GLOBAL for all the cells and the groups (feature names, or None) with at least min_cells scored cells.
+    """
+    scored = np.isfinite(scores)
+    maps = {GLOBAL: fit_map(scores[scored], correct[scored], method)}
+    if groups is not None:
+        names, group_ids, sizes = np.unique(groups[scored], return_inverse=True, return_counts=True)
+        for g in np.flatnonzero(sizes >= min_cells):
+            cells = group_ids == g
+            maps[names[g]] = fit_map(scores[scored][cells], correct[scored][cells], method)
+    return maps
+
+
+def calibrate(maps, scores, groups):
+    """
+    Applies the maps of one system to its scores, the groups without their own map use the GLOBAL one.
+    """
+    result = apply_map(maps[GLOBAL], scores)
+    if groups is not None:
+        for name, mapping in maps.items():
+            if name != GLOBAL:
+                cells = groups == name
+                result[cells] = apply_map(mapping, scores[cells])
+    return result
+
+
+def feature_groups(systems, per_feature):
+    return np.asarray(systems.columns, dtype=object)[systems.cols] if per_feature else None
+
+
+def fit(systems, method='isotonic', per_feature=False, min_cells=50):
+    """
+    Fits the maps of all the dev Systems, returns one {group name: map} dict per system.
+    """
+    groups = feature_groups(systems, per_feature)
+    return [fit_system(systems.scores[i], systems.correct[i], groups, method, min_cells) for i in range(len(systems))]
+
+
+def cross_fit(systems, method='isotonic', per_feature=False, min_cells=50, folds=5):
+    """
+    Out-of-fold calibrated (systems, cells) probabilities, the maps of every fold of languages are fit on the other folds.
+    """
+    groups = feature_groups(systems, per_feature)
+    fold = systems.rows % folds
+    result = np.full(systems.scores.shape, np.nan)
+    for f in range(folds):
+        train, test = fold != f, fold == f
+        for i in range(len(systems)):
+            maps = fit_system(systems.scores[i, train], systems.correct[i, train], None if groups is None else groups[train], method, min_cells)
+            result[i, test] = calibrate(maps, systems.scores[i, test], None if groups is None else groups[test])
+    return result
+
+
+def reliability(probabilities, correct, bins=10):
+    """
+    Reliability table of the probabilities in equal width bins: (cells, mean probability, accuracy) of every bin,
+    the cells without a probability are left out.
+    """
+    scored = ~np.isnan(probabilities)
+    probabilities, correct = probabilities[scored], correct[scored]
+    bin_ids = np.minimum((probabilities * bins).astype(np.int64), bins - 1)
+    counts = np.bincount(bin_ids, minlength=bins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        confidence = np.bincount(bin_ids, weights=probabilities, minlength=bins) / counts
+        accuracy = np.bincount(bin_ids, weights=correct, minlength=bins) / counts
+    return counts, confidence, accuracy
+
+
+def expected_calibration_error(probabilities, correct, bins=10):
+    counts, confidence, accuracy = reliability(probabilities, correct, bins)
+    filled = counts > 0
+    return np.sum(counts[filled] * np.abs(accuracy[filled] - confidence[filled])) / max(counts.sum(), 1)
+
+
+def is_probability(scores):
+    scores = scores[np.isfinite(scores)]
+    return len(scores) > 0 and scores.min() >= 0 and scores.max() <= 1
+
+
+def report(systems, calibrated, cross_fitted, bins=10):
+    for i, name in enumerate(systems.names):
+        raw = systems.scores[i]
+        raw_ece = '{:.4f}'.format(expected_calibration_error(raw, systems.correct[i], bins)) if is_probability(raw) else 'n/a'
+        print('{}: ECE raw {}, calibrated {:.4f}, cross-fitted {:.4f}'.format(
+            name, raw_ece,
+            expected_calibration_error(calibrated[i], systems.correct[i], bins),
+            expected_calibration_error(cross_fitted[i], systems.correct[i], bins)))
+        print('bin', 'cells', 'probability', 'accuracy', sep='\t')
+        for b, (cells, confidence, accuracy) in enumerate(zip(*reliability(cross_fitted[i], systems.correct[i], bins))):
+            print('{:.2f}-{:.2f}'.format(b / bins, (b + 1) / bins), cells, '{:.4f}'.format(confidence), '{:.4f}'.format(accuracy), sep='\t')
+        print()
+
+
+def write_calibrated(path, score_file, systems, probabilities):
+    """
+    Writes the score file with the scores of the predicted cells of the Systems replaced by the probabilities.
+    """
+    frame = dataset_cache.read_csv(score_file)
+    columns = frame.columns.get_indexer(np.asarray(systems.columns, dtype=object)[systems.cols])
+    found = columns >= 0
+    values = frame.to_numpy(dtype=object)
+    values[systems.rows[found], columns[found]] = probabilities[found]
+    pd.DataFrame(values, columns=frame.columns).fillna('nan').to_csv(path, index=False)
+
+
+def most_confident(probabilities):
+    """
+    The system with the highest calibrated probability of every cell (the first system where none has one).
+    """
+    return np.argmax(np.where(np.isnan(probabilities), -np.inf, probabilities), axis=0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dev_input', default='../data/dev_x.csv', help='Dev input with ? in the predicted cells.')
+    parser.add_argument('--dev_gold', default='../data/dev_y.csv', help='Dev gold values.')
+    parser.add_argument('--dev', nargs=2, action='append', metavar=('PREDICTIONS', 'SCORES'), default=[], help='Dev predictions of one system and their scores.')
+    parser.add_argument('--method', choices=['isotonic', 'platt'], default='isotonic', help='Calibration map.')
+    parser.add_argument('--per_feature', action='store_true', help='Fit one map per feature.')
+    parser.add_argument('--min_cells', type=int, default=50, help='Features with fewer scored dev cells use the map of all features.')
+    parser.add_argument('--bins', type=int, default=10, help='Number of bins of the reliability table and ECE.')
+    parser.add_argument('--folds', type=int, default=5, help='Folds of languages for the cross-fitted ECE.')
+    parser.add_argument('--maps', help='Save the maps to this JSON file (or load them from it if there is no --dev).')
+    parser.add_argument('--apply_input', default='../data/test_x.csv', help='Input with ? in the cells of the --apply files.')
+    parser.add_argument('--apply', nargs=3, action='append', metavar=('PREDICTIONS', 'SCORES', 'OUTPUT'), default=[],
+                        help='Writes the calibrated scores of the same systems as --dev in the same order to OUTPUT.')
+    parser.add_argument('--merge', help='Write the --apply predictions of the most confident system of every cell here.')
+    args = parser.parse_args()
+    if args.merge and not args.apply:
+        parser.error('--merge needs the systems to merge in --apply')
+
+    if args.dev:
+        dev = error_analysis.Systems(args.dev_input, args.dev_gold, [p for p, _ in args.dev], [s for _, s in args.dev])
+        maps = fit(dev, args.method, args.per_feature, args.min_cells)
+        groups = feature_groups(dev, args.per_feature)
+        calibrated = np.stack([calibrate(system_maps, dev.scores[i], groups) for i, system_maps in enumerate(maps)])
+        report(dev, calibrated, cross_fit(dev, args.method, args.per_feature, args.min_cells, args.folds), args.bins)
+        logging.info('Dev accuracy of the most confident system (in-sample): {:.2%}'.format(
+            np.mean(dev.correct[most_confident(calibrated), np.arange(dev.cells)])))
+        if args.maps:
+            with open(args.maps, 'w') as f:
+                json.dump({'per_feature': args.per_feature, 'maps': maps}, f, indent=1)
+    elif args.maps:
+        with open(args.maps) as f:
+            saved = json.load(f)
+        maps, args.per_feature = saved['maps'], saved['per_feature']
+    else:
+        parser.error('either --dev or --maps are needed')
+
+    if args.apply:
+        if len(args.apply) != len(maps):
+            parser.error('--apply needs the same systems as --dev')
+        target = error_analysis.Systems(args.apply_input, None, [p for p, _, _ in args.apply], [s for _, s, _ in args.apply])
+        groups = feature_groups(target, args.per_feature)
+        probabilities = np.stack([calibrate(system_maps, target.scores[i], groups) for i, system_maps in enumerate(maps)])
+        for (_, score_file, output), system_probabilities in zip(args.apply, probabilities):
+            write_calibrated(output, score_file, target, system_probabilities)
+        if args.merge:
+            merged = target.predicted[most_confident(probabilities), np.arange(target.cells)]
+            merge_systems.write_merged(args.merge, target, args.apply_input, merged)
+        logging.info('Calibrated {} cells of {} systems'.format(target.cells, len(target)))
@@ -4,29 +4,11 @@
 # Rudolf Rosa
 
 import sys
-from collections import defaultdict
-import csv
 
+import numpy as np
 
-import logging
-logging.basicConfig(
-    format='%(asctime)s %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    level=logging.DEBUG)
-    #level=logging.WARN)
+import error_analysis
 
-dev_x = csv.DictReader(open(sys.argv[1]))
-dev_y = csv.DictReader(open(sys.argv[2]))
-out_1 = csv.DictReader(open(sys.argv[3]))
-out_2 = csv.DictReader(open(sys.argv[4]))
-
-# dict[feat] = count
-total = defaultdict(int)
-correct_1 = defaultdict(int)
-correct_2 = defaultdict(int)
-correct_any = defaultdict(int)
-better_1 = defaultdict(int)
-better_2 = defaultdict(int)
 
 def percent(share, total):
     if total > 0:
@@ -34,22 +16,18 @@ def percent(share, total):
     else:
         return '--'
 
-for line_x, line_y, line_1, line_2 in zip(dev_x, dev_y, out_1, out_2):
-    for feat in line_x:
-        if line_x[feat] == '?':
-            is_correct_1 = line_y[feat] == line_1[feat]
-            is_correct_2 = line_y[feat] == line_2[feat]
-            
-            total[feat] += 1
-            correct_1[feat] += is_correct_1
-            correct_2[feat] += is_correct_2
-            correct_any[feat] += (is_correct_1 or is_correct_2)
-            better_1[feat] += (is_correct_1 and not is_correct_2)
-            better_2[feat] += (is_correct_2 and not is_correct_1)
+
+# dev_x dev_y out_1 out_2
+systems = error_analysis.Systems(sys.argv[1], sys.argv[2], sys.argv[3:5])
+
+# per feature counts: total, correct 1, correct 2, correct any, better 1, better 2
+total, correct_1, correct_2, correct_any, better_1, better_2 = systems.count([
+    np.ones(systems.cells, dtype=bool), systems.correct[0], systems.correct[1],
+    systems.any_correct(), systems.better(0, 1), systems.better(1, 0)])
 
 print('Feature', 'Acc 1', 'Acc 2', 'Acc *', '1 > 2', 'Support', sep='\t')
-for feat in total:
-    print(feat,
+for feat in systems.features():
+    print(systems.columns[feat],
             percent(correct_1[feat], total[feat]),
             percent(correct_2[feat], total[feat]),
             percent(correct_any[feat], total[feat]),
@@ -58,9 +36,9 @@ for feat in total:
             sep='\t')
 
 print('TOTAL',
-        percent(sum(correct_1.values()), sum(total.values())),
-        percent(sum(correct_2.values()), sum(total.values())),
-        percent(sum(correct_any.values()), sum(total.values())),
-        percent(sum(better_1.values()), sum(better_1.values()) + sum(better_2.values())),
-        sum(better_1.values()) + sum(better_2.values()),
+        percent(sum(correct_1), sum(total)),
+        percent(sum(correct_2), sum(total)),
+        percent(sum(correct_any), sum(total)),
+        percent(sum(better_1), sum(better_1) + sum(better_2)),
+        sum(better_1) + sum(better_2),
         sep='\t')
@@ -4,39 +4,11 @@
 # Rudolf Rosa
 
 import sys
-from collections import defaultdict
-import csv
-
-
-import logging
-logging.basicConfig(
-    format='%(asctime)s %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    level=logging.DEBUG)
-    #level=logging.WARN)
-
-dev_x = csv.DictReader(open(sys.argv[1]))
-dev_y = csv.DictReader(open(sys.argv[2]))
-out_1 = csv.DictReader(open(sys.argv[3]))
-out_1_scores = csv.DictReader(open(sys.argv[4]))
-out_2 = csv.DictReader(open(sys.argv[5]))
-out_2_scores = csv.DictReader(open(sys.argv[6]))
-
-# dict[feat] = count
-total = defaultdict(int)
-correct_1 = defaultdict(int)
-correct_2 = defaultdict(int)
-correct_any = defaultdict(int)
-better_1 = defaultdict(int)
-better_2 = defaultdict(int)
-correct_1_scores = list()
-incorrect_1_scores = list()
-correct_2_scores = list()
-incorrect_2_scores = list()
-better_1_scores = list()
-worse_1_scores = list()
-better_2_scores = list()
-worse_2_scores = list()
+
+import numpy as np
+
+import error_analysis
+
 
 def percent(share, total):
     if total > 0:
@@ -47,160 +19,63 @@ def percent(share, total):
 def tdp(number):
     return '{:.3f}'.format(number)
 
-for line_x, line_y, line_1, line_1_score, line_2, line_2_score in zip(
-        dev_x, dev_y, out_1, out_1_scores, out_2, out_2_scores):
-    for feat in line_x:
-        if line_x[feat] == '?':
-            is_correct_1 = line_y[feat] == line_1[feat]
-            is_correct_2 = line_y[feat] == line_2[feat]
-            score_1 = float(line_1_score[feat])
-            score_2 = float(line_2_score[feat])
-            
-            total[feat] += 1
-            correct_1[feat] += is_correct_1
-            correct_2[feat] += is_correct_2
-            correct_any[feat] += (is_correct_1 or is_correct_2)
-            
-            if is_correct_1 and not is_correct_2:
-                better_1[feat] += 1
-                better_1_scores.append(score_1)
-                worse_2_scores.append(score_2)
-            if is_correct_2 and not is_correct_1:
-                better_2[feat] += 1
-                better_2_scores.append(score_2)
-                worse_1_scores.append(score_1)
-
-            if is_correct_1:
-                correct_1_scores.append(score_1)
-            else:
-                incorrect_1_scores.append(score_1)
-            if is_correct_2:
-                correct_2_scores.append(score_2)
-            else:
-                incorrect_2_scores.append(score_2)
+def print_curve(name, header, scores, flags, count_better):
+    print()
+    print(name, 'Better?', header, sep='\t')
+    counts = np.cumsum(flags if count_better else ~flags)
+    for total_count, (score, better, count) in enumerate(zip(scores, flags, counts), 1):
+        print(tdp(score), bool(better), percent(count, total_count), sep='\t')
 
+def print_stats(name, evaluation, stats):
+    print(name, evaluation, *[tdp(stat) for stat in stats], sep='\t')
 
 
+# dev_x dev_y out_1 out_1_scores out_2 out_2_scores
+systems = error_analysis.Systems(sys.argv[1], sys.argv[2], sys.argv[3:7:2], sys.argv[4:7:2])
+better_1, better_2 = systems.better(0, 1), systems.better(1, 0)
+
+total, correct_1, correct_2, correct_any, better_1_count, better_2_count = systems.count([
+    np.ones(systems.cells, dtype=bool), systems.correct[0], systems.correct[1],
+    systems.any_correct(), better_1, better_2])
+
 print()
 print('Feature', 'Acc 1', 'Acc 2', 'Acc *', '1 > 2', 'Support', sep='\t')
-for feat in total:
-    print(feat,
+for feat in systems.features():
+    print(systems.columns[feat],
             percent(correct_1[feat], total[feat]),
             percent(correct_2[feat], total[feat]),
             percent(correct_any[feat], total[feat]),
-            percent(better_1[feat], (better_1[feat] + better_2[feat])),
-            better_1[feat] + better_2[feat],
+            percent(better_1_count[feat], (better_1_count[feat] + better_2_count[feat])),
+            better_1_count[feat] + better_2_count[feat],
             sep='\t')
 
-def tuple2first(tup):
-    return tup[0]
-
-dan_sc_bw = list()
-for score in better_1_scores:
-    dan_sc_bw.append((score, True))
-for score in worse_1_scores:
-    dan_sc_bw.append((score, False))
-dan_sc_bw.sort(key=tuple2first, reverse=True)
-
-martin_sc_bw = list()
-for score in better_2_scores:
-    martin_sc_bw.append((score, True))
-for score in worse_2_scores:
-    martin_sc_bw.append((score, False))
-martin_sc_bw.sort(key=tuple2first)
-
-print()
-print('Dan', 'Better?', '% better', sep='\t')
-better_count = 0
-total_count = 0
-for score, better in dan_sc_bw:
-    total_count += 1
-    better_count += better
-    print(tdp(score), better, percent(better_count, total_count), sep='\t')
-
-print()
-print('Martin', 'Better?', '% worse', sep='\t')
-worse_count = 0
-total_count = 0
-for score, better in martin_sc_bw:
-    total_count += 1
-    worse_count += not better
-    print(tdp(score), better, percent(worse_count, total_count), sep='\t')
-
-print()
-print('Martin', 'Better?', '% better', sep='\t')
-martin_sc_bw.sort(key=tuple2first, reverse=True)
-better_count = 0
-total_count = 0
-for score, better in martin_sc_bw:
-    total_count += 1
-    better_count += better
-    print(tdp(score), better, percent(better_count, total_count), sep='\t')
+# the scores where exactly one of the systems is right, ranked
+print_curve('Dan', '% better', *systems.score_curve(0, better_1, better_2), count_better=True)
+print_curve('Martin', '% worse', *systems.score_curve(1, better_2, better_1, descending=False), count_better=False)
+print_curve('Martin', '% better', *systems.score_curve(1, better_2, better_1), count_better=True)
 
 print()
 print('Feature', 'Acc 1', 'Acc 2', 'Acc *', '1 > 2', 'Support', sep='\t')
 print('TOTAL',
-        percent(sum(correct_1.values()), sum(total.values())),
-        percent(sum(correct_2.values()), sum(total.values())),
-        percent(sum(correct_any.values()), sum(total.values())),
-        percent(sum(better_1.values()), sum(better_1.values()) + sum(better_2.values())),
-        sum(better_1.values()) + sum(better_2.values()),
+        percent(sum(correct_1), sum(total)),
+        percent(sum(correct_2), sum(total)),
+        percent(sum(correct_any), sum(total)),
+        percent(sum(better_1_count), sum(better_1_count) + sum(better_2_count)),
+        sum(better_1_count) + sum(better_2_count),
         sep='\t')
 
 print()
 print('Setup', 'Eval', 'Min', 'Max', 'Avg', sep='\t')
-
-print('Dan',
-        'Incorr.',
-        tdp(min(incorrect_1_scores)),
-        tdp(max(incorrect_1_scores)),
-        tdp(sum(incorrect_1_scores)/len(incorrect_1_scores)),
-        sep='\t')
-print('Dan',
-        'Correct',
-        tdp(min(correct_1_scores)),
-        tdp(max(correct_1_scores)),
-        tdp(sum(correct_1_scores)/len(correct_1_scores)),
-        sep='\t')
-print('Martin',
-        'Incorr.',
-        tdp(min(incorrect_2_scores)),
-        tdp(max(incorrect_2_scores)),
-        tdp(sum(incorrect_2_scores)/len(incorrect_2_scores)),
-        sep='\t')
-print('Martin',
-        'Correct',
-        tdp(min(correct_2_scores)),
-        tdp(max(correct_2_scores)),
-        tdp(sum(correct_2_scores)/len(correct_2_scores)),
-        sep='\t')
+print_stats('Dan', 'Incorr.', systems.score_stats(0, ~systems.correct[0]))
+print_stats('Dan', 'Correct', systems.score_stats(0, systems.correct[0]))
+print_stats('Martin', 'Incorr.', systems.score_stats(1, ~systems.correct[1]))
+print_stats('Martin', 'Correct', systems.score_stats(1, systems.correct[1]))
 
 print()
 print('Setup', 'Eval', 'Min', 'Max', 'Avg', sep='\t')
-print('Dan',
-        'Worse',
-        tdp(min(worse_1_scores)),
-        tdp(max(worse_1_scores)),
-        tdp(sum(worse_1_scores)/len(worse_1_scores)),
-        sep='\t')
-print('Dan',
-        'Better',
-        tdp(min(better_1_scores)),
-        tdp(max(better_1_scores)),
-        tdp(sum(better_1_scores)/len(better_1_scores)),
-        sep='\t')
-print('Martin',
-        'Worse',
-        tdp(min(worse_2_scores)),
-        tdp(max(worse_2_scores)),
-        tdp(sum(worse_2_scores)/len(worse_2_scores)),
-        sep='\t')
-print('Martin',
-        'Better',
-        tdp(min(better_2_scores)),
-        tdp(max(better_2_scores)),
-        tdp(sum(better_2_scores)/len(better_2_scores)),
-        sep='\t')
+print_stats('Dan', 'Worse', systems.score_stats(0, better_2))
+print_stats('Dan', 'Better', systems.score_stats(0, better_1))
+print_stats('Martin', 'Worse', systems.score_stats(1, better_1))
+print_stats('Martin', 'Better', systems.score_stats(1, better_2))
 
 # TODO correlation?
-
@@ -3,40 +3,12 @@
 
 # Rudolf Rosa
 
+import argparse
 import sys
-from collections import defaultdict
-import csv
-
-
-import logging
-logging.basicConfig(
-    format='%(asctime)s %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    level=logging.DEBUG)
-    #level=logging.WARN)
-
-dev_x = csv.DictReader(open(sys.argv[1]))
-dev_y = csv.DictReader(open(sys.argv[2]))
-out_1 = csv.DictReader(open(sys.argv[3]))
-out_1_scores = csv.DictReader(open(sys.argv[4]))
-out_2 = csv.DictReader(open(sys.argv[5]))
-out_2_scores = csv.DictReader(open(sys.argv[6]))
-thresh_1 = float(sys.argv[7])
-thresh_2 = float(sys.argv[8])
-
-# dict[feat] = count
-total = 0
-correct_1 = 0
-correct_2 = 0
-correct_any = 0
-correct_thresh = 0
-better_1 = 0
-better_2 = 0
-different_count = 0
-correct_1_scores = []
-incorrect_1_scores = []
-
-diff_scores = list()
+
+import numpy as np
+
+import error_analysis
 
 
 def percent(share, total):
@@ -48,118 +20,82 @@ def percent(share, total):
 def tdp(number):
     return '{:.3f}'.format(number)
 
-for line_x, line_y, line_1, line_1_score, line_2, line_2_score in zip(
-        dev_x, dev_y, out_1, out_1_scores, out_2, out_2_scores):
-    for feat in line_x:
-        if line_x[feat] == '?':
-            is_correct_1 = line_y[feat] == line_1[feat]
-            is_correct_2 = line_y[feat] == line_2[feat]
-            is_different = (line_1[feat] != line_2[feat]) and (is_correct_1 or is_correct_2)
-            score_1 = float(line_1_score[feat])
-            score_2 = float(line_2_score[feat])
-            
-            if score_1 > thresh_1 and score_2 < thresh_2:
-                # choosing Dan
-                is_correct_thresh = is_correct_1
-                choose_1 = True
-            else:
-                # choosing Martin
-                is_correct_thresh = is_correct_2
-                choose_1 = False
-
-            total += 1
-            correct_1 += is_correct_1
-            correct_2 += is_correct_2
-            correct_any += (is_correct_1 or is_correct_2)
-            correct_thresh += is_correct_thresh
-            
-            if is_correct_1 and not is_correct_2:
-                better_1 += 1
-            if is_correct_2 and not is_correct_1:
-                better_2 += 1
-
-            different_count += is_different
-
-
-            if is_different:
-                diff_scores.append((score_1, score_2, is_correct_1))
-
-
-            if is_different and choose_1:
-                if is_correct_thresh:
-                    correct_1_scores.append(score_1)
-                else:
-                    incorrect_1_scores.append(score_1)
-
-def tuple2first(tup):
-    return tup[0]
-
-def tuple2second(tup):
-    return tup[1]
 
+def grid(scores, size):
+    """
+    size thresholds at the quantiles of the finite scores, with -inf and inf at the ends.
+    """
+    scores = scores[np.isfinite(scores)]
+    return np.concatenate([[-np.inf], np.unique(np.quantile(scores, np.linspace(0, 1, size))), [np.inf]])
+
+def sweep(systems, size=None, surface_file=None):
+    """
+    Reports the best thresholds from the accuracy surface of all threshold pairs (on a grid of the given size,
+    or all the distinct scores).
+    """
+    thresh_1 = thresh_2 = None
+    if size is not None:
+        thresh_1, thresh_2 = grid(systems.scores[0], size), grid(systems.scores[1], size)
+    thresh_1, thresh_2, accuracy = systems.threshold_surface(0, 1, thresh_1, thresh_2)
+
+    print('Acc 1', 'Acc 2', 'Acc *', sep='\t')
+    print(*[percent(acc, 1) for acc in systems.accuracy()], percent(np.mean(systems.any_correct()), 1), sep='\t')
+    print()
+    print('Thresh 1', 'Thresh 2', 'Acc thresh', sep='\t')
+    best = np.argsort(-accuracy, axis=None, kind='stable')[:10]
+    for i, j in zip(*np.unravel_index(best, accuracy.shape)):
+        print(tdp(thresh_1[i]), tdp(thresh_2[j]), percent(accuracy[i, j], 1), sep='\t')
+
+    if surface_file:
+        with open(surface_file, 'w') as f:
+            print('thresh_1\\thresh_2', *thresh_2, sep=',', file=f)
+            for threshold, row in zip(thresh_1, accuracy):
+                print(threshold, *row, sep=',', file=f)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('files', nargs=6, help='dev_x dev_y out_1 out_1_scores out_2 out_2_scores')
+parser.add_argument('thresh_1', type=float, nargs='?', help='Use out_1 if its score is above thresh_1...')
+parser.add_argument('thresh_2', type=float, nargs='?', help='...and the score of out_2 is below thresh_2. Without thresholds, sweep all of them.')
+parser.add_argument('--grid', type=int, help='Sweep this many thresholds (at score quantiles) instead of all distinct scores.')
+parser.add_argument('--surface', help='Write the accuracy of all the swept threshold pairs as a CSV matrix to this file.')
+args = parser.parse_args()
+
+systems = error_analysis.Systems(args.files[0], args.files[1], args.files[2:6:2], args.files[3:6:2])
+if args.thresh_2 is None:
+    sweep(systems, args.grid, args.surface)
+    sys.exit()
+thresh_1 = args.thresh_1
+thresh_2 = args.thresh_2
+
+correct_1, correct_2 = systems.correct
+# choosing Dan where his score is high and Martin's low, Martin otherwise
+choose_1 = systems.choose(0, 1, thresh_1, thresh_2)
+correct_thresh = np.where(choose_1, correct_1, correct_2)
+is_different = systems.different(0, 1) & systems.any_correct()
+used_1 = is_different & choose_1
 
 print('Different', '1 better', '2 better', 'Correctly 1', 'Incorrectly 1')
-print(different_count, better_1, better_2, len(correct_1_scores), len(incorrect_1_scores))
-
+print(np.sum(is_different), np.sum(systems.better(0, 1)), np.sum(systems.better(1, 0)),
+        np.sum(used_1 & correct_thresh), np.sum(used_1 & ~correct_thresh))
 
-diff_scores.sort(key=tuple2first, reverse=True)
+# the cells where the systems differ ranked by the score of Dan, with the running accuracy of Martin
+different = np.flatnonzero(is_different)
+different = different[np.argsort(-systems.scores[0, different], kind='stable')]
 print()
 print('Score 1', 'Score 2', '1 > 2', 'Acc', sep='\t')
-diff_correct_2 = 0
-diff_total = 0
-for score_1, score_2, is_correct_1 in diff_scores:
-    diff_total += 1
-    diff_correct_2 += not is_correct_1
-    print(tdp(score_1), tdp(score_2), is_correct_1, percent(diff_correct_2, diff_total), sep='\t')
-
-
-#dan_sc_bw = list()
-#for score in correct_1_scores:
-#    dan_sc_bw.append((score, True))
-#for score in incorrect_1_scores:
-#    dan_sc_bw.append((score, False))
-#dan_sc_bw.sort(key=tuple2first, reverse=True)
-
-#print()
-#print('Dan', 'Better?', '% better', sep='\t')
-#better_count = 0
-#total_count = 0
-#for score, better in dan_sc_bw:
-#    total_count += 1
-#    better_count += better
-#    print(tdp(score), better, percent(better_count, total_count), sep='\t')
-
-
+diff_correct_2 = np.cumsum(~correct_1[different])
+for diff_total, cell in enumerate(different, 1):
+    print(tdp(systems.scores[0, cell]), tdp(systems.scores[1, cell]), bool(correct_1[cell]), percent(diff_correct_2[diff_total - 1], diff_total), sep='\t')
 
+total = systems.cells
 print()
 print('Feature', 'Acc 1', 'Acc 2', 'Acc *', 'Acc thresh', sep='\t')
-print('TOTAL',
-        percent(correct_1, total),
-        percent(correct_2, total),
-        percent(correct_any, total),
-        percent(correct_thresh, total),
-        sep='\t')
-print(total,
-        correct_1,
-        correct_2,
-        correct_any,
-        correct_thresh,
-        sep='\t')
+counts = [np.sum(correct_1), np.sum(correct_2), np.sum(systems.any_correct()), np.sum(correct_thresh)]
+print('TOTAL', *[percent(count, total) for count in counts], sep='\t')
+print(total, *counts, sep='\t')
 
 print()
 print('Setup', 'Eval', 'Min', 'Max', 'Avg', sep='\t')
-
-print('Dan if used',
-        'Incorr.',
-        tdp(min(incorrect_1_scores)),
-        tdp(max(incorrect_1_scores)),
-        tdp(sum(incorrect_1_scores)/len(incorrect_1_scores)),
-        sep='\t')
-print('Dan if used',
-        'Correct',
-        tdp(min(correct_1_scores)),
-        tdp(max(correct_1_scores)),
-        tdp(sum(correct_1_scores)/len(correct_1_scores)),
-        sep='\t')
-
-
+print('Dan if used', 'Incorr.', *[tdp(stat) for stat in systems.score_stats(0, used_1 & ~correct_thresh)], sep='\t')
+print('Dan if used', 'Correct', *[tdp(stat) for stat in systems.score_stats(0, used_1 & correct_thresh)], sep='\t')
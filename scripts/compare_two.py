@@ -1,5 +1,9 @@
 import argparse
-import pandas as pd
+import os
+
+import numpy as np
+
+import dataset_cache
 import evaluate
 
 
@@ -9,12 +13,28 @@ if __name__ == "__main__":
     parser.add_argument("--input_file", type=str, help="Path to input file.")
     parser.add_argument("--output_file_1", type=str, help="Path to output file 1.")
     parser.add_argument("--output_file_2", type=str, help="Path to output file 2.")
+    parser.add_argument("--output_files", type=str, nargs="+", help="Paths to any number of output files, compared all at once.")
     parser.add_argument("--golden_file", type=str, help="Path to file with golden values.")
+    parser.add_argument("--per_feature", action="store_true", help="Also print the accuracy of every system on every feature.")
     args = parser.parse_args()
 
-    inp = pd.read_csv(args.input_file).to_numpy()
-    out1 = pd.read_csv(args.output_file_1).to_numpy()
-    out2 = pd.read_csv(args.output_file_2).to_numpy()
-    gold = pd.read_csv(args.golden_file).to_numpy()
-    
-    print(evaluate.compare(inp, out1, out2, gold))
+    if not args.output_files:
+        _, (inp, out1, out2, gold) = dataset_cache.load_aligned(
+            args.input_file, args.output_file_1, args.output_file_2, args.golden_file)
+        print(evaluate.compare(inp, out1, out2, gold, dataset_cache.UNKNOWN))
+    else:
+        _, (inp, gold, *outputs) = dataset_cache.load_aligned(args.input_file, args.golden_file, *args.output_files)
+        result = evaluate.compare_many(inp, outputs, gold, dataset_cache.UNKNOWN)
+        names = [os.path.basename(path) for path in args.output_files]
+        np.set_printoptions(precision=4, linewidth=200)
+
+        for name, accuracy in zip(names, result['accuracy']):
+            print("{}\t{:.2%}".format(name, accuracy))
+        print("oracle\t{:.2%}".format(result['oracle']))
+        print("\nagreement:\n{}".format(result['agreement']))
+        print("\ncomplementarity (errors of the row system predicted right by the column system):\n{}".format(result['complementarity']))
+        if args.per_feature:
+            columns = dataset_cache.load_table(args.input_file).columns
+            print("\nfeature", "predicted", *names, sep="\t")
+            for j in np.flatnonzero(result['feature_total']):
+                print(columns[j], result['feature_total'][j], *["{:.4f}".format(a) for a in result['feature_accuracy'][:, j]], sep="\t")
@@ -0,0 +1,188 @@
+"""
+Persistent, incrementally updatable (group, feature, value) counts of the
+majority baselines (majority_base.py, majority_vote.py, BackoffPredictor).
+
+The store keeps one count tensor per level (genus, family, zone, global) and
+the cached majority value, its count and the total of every (group, feature).
+Adding or removing languages, e.g. merging the visible values of the blinded
+dev or test languages like train_on_dev=blind of train_and_predict_dz.pl,
+touches only their groups, so re-predicting after a small change costs
+O(changed languages) instead of a rebuild.
+
+    store = CountStore.build(vocab, ['family'], train_codes, train_frame)
+    store.add(dev_codes, dev_frame)       # train_on_dev=blind
+    best, share = store.majority(dev_codes, dev_frame, rows, cols)
+"""
+import json
+import os
+
+import numpy as np
+
+from dataset_cache import MISSING
+from feature_vocab import FIRST_VALUE, FeatureVocab, CATEGORICAL_LANGUAGE_COLUMNS
+
+EMPTY = 0 # row of every level without counts, for the groups unseen so far
+MISSING_NAMES = {'', '?', 'nan'}
+
+
+class CountStore:
+    def __init__(self, vocab, levels=('family',), zone_size=10.0):
+        self.vocab = vocab
+        self.levels = tuple(level for level in levels if level != 'global') + ('global',)
+        self.zone_size = zone_size
+        # genus and family are never predicted, leaving them out keeps the value axis short
+        self.features = np.ones(len(vocab), dtype=bool)
+        self.features[[vocab.column_index[column] for column in CATEGORICAL_LANGUAGE_COLUMNS if column in vocab.column_index]] = False
+        self.values = int(vocab.sizes[self.features].max())
+        self.group_rows = [{} for _ in self.levels] # group key -> row of the tensors
+        self.counts = [np.zeros((1, len(vocab), self.values), dtype=np.int32) for _ in self.levels]
+        self.best = [np.zeros((1, len(vocab)), dtype=np.int64) for _ in self.levels]
+        self.best_count = [np.zeros((1, len(vocab)), dtype=np.int32) for _ in self.levels]
+        self.total = [np.zeros((1, len(vocab)), dtype=np.int32) for _ in self.levels]
+        self.languages = set() # wals_codes of the counted languages
+        self.train_digest = None # content hash of the train file the store was built from, if known
+
+    @classmethod
+    def build(cls, vocab, levels, codes, frame, zone_size=10.0):
+        store = cls(vocab, levels, zone_size)
+        store.add(codes, frame)
+        return store
+
+    def group_keys(self, level, codes, frame):
+        """
+        Key of the group of every language on the level: the genus or family name, the zone number, or None for
+        the languages without the genus, family or coordinates, which belong to no group. The names are used rather
+        than the vocabulary codes, so that the genera and families unseen in train get their own groups too.
+        """
+        if level == 'global':
+            return [0] * len(codes)
+        if level == 'zone':
+            latitude = frame['latitude'].to_numpy(dtype=np.float64)
+            longitude = frame['longitude'].to_numpy(dtype=np.float64)
+            zones = np.floor((latitude + 90) / self.zone_size) * np.ceil(360 / self.zone_size) + np.floor((longitude + 180) / self.zone_size)
+            return [None if np.isnan(zone) else int(zone) for zone in zones]
+        return [name if isinstance(name, str) and name not in MISSING_NAMES else None for name in frame[level].tolist()]
+
+    def groups(self, level, codes, frame, grow=False):
+        """
+        Rows of the tensors of the languages on the level (EMPTY for unseen groups, or new rows with grow,
+        and always for the languages without a group).
+        """
+        l = self.levels.index(level)
+        rows = self.group_rows[l]
+        keys = self.group_keys(level, codes, frame)
+        if grow:
+            new = [key for key in dict.fromkeys(keys) if key is not None and key not in rows]
+            if new:
+                for key in new:
+                    rows[key] = len(rows) + 1
+                self.grow(l, len(rows) + 1)
+        return np.array([rows.get(key, EMPTY) if key is not None else EMPTY for key in keys], dtype=np.int64)
+
+    def grow(self, l, size):
+        extra = size - len(self.counts[l])
+        for arrays in (self.counts, self.best, self.best_count, self.total):
+            arrays[l] = np.concatenate([arrays[l], np.zeros((extra,) + arrays[l].shape[1:], dtype=arrays[l].dtype)])
+
+    def update(self, codes, frame, sign):
+        codes = np.asarray(codes, dtype=np.int64)
+        values = np.where(self.features, codes, MISSING)
+        columns = np.arange(codes.shape[1])
+        for l, level in enumerate(self.levels):
+            groups = self.groups(level, codes, frame, grow=sign > 0)
+            # the languages without a group are not counted, the EMPTY row stays zero
+            grouped = groups != EMPTY
+            groups, level_values = groups[grouped], values[grouped]
+            counts = self.counts[l]
+            cells = (groups[:, np.newaxis], columns, level_values)
+            if level_values.size * 8 > counts.size:
+                # a bulk update (e.g. the build) is faster as one bincount over the whole tensor
+                flat = np.ravel_multi_index(cells, counts.shape).ravel()
+                counts += sign * np.bincount(flat, minlength=counts.size).astype(counts.dtype).reshape(counts.shape)
+            else:
+                np.add.at(counts, cells, sign)
+            counts[:, :, :FIRST_VALUE] = 0
+            # only the touched groups need new majorities
+            touched = np.unique(groups)
+            touched_counts = counts[touched]
+            best = touched_counts.argmax(axis=2)
+            self.best[l][touched] = best
+            self.best_count[l][touched] = np.take_along_axis(touched_counts, best[:, :, np.newaxis], axis=2)[:, :, 0]
+            self.total[l][touched] = touched_counts.sum(axis=2)
+
+    def selected(self, frame, present):
+        """
+        Rows of the frame whose languages are (present=True) or are not yet counted.
+        """
+        return np.array([(wals_code in self.languages) == present for wals_code in frame['wals_code']], dtype=bool)
+
+    def add(self, codes, frame):
+        """
+        Counts the known values of the languages (the rows of the code matrix and of the frame with their wals_code,
+        genus, family, latitude and longitude). The languages counted already are skipped.
+        """
+        new = self.selected(frame, False)
+        if new.any():
+            self.update(np.asarray(codes)[new], frame[new], 1)
+            self.languages.update(frame['wals_code'][new])
+
+    def remove(self, codes, frame):
+        """
+        Removes the counts of the languages, given by the same rows as they were added with.
+        """
+        present = self.selected(frame, True)
+        if present.any():
+            self.update(np.asarray(codes)[present], frame[present], -1)
+            self.languages.difference_update(frame['wals_code'][present])
+
+    def majority(self, codes, frame, rows, cols):
+        """
+        The cached majority value of the cells (rows, cols) of the languages from the most specific level whose group
+        has the feature, and its share of the values. MISSING and nan where even the global level has no value.
+        """
+        best = np.full(len(rows), MISSING, dtype=np.int64)
+        share = np.full(len(rows), np.nan)
+        undecided = np.ones(len(rows), dtype=bool)
+        for l, level in enumerate(self.levels):
+            groups = self.groups(level, codes, frame)[rows]
+            total = self.total[l][groups, cols]
+            use = undecided & (total > 0)
+            best[use] = self.best[l][groups[use], cols[use]]
+            share[use] = self.best_count[l][groups[use], cols[use]] / total[use]
+            undecided &= ~use
+        return best, share
+
+    def save(self, path):
+        """
+        Saves the store to path (.npz) with the vocabulary and the group keys in path.json.
+        """
+        meta = {
+            'levels': self.levels,
+            'zone_size': self.zone_size,
+            'columns': self.vocab.columns,
+            'values': self.vocab.values,
+            'group_keys': [list(rows) for rows in self.group_rows],
+            'languages': sorted(self.languages),
+            'train_digest': self.train_digest,
+        }
+        tmp = '{}.{}.tmp.npz'.format(path, os.getpid())
+        np.savez(tmp, **{'counts_{}'.format(l): counts for l, counts in enumerate(self.counts)})
+        os.replace(tmp, path)
+        with open(path + '.json', 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        store = cls(FeatureVocab(meta['columns'], meta['values']), meta['levels'], meta['zone_size'])
+        arrays = np.load(path)
+        for l, keys in enumerate(meta['group_keys']):
+            store.group_rows[l] = {key: row for row, key in enumerate(keys, EMPTY + 1)}
+            counts = store.counts[l] = arrays['counts_{}'.format(l)]
+            store.best[l] = counts.argmax(axis=2)
+            store.best_count[l] = np.take_along_axis(counts, store.best[l][:, :, np.newaxis], axis=2)[:, :, 0]
+            store.total[l] = counts.sum(axis=2)
+        store.languages = set(meta['languages'])
+        store.train_digest = meta.get('train_digest')
+        return store
@@ -1,10 +1,12 @@
-import re
 import argparse
+import gzip
 import os 
 
 import pandas as pd
 import numpy as np
 
+import masking
+
 WALS_CODE = 0
 NAME = 1
 LATITUDE = 2
@@ -20,14 +22,68 @@ NUMBER_OF_ALWAYS_FILLED = 7
 def parse_header(header):
     return header.split()[:-1]
 
-def get_all_possible_features(lines):
-    all_features = set()
-    for line in lines:
-        features_start = [m.start() for m in re.finditer('\t', line)] # get the position of tab character
-        features = line[features_start[COUNTRY_CODES]+1:].split('|') # split the features after countries column
-        for feature in features:
-            all_features.add(feature.split('=')[0]) # choose only text up until the first =
-    return all_features
+def open_sigtyp(file_path):
+    """
+    Opens plain or gzipped SIGTYP file for reading text.
+    """
+    with open(file_path, 'rb') as file:
+        magic = file.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(file_path, 'rt')
+    return open(file_path, 'r')
+
+def split_line(line):
+    """
+    Splits the line to the always filled columns and the feature string.
+    Feature values may contain tab, so we split only on the first tabs.
+    """
+    columns = line.split('\t', NUMBER_OF_ALWAYS_FILLED)
+    return columns[:NUMBER_OF_ALWAYS_FILLED], columns[FEATURES]
+
+def iter_sigtyp_rows(file, features_to_int=None, values_to_int=None, grow=True):
+    """
+    Reads the SIGTYP format line by line in a single pass, yields (main_features, feature_ids, value_ids)
+    where feature_ids and value_ids are int32 arrays. Value codes are per feature, 0 is reserved for
+    missing values and 1 for '?'.
+    features_to_int and values_to_int (list of dicts value -> code, one per feature) are filled on the fly,
+    pass them in to share the vocabulary between files. With grow=False unseen features raise KeyError.
+    Yields the header (list of column names) first.
+    """
+    if features_to_int is None:
+        features_to_int = {}
+    if values_to_int is None:
+        values_to_int = []
+    close = isinstance(file, str)
+    if close:
+        file = open_sigtyp(file)
+    try:
+        yield parse_header(next(file))
+        for line in file:
+            line = line.rstrip()
+            if not line:
+                continue
+            main_features, features = split_line(line)
+            features = features.split('|')
+            feature_ids = np.empty(len(features), dtype=np.int32)
+            value_ids = np.empty(len(features), dtype=np.int32)
+            for i, feature in enumerate(features):
+                key, _, value = feature.partition('=')
+                feature_id = features_to_int.get(key)
+                if feature_id is None:
+                    if not grow:
+                        raise KeyError(key)
+                    feature_id = features_to_int[key] = len(features_to_int)
+                    values_to_int.append({'?': 1})
+                value_map = values_to_int[feature_id]
+                value_id = value_map.get(value)
+                if value_id is None:
+                    value_id = value_map[value] = len(value_map) + 1
+                feature_ids[i] = feature_id
+                value_ids[i] = value_id
+            yield main_features, feature_ids, value_ids
+    finally:
+        if close:
+            file.close()
 
 def feature_int_map(all_features):
     """
@@ -42,48 +98,32 @@ def feature_int_map(all_features):
         int_to_feature.append(feature)
     return int_to_feature, feature_to_int
 
-def convert_line(line, features_to_int):
+def decode_row(main_features, feature_ids, value_ids, int_to_values, number_of_features):
     """
-    Takes non header line and creates new vector of all ordered columns by features_to_int
+    Takes coded row and creates new vector of all ordered columns, missing features are np.nan
     """
-    features_start = [m.start() for m in re.finditer('\t', line)] # finds positions of all tabs
-    main_features = line[:features_start[COUNTRY_CODES]].split('\t') # splits the line all up to tab after country codes
-    result = [np.nan] * (len(features_to_int) + len(main_features)) # fill the array with nan values
-    
-    for i in range(len(main_features)): # fill the first values
-        result[i] = main_features[i]
-    
-
-    features = line[features_start[COUNTRY_CODES]+1:].split('|') # split the features by |
-    for feature in features:
-        equal_symbol = feature.find('=') # finds the position of = in features
-        key, value = feature[:equal_symbol], feature[equal_symbol+1:] # splits the feature into key, value
-        index = len(main_features) + features_to_int[key] # moves the index so it doesn't overlap with previously filled values such as wals code, etc...
-        result[index] = value
+    result = list(main_features) + [np.nan] * number_of_features
+    for feature_id, value_id in zip(feature_ids, value_ids):
+        result[len(main_features) + feature_id] = int_to_values[feature_id][value_id]
     return result
-        
 
 def parse_sigtyp_format(file_path, given_header=None):
     """
     Converts the SIGTYP format to matrix and header
     """
-    with open(file_path, 'r') as file:
-        lines = file.readlines() 
-    lines = [i.rstrip() for i in lines]
-    header = parse_header(lines[0])
-    
-    result = []
-    if given_header is None: 
-        all_features = get_all_possible_features(lines[1:])
+    if given_header is None:
+        features_to_int = {}
     else:
-        all_features = given_header[7:] # if the header is already given, take only the features
-    
-        
-    int_to_feature, features_to_int = feature_int_map(all_features)
+        # if the header is already given, take only the features
+        _, features_to_int = feature_int_map(given_header[NUMBER_OF_ALWAYS_FILLED:])
+    values_to_int = [{'?': 1} for _ in features_to_int]
+    rows = iter_sigtyp_rows(file_path, features_to_int, values_to_int, grow=given_header is None)
+    header = next(rows)
+    coded = list(rows) # the coded rows are small, we decode them once we know all the features
 
-    # iterate over all non header lines
-    for line in lines[1:]: 
-        result.append(convert_line(line, features_to_int))
+    int_to_feature = sorted(features_to_int, key=features_to_int.get)
+    int_to_values = [[np.nan, '?'] + list(value_map)[1:] for value_map in values_to_int]
+    result = [decode_row(*row, int_to_values, len(int_to_feature)) for row in coded]
 
     # creates header
     for feature in int_to_feature:
@@ -91,15 +131,14 @@ def parse_sigtyp_format(file_path, given_header=None):
 
     return result, header
 
-def fill_randomly_missing_values(data):
+def fill_randomly_missing_values(data, rng, scheme='bernoulli', **kwargs):
     """
-    Randomly fills the mask to data.
+    Randomly fills the mask to data, see masking.make_masks for the schemes.
     """
-    random_missing = np.vectorize(lambda x: x if np.random.uniform() < 0.5 else "?" ) # random masking
-    mask = (data != 'nan') # find where the data are nan
-    mask[:,:7] = False # we don't want to mask first 7 columns
-    data[mask] = random_missing(data[mask]) # fill the values
-    return data
+    known = (data != 'nan') # find where the data are nan
+    known[:,:NUMBER_OF_ALWAYS_FILLED] = False # we don't want to mask first 7 columns
+    mask = masking.make_masks(known, 1, scheme, rng, **kwargs)
+    return masking.apply_masks(data, mask, '?')[0]
 
 if __name__ == "__main__":
 
@@ -109,10 +148,19 @@ if __name__ == "__main__":
     parser.add_argument("--dev", type=str, default="../data/dev.csv", help="Path to dev file.")
     parser.add_argument("--output_dir", type=str, default="../data/", help="Path to output folder.")
     parser.add_argument("--seed", default=42, type=int, help="Random seed.")
+    parser.add_argument("--scheme", default="bernoulli", choices=["bernoulli", "exact_k", "matching"], help="Masking scheme.")
+    parser.add_argument("--rate", default=0.5, type=float, help="Probability of masking a value (bernoulli scheme).")
+    parser.add_argument("--k", default=3, type=int, help="Number of masked values per language (exact_k scheme).")
+    parser.add_argument("--blinded", type=str, default="../data/test_blinded.csv", help="Blinded file with the distribution of masked values (matching scheme).")
     args = parser.parse_args()
 
     # Fix random seeds and threads
-    np.random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    scheme_args = {
+        "bernoulli": {"rate": args.rate},
+        "exact_k": {"k": args.k},
+        "matching": {"hidden_counts": masking.blinded_hidden_counts(args.blinded)},
+    }[args.scheme]
 
     train, header = parse_sigtyp_format(args.train)
     dev, _ = parse_sigtyp_format(args.dev, header) # we pass the header since we want to have same ordered header as in train values
@@ -122,8 +170,8 @@ if __name__ == "__main__":
     dev_y = pd.DataFrame(data=dev, columns=header)
 
     # randomly mask the expected values
-    train_X = fill_randomly_missing_values(np.array(train))
-    dev_X = fill_randomly_missing_values(np.array(dev))
+    train_X = fill_randomly_missing_values(np.array(train), rng, args.scheme, **scheme_args)
+    dev_X = fill_randomly_missing_values(np.array(dev), rng, args.scheme, **scheme_args)
 
     # creates the input data
     train_X = pd.DataFrame(data=train_X, columns=header)
@@ -1,147 +1,128 @@
 # Python 3.7.6
 
-import csv
+import argparse
+import os
+
 import geopy.distance
-from collections import OrderedDict
-
-all_rows = [] 
-with open("language.csv") as f:
-         d2 = csv.DictReader(f) 
-         for r in d2: 
-             all_rows.append(r) 
-
-# select those languages having more than 3 features
-all4 = []
-for l in all_rows:
-    new_row = {}
-    f = list(l.items())[10:]
-    c = 0
-    ff = []
-    for t  in f:
-        if t[1] != "":
-            c += 1
-            ff.append(t)
-    if c > 3:
-          m = list(l.items())[0:10]
-          for b in m:
-              new_row[b[0]] = b[1]
-          for h in ff:
-              new_row[h[0]] = h[1]
-          all4.append(new_row)
-
-# find geo-coordinates for some languages
-otherlang_coo = []
-for m in all4:
-    if m["genus"] == "Mayan" or m["genus"] == "Tucanoan" or m["genus"] == "Madang" or m["genus"] == "Mahakiranti" or m["genus"] == "Northern Pama-Nyungan" or m["genus"] == "Nilotic":
-      cc = (m["latitude"], m["longitude"])
-      otherlang_coo.append(cc)
-
-# find languages which do not belong to certain genera and are distant more than 1000 km
-pre_fin = [] 
-for m in all4: 
-      coord1 = (m["latitude"], m["longitude"])
-      distances = []
-      for coord2 in otherlang_coo: 
-         dist = geopy.distance.geodesic(coord1, coord2)
-         distances.append(dist)
-      if m["genus"] != "Mayan" and m["genus"] != "Tucanoan" and m["genus"] != "Madang" and m["genus"] != "Mahakiranti" and m["genus"] != "Northern Pama-Nyungan" and m["genus"] != "Nilotic" and  all(i > 1000 for i in distances): 
-         w = m['wals_code'] 
-         fa = m['family']  
-         f = list(m.items())[10:] 
-         pre_fin.append([w, fa, f]) 
-
-#  find the set of all features of the above languages
-all_feat = set()
-for a,b,c in pre_fin: 
-    for k in c: 
-         all_feat.add(k[0]) 
-
-# extract from all_feat above the features that are in more than 9 languages
-fts = {}
-for f in all_feat:
-   count = 0
-   for a,b,c in pre_fin:
-      for d,e in c:
-          if f == d:
-              count += 1
-   if count > 9:
-     fts[f] = count
-
-a = list(fts.keys())
-fin = []
-for m in all4:
-    coord1 = (m["latitude"], m["longitude"])
-    distances = []
-    for coord2 in otherlang_coo:
-       dist = geopy.distance.geodesic(coord1, coord2)
-       distances.append(dist)
-    if m["genus"] != "Mayan" and m["genus"] != "Tucanoan" and m["genus"] != "Madang" and m["genus"] != "Mahakiranti" and m["genus"] != "Northern Pama-Nyungan" and m["genus"] != "Nilotic" and  all(i > 1000 for i in distances): 
-       w = m['wals_code']
-       name = m["Name"]
-       lat = m["latitude"]
-       lon = m["longitude"]
-       gen = m["genus"]
-       fa = m['family'] 
-       ccod = m["countrycodes"]
-       f = list(m.items())[10:]
-       nn = []
-       for n in f:
-           if n[0] in a:
-             j = n[0].split(" ", 1)
-             s = j[1].replace(" ", "_") + "=" + n[1]
-             nn.append(s)
-       if len(nn) > 3:  # to be sure the features are at least 4
-         vv = "|".join(nn)
-         fin.append(w + "\t" + name + "\t" + lat + "\t" + lon + "\t" + gen + "\t" + fa + "\t" + ccod + "\t" + vv)
-
-new_fin = fin[0: round(len(fin) * 0.9)]
-sel10 = fin[round(len(fin) * 0.9):]
-dev_add = sel10[:round(len(sel10) * 0.5)]
-test_add = sel10[round(len(sel10) * 0.5):]
-
-# save train data
-with open("train.csv", "wt") as f:
-    print("wals_code  name  latitude  longitude genus family  countrycodes  features", file=f)
-    for g in new_fin:
-        print(g, file=f)
-
-
-# crete dev and test
-all_ex = []
-for l in all_rows:
-    if l["genus"] == "Mayan" or l["genus"] == "Tucanoan" or l["genus"] == "Madang" or l["genus"] == "Mahakiranti" or l["genus"] == "Northern Pama-Nyungan" or l["genus"] == "Nilotic":
-        new_row = OrderedDict()
-        f = list(l.items())[10:]
-        c = 0
-        ff = []
-        for t  in f:
-            if t[1] != "":
-                c += 1
-                ff.append(t)
-        if c > 3:
-              w = l['wals_code']
-              name = l["Name"]
-              lat = l["latitude"]
-              lon = l["longitude"]
-              gen = l["genus"]
-              fa = l['family']
-              nn = []
-              for n in ff:
-                  if n[0] in a:
-                    j = n[0].split(" ", 1)
-                    s = j[1].replace(" ", "_") + "=" + n[1]
-                    nn.append(s)
-              if len(nn) > 3:  # to be sure the features are at least 4
-                vv = "|".join(nn)
-                all_ex.append(w + "\t" + name + "\t" + lat + "\t" + lon + "\t" + gen + "\t" + fa + "\t" + ccod + "\t" + vv)
-
-# select 20%
-p20 = round(len(all_ex) * 0.2) 
-
-dev = all_ex[0: p20] + dev_add
-
-# save dev data
-with open("dev.csv", "wt") as f:
-    print("wals_code  name  latitude  longitude genus family  countrycodes  features", file=f)
-    for g in dev:
-        print(g, file=f)
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+CONTROLLED_GENERA = ["Mayan", "Tucanoan", "Madang", "Mahakiranti", "Northern Pama-Nyungan", "Nilotic"]
+NUMBER_OF_LANGUAGE_COLUMNS = 10 # wals_code, iso_code, glottocode, Name, latitude, longitude, genus, family, macroarea, countrycodes
+EARTH_RADIUS = 6371.0088 # mean Earth radius in km
+HAVERSINE_ERROR = 0.006 # relative error of the spherical distance against the geodesic one is below 0.5%
+HEADER = "wals_code  name  latitude  longitude genus family  countrycodes  features"
+
+
+def read_languages(file_path):
+    """
+    Reads the WALS language.csv, returns the language columns and the boolean matrix of filled features
+    """
+    languages = pd.read_csv(file_path, dtype=str, keep_default_na=False)
+    features = languages.iloc[:, NUMBER_OF_LANGUAGE_COLUMNS:]
+    return languages, features, features.to_numpy() != ""
+
+
+def far_from(languages, selected, radius):
+    """
+    For every language returns True if it is more than radius km from all the selected languages.
+    Uses haversine distance on a BallTree built once over the selected languages, only the pairs close
+    to the radius are checked with the exact geodesic distance.
+    """
+    degrees = languages[["latitude", "longitude"]].to_numpy(dtype=float)
+    result = np.ones(len(languages), dtype=bool)
+    if not selected.any():
+        return result
+    tree = BallTree(np.radians(degrees[selected]), metric="haversine")
+    neighbours, distances = tree.query_radius(np.radians(degrees), r=radius * (1 + HAVERSINE_ERROR) / EARTH_RADIUS, return_distance=True)
+    selected_degrees = degrees[selected]
+    for i, (close, distance) in enumerate(zip(neighbours, distances)):
+        if len(close) == 0:
+            continue
+        if np.any(distance * EARTH_RADIUS <= radius * (1 - HAVERSINE_ERROR)):
+            result[i] = False
+            continue
+        result[i] = all(geopy.distance.geodesic(degrees[i], selected_degrees[j]).km > radius for j in close)
+    return result
+
+
+def sigtyp_line(language, feature_names, values):
+    """
+    Creates one line of the SIGTYP format from the language row and its selected features
+    """
+    features = []
+    for name, value in zip(feature_names, values):
+        name = name.split(" ", 1)[1].replace(" ", "_") # strip the WALS code, e.g. 1A
+        features.append(name + "=" + value)
+    return "\t".join([language["wals_code"], language["Name"], language["latitude"], language["longitude"],
+                      language["genus"], language["family"], language["countrycodes"], "|".join(features)])
+
+
+def sigtyp_lines(languages, features, filled, rows, columns, min_features):
+    """
+    SIGTYP lines of the languages in rows restricted to the feature columns,
+    only for the languages with at least min_features of these features
+    """
+    lines = []
+    feature_names = features.columns
+    for row in np.flatnonzero(rows & (filled[:, columns].sum(axis=1) >= min_features)):
+        kept = columns & filled[row]
+        lines.append(sigtyp_line(languages.iloc[row], feature_names[kept], features.iloc[row].to_numpy()[kept]))
+    return lines
+
+
+def create_train_dev(languages, features, filled, genera=CONTROLLED_GENERA, radius=1000, min_features=4, min_feature_languages=10):
+    """
+    Returns train, dev and test SIGTYP lines. Dev and test contain languages of the controlled genera, train languages
+    of the other genera that are more than radius km away from all of them.
+    """
+    # select those languages having enough features
+    enough = filled.sum(axis=1) >= min_features
+    controlled = languages["genus"].isin(genera).to_numpy()
+
+    # find languages which do not belong to the controlled genera and are distant more than radius km
+    candidates = enough & ~controlled & far_from(languages, enough & controlled, radius)
+
+    # the features that are in enough candidate languages
+    columns = filled[candidates].sum(axis=0) >= min_feature_languages
+
+    fin = sigtyp_lines(languages, features, filled, candidates, columns, min_features)
+    new_fin = fin[0: round(len(fin) * 0.9)]
+    sel10 = fin[round(len(fin) * 0.9):]
+    dev_add = sel10[:round(len(sel10) * 0.5)]
+    test_add = sel10[round(len(sel10) * 0.5):]
+
+    # create dev and test from the controlled genera, select 20% for dev
+    all_ex = sigtyp_lines(languages, features, filled, enough & controlled, columns, min_features)
+    p20 = round(len(all_ex) * 0.2)
+    dev = all_ex[0: p20] + dev_add
+    test = all_ex[p20:] + test_add
+    return new_fin, dev, test
+
+
+def write_sigtyp(lines, file_path):
+    with open(file_path, "wt") as f:
+        print(HEADER, file=f)
+        for line in lines:
+            print(line, file=f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--languages", type=str, default="language.csv", help="Path to the WALS language.csv.")
+    parser.add_argument("--output_dir", type=str, default=".", help="Path to output folder.")
+    parser.add_argument("--genera", type=str, nargs="+", default=CONTROLLED_GENERA, help="Controlled genera held out for dev and test.")
+    parser.add_argument("--radius", type=float, default=1000, help="Train languages must be further than this (in km) from all controlled languages.")
+    parser.add_argument("--min_features", type=int, default=4, help="Minimal number of features of a language.")
+    parser.add_argument("--min_feature_languages", type=int, default=10, help="Minimal number of train languages having a feature.")
+    parser.add_argument("--write_test", action="store_true", help="Also write test.csv with the remaining controlled languages.")
+    args = parser.parse_args()
+
+    languages, features, filled = read_languages(args.languages)
+    train, dev, test = create_train_dev(languages, features, filled, args.genera, args.radius, args.min_features, args.min_feature_languages)
+
+    write_sigtyp(train, os.path.join(args.output_dir, "train.csv"))
+    write_sigtyp(dev, os.path.join(args.output_dir, "dev.csv"))
+    if args.write_test:
+        write_sigtyp(test, os.path.join(args.output_dir, "test.csv"))
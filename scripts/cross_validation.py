@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Genus- or family-disjoint k-fold cross-validation on train.csv.
+
+The languages are split into k folds so that every genus (or family) is in
+one fold only, like the controlled genera held out for dev and test. The
+feature values of the languages of each fold are masked with one of the
+masking.SCHEMES, the predictor is trained on the other folds with all their
+values and predicts the masked cells. The folds run in a process pool.
+
+The coded dataset, the fold split and the masks are cached in .cache next to
+the data (keyed by its content hash and the split parameters), so repeated
+experiments with different predictors reuse exactly the same folds.
+
+A predictor is a function predict(train, test, vocab) given as module:function,
+train and test are feature_vocab code matrices (genus, family and the features),
+test has UNKNOWN in the cells to predict; it returns the predicted code matrix of test.
+A name of predictors.PREDICTORS runs that Predictor on the DataFrames of the fold
+(with the wals_code, coordinates etc. of the languages), fit on the train
+languages and predicting the test languages with '?' in the masked cells.
+
+python3 cross_validation.py --predictor cross_validation:majority --folds 10 --by genus --jobs 8
+python3 cross_validation.py --predictor geo_knn --folds 10 --by family
+"""
+import argparse
+import functools
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+import create_normalized_format
+import dataset_cache
+import evaluate
+import masking
+import predictors
+from dataset_cache import UNKNOWN
+from feature_vocab import FIRST_VALUE, FeatureVocab, CATEGORICAL_LANGUAGE_COLUMNS
+
+DATA_PATH = '../data/train.csv'
+
+
+def save_array(path, array):
+    # write to a temporary file first, so that parallel runs never see a half written cache
+    tmp = '{}.{}.tmp.npy'.format(path[:-len('.npy')], os.getpid())
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def cache_prefix(data_path, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(data_path)), dataset_cache.CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    digest = dataset_cache.file_digest(data_path)
+    return os.path.join(cache_dir, 'cv.{}.{}'.format(os.path.basename(data_path), digest[:16]))
+
+
+def load_dataset(data_path=DATA_PATH, cache_dir=None):
+    """
+    Returns the FeatureVocab and the (languages, columns) code matrix of the SIGTYP file, cached.
+    """
+    prefix = cache_prefix(data_path, cache_dir)
+    vocab_path, codes_path = prefix + '.vocab.json', prefix + '.codes.npy'
+    if not (os.path.exists(vocab_path) and os.path.exists(codes_path)):
+        rows, header = create_normalized_format.parse_sigtyp_format(data_path)
+        frame = pd.DataFrame(rows, columns=header)
+        vocab = FeatureVocab.from_frames([frame])
+        save_array(codes_path, vocab.encode_frame(frame))
+        vocab.save(vocab_path)
+    return FeatureVocab.load(vocab_path), np.load(codes_path, mmap_mode='r')
+
+
+def group_folds(groups, folds, rng):
+    """
+    Assigns every group (genus or family codes of the languages) to one of the folds, the largest groups
+    first to the fold with the fewest languages so far (ties in a random order). Returns the fold of every language.
+    """
+    names, group_ids, sizes = np.unique(groups, return_inverse=True, return_counts=True)
+    if len(names) < folds:
+        raise ValueError('Cannot split {} groups into {} folds'.format(len(names), folds))
+    # random order first, then a stable sort by size, so that the groups of the same size are shuffled
+    order = rng.permutation(len(names))
+    order = order[np.argsort(-sizes[order], kind='stable')]
+    group_fold = np.empty(len(names), dtype=np.int64)
+    fold_sizes = np.zeros(folds, dtype=np.int64)
+    for group in order:
+        fold = np.argmin(fold_sizes)
+        group_fold[group] = fold
+        fold_sizes[fold] += sizes[group]
+    return group_fold[group_ids]
+
+
+def load_split(data_path=DATA_PATH, folds=5, by='genus', scheme='bernoulli', seed=42, cache_dir=None, **scheme_args):
+    """
+    Returns the fold of every language and the (languages, columns) mask of the cells to predict,
+    every language is masked only in its own fold. Both are cached for the same parameters.
+    """
+    vocab, codes = load_dataset(data_path, cache_dir)
+    parameters = json.dumps([folds, by, scheme, seed, sorted(scheme_args.items())], default=str)
+    prefix = '{}.split.{}'.format(cache_prefix(data_path, cache_dir), hashlib.sha1(parameters.encode()).hexdigest()[:16])
+    folds_path, masks_path = prefix + '.folds.npy', prefix + '.masks.npy'
+    if not (os.path.exists(folds_path) and os.path.exists(masks_path)):
+        rng = np.random.default_rng(seed)
+        language_folds = group_folds(codes[:, vocab.column_index[by]], folds, rng)
+        known = codes >= FIRST_VALUE
+        known[:, [vocab.column_index[column] for column in CATEGORICAL_LANGUAGE_COLUMNS]] = False
+        save_array(masks_path, masking.make_masks(known, 1, scheme, rng, **scheme_args)[0])
+        save_array(folds_path, language_folds)
+    return np.load(folds_path, mmap_mode='r'), np.load(masks_path, mmap_mode='r')
+
+
+@functools.lru_cache(maxsize=None)
+def load_frame(data_path=DATA_PATH):
+    """
+    The SIGTYP file as a DataFrame in the normalized format, its rows are the rows of the code matrix.
+    """
+    rows, header = create_normalized_format.parse_sigtyp_format(data_path)
+    frame = pd.DataFrame(rows, columns=header).astype(object)
+    frame[['latitude', 'longitude']] = frame[['latitude', 'longitude']].apply(pd.to_numeric, errors='coerce')
+    return frame
+
+
+def predict_frames(name, train, test, vocab, train_frame, test_frame):
+    """
+    Fits the predictor of predictors.PREDICTORS on the train languages and predicts the test languages with '?'
+    in the UNKNOWN cells of test, returns the predicted code matrix of test.
+    """
+    masked = test_frame.copy()
+    for j, column in enumerate(vocab.columns):
+        masked.loc[test[:, j] == UNKNOWN, column] = '?'
+    values, _ = predictors.create(name, vocab=vocab).fit(train_frame).predict(masked)
+    return np.where(test == UNKNOWN, vocab.encode_frame(values), test)
+
+
+def load_predictor(name):
+    """
+    The predictor function given as module:function.
+    """
+    module, _, function = name.partition(':')
+    return getattr(importlib.import_module(module), function)
+
+
+def majority(train, test, vocab):
+    """
+    Baseline predictor, the most frequent train value of every column.
+    """
+    counts = np.zeros((len(vocab), vocab.sizes.max()), dtype=np.int64)
+    np.add.at(counts, (np.broadcast_to(np.arange(len(vocab)), train.shape), train), 1)
+    counts[:, :FIRST_VALUE] = 0
+    best = counts.argmax(axis=1).astype(test.dtype)
+    return np.where(test == UNKNOWN, best, test)
+
+
+def run_fold(fold, data_path, predictor, split_args):
+    """
+    Trains and evaluates the predictor on one fold, returns its record.
+    """
+    vocab, codes = load_dataset(data_path, split_args.get('cache_dir'))
+    language_folds, masks = load_split(data_path, **split_args)
+    held_out = np.asarray(language_folds) == fold
+    train = np.asarray(codes[~held_out])
+    gold = np.asarray(codes[held_out])
+    test = masking.apply_masks(gold, np.asarray(masks[held_out])[np.newaxis])[0]
+    if predictor in predictors.PREDICTORS:
+        frame = load_frame(data_path)
+        predicted = predict_frames(predictor, train, test, vocab, frame[~held_out].reset_index(drop=True), frame[held_out].reset_index(drop=True))
+    else:
+        predicted = load_predictor(predictor)(train, test, vocab)
+    return {
+        'fold': fold,
+        'languages': int(held_out.sum()),
+        'cells': int(np.sum(test == UNKNOWN)),
+        'accuracy': float(evaluate.evaluate(test, predicted, gold, UNKNOWN)),
+    }
+
+
+def cross_validate(predictor, data_path=DATA_PATH, folds=5, by='genus', scheme='bernoulli', seed=42, jobs=None, cache_dir=None, **scheme_args):
+    """
+    Runs the predictor (module:function or a name of predictors.PREDICTORS) on all the folds in a process pool, returns the records of the folds.
+    """
+    split_args = dict(folds=folds, by=by, scheme=scheme, seed=seed, cache_dir=cache_dir, **scheme_args)
+    # build the caches once before the workers read them
+    load_split(data_path, **split_args)
+    run = functools.partial(run_fold, data_path=data_path, predictor=predictor, split_args=split_args)
+    if jobs == 1:
+        return [run(fold) for fold in range(folds)]
+    with multiprocessing.Pool(min(jobs or os.cpu_count(), folds)) as pool:
+        return pool.map(run, range(folds))
+
+
+def summary(records):
+    """
+    Micro average accuracy over all the cells and the mean and standard deviation of the fold accuracies.
+    """
+    cells = np.array([record['cells'] for record in records])
+    accuracies = np.array([record['accuracy'] for record in records])
+    return {
+        'accuracy': float(np.sum(accuracies * cells) / np.sum(cells)),
+        'mean': float(accuracies.mean()),
+        'std': float(accuracies.std()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type=str, default=DATA_PATH, help="SIGTYP file with the languages to split.")
+    parser.add_argument("--predictor", type=str, default="cross_validation:majority", help="Predictor function as module:function, or a name of predictors.PREDICTORS.")
+    parser.add_argument("--folds", type=int, default=5, help="Number of folds.")
+    parser.add_argument("--by", type=str, default="genus", choices=["genus", "family"], help="Keep the languages of every genus or family in one fold.")
+    parser.add_argument("--seed", default=42, type=int, help="Random seed of the split and the masks.")
+    parser.add_argument("--scheme", default="bernoulli", choices=["bernoulli", "exact_k", "matching", "area"], help="Masking scheme.")
+    parser.add_argument("--rate", default=0.5, type=float, help="Probability of masking a value (bernoulli) or a feature area of a language (area scheme).")
+    parser.add_argument("--k", default=3, type=int, help="Number of masked values per language (exact_k scheme).")
+    parser.add_argument("--blinded", type=str, default="../data/test_blinded.csv", help="Blinded file with the distribution of masked values (matching scheme).")
+    parser.add_argument("--areas", type=str, help="CSV with feature,area columns (area scheme).")
+    parser.add_argument("--wals", type=str, help="WALS CLDF folder to read the feature areas from (area scheme).")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of processes (default: all cores).")
+    parser.add_argument("--json", type=str, help="Write the records of the folds to this file.")
+    args = parser.parse_args()
+
+    if args.scheme == "area":
+        if not (args.areas or args.wals):
+            parser.error("--scheme area needs --areas or --wals")
+        import merge_systems
+        # the features without a known area are masked on their own
+        feature_areas = merge_systems.read_areas(args)
+        vocab, _ = load_dataset(args.data)
+        scheme_args = {"areas": tuple(feature_areas.get(column, column) for column in vocab.columns), "rate": args.rate}
+    else:
+        scheme_args = {
+            "bernoulli": {"rate": args.rate},
+            "exact_k": {"k": args.k},
+            "matching": {"hidden_counts": tuple(masking.blinded_hidden_counts(args.blinded))},
+        }[args.scheme]
+
+    records = cross_validate(args.predictor, args.data, args.folds, args.by, args.scheme, args.seed, args.jobs, **scheme_args)
+    for record in records:
+        print("Fold {fold}: {languages} languages, {cells} cells, accuracy {accuracy:.2%}".format(**record))
+    result = summary(records)
+    print("Accuracy is {accuracy:.2%} (folds {mean:.2%} +- {std:.2%})".format(**result))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"folds": records, **result}, f, indent=1)
@@ -0,0 +1,243 @@
+"""
+Integer-coded, memory-mappable cache of the normalized CSV tables.
+
+Each table (train_x.csv, dev_y.csv, predictions, score files, ...) is parsed
+with pandas only once. The string cells are stored as an integer matrix that
+indexes into a vocabulary sidecar, the numeric columns (index, latitude,
+longitude, scores) as a float matrix. Cache files are keyed by a content hash
+of the source file, so editing or regenerating the CSV invalidates them.
+
+    table = dataset_cache.load_table('../data/dev_x.csv')
+    table.codes          # int matrix, MISSING for empty cells, UNKNOWN for '?'
+    table.to_frame()     # the same DataFrame pd.read_csv would return
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+
+MISSING = 0  # empty cell (NaN after pd.read_csv)
+UNKNOWN = 1  # '?', a value that should be predicted
+
+CACHE_DIR = '.cache'
+FORMAT_VERSION = 1
+
+# (path, mtime, size) -> CodedTable, so that one process hashes every file once
+_loaded = {}
+
+
+def file_digest(path):
+    """
+    Returns the sha1 hex digest of the file content.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_dtype(vocab_size):
+    """
+    Smallest signed integer type able to hold codes of the vocabulary.
+    """
+    return np.int16 if vocab_size < np.iinfo(np.int16).max else np.int32
+
+
+class CodedTable:
+    def __init__(self, path, columns, vocab, codes, numeric_columns, numeric_dtypes, numeric):
+        self.path = path
+        self.columns = columns
+        self.vocab = vocab # vocab[code] is the string, vocab[MISSING] is nan and vocab[UNKNOWN] is '?'
+        self.codes = codes # (rows, columns) int matrix, numeric columns are MISSING
+        self.numeric_columns = numeric_columns
+        self.numeric_dtypes = numeric_dtypes
+        self.numeric = numeric # (rows, numeric columns) float64 matrix
+
+        self.column_index = {column: i for i, column in enumerate(columns)}
+        self.vocab_index = {value: code for code, value in enumerate(vocab) if code != MISSING}
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def code(self, value):
+        """
+        Code of the string value, -1 if the table does not contain it.
+        """
+        return self.vocab_index.get(value, -1)
+
+    def decode(self, codes):
+        """
+        Converts an int array of codes back to an object array of strings (nan for MISSING).
+        """
+        return np.asarray(self.vocab, dtype=object)[codes]
+
+    def float_matrix(self):
+        """
+        Full width float matrix, filled in the numeric columns (e.g. in the -scores.csv files) and nan elsewhere.
+        """
+        result = np.full(self.codes.shape, np.nan)
+        for i, column in enumerate(self.numeric_columns):
+            result[:, self.column_index[column]] = self.numeric[:, i]
+        return result
+
+    def score_matrix(self):
+        """
+        Like float_matrix(), but also the string cells holding numbers are converted,
+        e.g. the probabilities in lang_embedding_probs.csv where the other cells keep their values.
+        """
+        vocab = pd.to_numeric(pd.Series(self.vocab, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+        result = vocab[self.codes]
+        for i, column in enumerate(self.numeric_columns):
+            result[:, self.column_index[column]] = self.numeric[:, i]
+        return result
+
+    def to_frame(self):
+        """
+        Returns the same DataFrame as pd.read_csv(self.path).
+        """
+        frame = pd.DataFrame(self.decode(self.codes), columns=self.columns)
+        for i, (column, dtype) in enumerate(zip(self.numeric_columns, self.numeric_dtypes)):
+            frame[column] = pd.Series(self.numeric[:, i]).astype(dtype)
+        return frame
+
+    def to_numpy(self):
+        return self.to_frame().to_numpy()
+
+
+def encode_frame(frame):
+    """
+    Splits the DataFrame into the vocabulary, the code matrix and the numeric columns.
+    """
+    vocab = [np.nan, '?']
+    vocab_index = {'?': UNKNOWN}
+    numeric_columns, numeric_dtypes, numeric = [], [], []
+    codes = np.zeros(frame.shape, dtype=np.int32)
+    for j, column in enumerate(frame.columns):
+        series = frame[column]
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            numeric_columns.append(column)
+            numeric_dtypes.append(str(series.dtype))
+            numeric.append(series.to_numpy(dtype=np.float64))
+            continue
+        values, uniques = pd.factorize(series)
+        mapping = np.empty(len(uniques) + 1, dtype=np.int32)
+        mapping[-1] = MISSING # factorize marks nan with -1
+        for i, value in enumerate(uniques):
+            value = str(value)
+            if value not in vocab_index:
+                vocab_index[value] = len(vocab)
+                vocab.append(value)
+            mapping[i] = vocab_index[value]
+        codes[:, j] = mapping[values]
+    numeric = np.stack(numeric, axis=1) if numeric else np.zeros((frame.shape[0], 0))
+    return vocab, codes.astype(code_dtype(len(vocab))), numeric_columns, numeric_dtypes, numeric
+
+
+def cache_paths(path, digest, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    prefix = os.path.join(cache_dir, '{}.{}'.format(os.path.basename(path), digest[:16]))
+    return prefix + '.json', prefix + '.codes.npy', prefix + '.numeric.npy'
+
+
+@instrumentation.timed('data.build_cache')
+def build_cache(path, meta_path, codes_path, numeric_path):
+    frame = pd.read_csv(path)
+    vocab, codes, numeric_columns, numeric_dtypes, numeric = encode_frame(frame)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    # write to temporary files first, so that parallel runs never see a half written cache
+    for target, array in ((codes_path, codes), (numeric_path, numeric)):
+        tmp = '{}.{}.tmp.npy'.format(target[:-len('.npy')], os.getpid())
+        np.save(tmp, array)
+        os.replace(tmp, target)
+    meta = {
+        'version': FORMAT_VERSION,
+        'source': os.path.basename(path),
+        'columns': list(frame.columns),
+        'vocab': vocab[2:],
+        'numeric_columns': numeric_columns,
+        'numeric_dtypes': numeric_dtypes,
+    }
+    tmp = '{}.{}.tmp'.format(meta_path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+@instrumentation.timed('data.load_table')
+def load_table(path, cache_dir=None, refresh=False):
+    """
+    Loads the table from the cache, building the cache first if it does not exist yet.
+    The code and numeric matrices are memory-mapped read-only.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key in _loaded and not refresh:
+        instrumentation.count('data.load_table.memoized')
+        return _loaded[key]
+
+    meta_path, codes_path, numeric_path = cache_paths(path, file_digest(path), cache_dir)
+    meta = None
+    if not refresh and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            meta = None
+    if meta is None:
+        instrumentation.count('data.cache_misses')
+        build_cache(path, meta_path, codes_path, numeric_path)
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    table = CodedTable(
+        path,
+        meta['columns'],
+        [np.nan, '?'] + meta['vocab'],
+        np.load(codes_path, mmap_mode='r'),
+        meta['numeric_columns'],
+        meta['numeric_dtypes'],
+        np.load(numeric_path, mmap_mode='r'),
+    )
+    _loaded[key] = table
+    return table
+
+
+def read_csv(path):
+    """
+    Drop-in replacement for pd.read_csv(path) served from the cache.
+    """
+    return load_table(path).to_frame()
+
+
+def align(*tables):
+    """
+    Recodes the tables into one shared vocabulary so that their codes can be compared directly.
+    Returns the shared vocabulary and one code matrix per table.
+    """
+    vocab = list(tables[0].vocab)
+    vocab_index = dict(tables[0].vocab_index)
+    result = []
+    for table in tables:
+        mapping = np.empty(len(table.vocab), dtype=np.int32)
+        mapping[MISSING] = MISSING
+        for code, value in enumerate(table.vocab[1:], 1):
+            if value not in vocab_index:
+                vocab_index[value] = len(vocab)
+                vocab.append(value)
+            mapping[code] = vocab_index[value]
+        result.append(mapping[table.codes])
+    dtype = code_dtype(len(vocab))
+    return vocab, [codes.astype(dtype) for codes in result]
+
+
+def load_aligned(*paths):
+    """
+    Loads the tables and returns the shared vocabulary and their code matrices, see align().
+    """
+    return align(*[load_table(path) for path in paths])
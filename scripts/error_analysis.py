@@ -0,0 +1,179 @@
+"""
+Error analysis of any number of systems on the same input (e.g. dev_x.csv).
+
+The input, the gold file, the predictions and their score files (the Perl
+-scores.csv outputs, lang_embedding_probs.csv, ...) are loaded once through
+dataset_cache into arrays over the predicted cells (those with '?' in the
+input), so every table of compare.py, compare_scores.py and
+compare_scores_thresh.py is a cheap query over any pair or subset of systems.
+
+    systems = error_analysis.Systems('../data/dev_x.csv', '../data/dev_y.csv',
+                                     [out_1, out_2], [scores_1, scores_2])
+    systems.feature_accuracy()        # (systems, features)
+    systems.better(0, 1)              # cells where system 0 is right and system 1 wrong
+
+The columns of the files are matched by name (the unnamed index column may
+differ), the languages (rows) have to be in the same order.
+"""
+import os
+
+import numpy as np
+
+import dataset_cache
+
+
+def by_name(matrix, table, columns, fill):
+    """
+    Columns of the table's (rows, columns) matrix in the order of the given columns, fill where the table has none.
+    """
+    result = np.full((matrix.shape[0], len(columns)), fill, dtype=matrix.dtype)
+    for j, column in enumerate(columns):
+        if column in table.column_index:
+            result[:, j] = matrix[:, table.column_index[column]]
+    return result
+
+
+class Systems:
+    def __init__(self, input_file, golden_file, output_files, score_files=None, names=None):
+        """
+        golden_file may be None (e.g. for test data), then gold and correct are None too.
+        """
+        paths = [input_file] + ([golden_file] if golden_file is not None else []) + list(output_files)
+        tables = [dataset_cache.load_table(path) for path in paths]
+        self.columns = tables[0].columns
+        self.vocab, codes = dataset_cache.align(*tables)
+        codes = [by_name(table_codes, table, self.columns, dataset_cache.MISSING) for table_codes, table in zip(codes, tables)]
+        languages = self.columns.index('wals_code')
+        if any(not np.array_equal(table_codes[:, languages], codes[0][:, languages]) for table_codes in codes):
+            raise ValueError('All the files must have the languages of {} in the same order'.format(input_file))
+        inp, outputs = codes[0], codes[-len(output_files):]
+
+        self.inp = inp # (rows, columns) input codes in the shared vocabulary
+        self.names = list(names) if names is not None else [os.path.basename(path) for path in output_files]
+        # the predicted cells in the row by row order
+        self.rows, self.cols = np.nonzero(inp == dataset_cache.UNKNOWN)
+        self.predicted = np.stack([output[self.rows, self.cols] for output in outputs]) # (systems, cells)
+        self.gold = self.correct = None
+        if golden_file is not None:
+            self.gold = codes[1][self.rows, self.cols]
+            self.correct = self.predicted == self.gold
+        self.scores = np.full(self.predicted.shape, np.nan)
+        for i, path in enumerate(score_files or []):
+            if path is not None:
+                table = dataset_cache.load_table(path)
+                self.scores[i] = by_name(table.score_matrix(), table, self.columns, np.nan)[self.rows, self.cols]
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def cells(self):
+        return len(self.rows)
+
+    def index(self, system):
+        """
+        Index of the system given by its index or name.
+        """
+        return self.names.index(system) if isinstance(system, str) else system
+
+    def indices(self, systems=None):
+        return list(range(len(self))) if systems is None else [self.index(system) for system in systems]
+
+    def features(self):
+        """
+        Column indices of the predicted features, in the order in which they first occur in the input.
+        """
+        columns, first = np.unique(self.cols, return_index=True)
+        return columns[np.argsort(first)]
+
+    def count(self, cells):
+        """
+        Number of the selected cells (a boolean array over the cells, or (n, cells)) of every column.
+        """
+        cells = np.atleast_2d(cells)
+        n_columns = len(self.columns)
+        bins = (np.arange(len(cells))[:, np.newaxis] * n_columns + self.cols).ravel()
+        counts = np.bincount(bins, weights=cells.ravel(), minlength=len(cells) * n_columns)
+        return counts.astype(np.int64).reshape(len(cells), n_columns)
+
+    def accuracy(self, systems=None):
+        return self.correct[self.indices(systems)].mean(axis=1)
+
+    def any_correct(self, systems=None):
+        return self.correct[self.indices(systems)].any(axis=0)
+
+    def feature_accuracy(self, systems=None):
+        """
+        (systems, columns) accuracy on every column, nan for the columns without predicted cells.
+        """
+        total = np.bincount(self.cols, minlength=len(self.columns))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.count(self.correct[self.indices(systems)]) / total
+
+    def better(self, a, b):
+        """
+        Cells where system a is right and system b is wrong.
+        """
+        return self.correct[self.index(a)] & ~self.correct[self.index(b)]
+
+    def different(self, a, b):
+        return self.predicted[self.index(a)] != self.predicted[self.index(b)]
+
+    def choose(self, a, b, thresh_a, thresh_b):
+        """
+        Cells where the merge of compare_scores_thresh.py picks system a: its score is above thresh_a
+        and the score of b is below thresh_b.
+        """
+        return (self.scores[self.index(a)] > thresh_a) & (self.scores[self.index(b)] < thresh_b)
+
+    def threshold_surface(self, a, b, thresh_a=None, thresh_b=None):
+        """
+        Accuracy of the merge of choose(a, b, thresh_a, thresh_b) for every pair of the thresholds at once,
+        see gain_surface(). Returns the sorted thresh_a, thresh_b and the accuracy matrix of shape
+        (len(thresh_a), len(thresh_b)).
+        """
+        a, b = self.index(a), self.index(b)
+        # choosing a instead of b changes the number of correct cells only where exactly one of them is right
+        gain = self.correct[a].astype(np.int64) - self.correct[b]
+        thresh_a, thresh_b, gains = gain_surface(gain, self.scores[a], self.scores[b], thresh_a, thresh_b)
+        return thresh_a, thresh_b, (np.sum(self.correct[b]) + gains) / self.cells
+
+    def score_stats(self, system, cells):
+        """
+        (min, max, mean) of the scores of the system on the selected cells.
+        """
+        scores = self.scores[self.index(system), cells]
+        return scores.min(), scores.max(), scores.mean()
+
+    def score_curve(self, system, positive, negative, descending=True):
+        """
+        Scores of the system on the positive and negative cells sorted by the score (stable, the positive
+        cells first), with the flags telling which cells are positive.
+        """
+        scores = self.scores[self.index(system)]
+        scores = np.concatenate([scores[positive], scores[negative]])
+        flags = np.concatenate([np.ones(np.sum(positive), dtype=bool), np.zeros(np.sum(negative), dtype=bool)])
+        order = np.argsort(-scores if descending else scores, kind='stable')
+        return scores[order], flags[order]
+
+
+def gain_surface(gain, scores_a, scores_b, thresh_a=None, thresh_b=None):
+    """
+    Sum of the gain of the cells with scores_a > thresh_a[i] and scores_b < thresh_b[j] for every pair (i, j)
+    at once, cells with a nan score are never selected. The thresholds default to all the distinct scores
+    of the cells with a non-zero gain (with -inf for a and inf for b), which covers every possible selection.
+    Returns the sorted thresh_a, thresh_b and the (len(thresh_a), len(thresh_b)) gain matrix.
+    """
+    matters = (gain != 0) & ~np.isnan(scores_a) & ~np.isnan(scores_b)
+    scores_a, scores_b, gain = scores_a[matters], scores_b[matters], gain[matters]
+    thresh_a = np.concatenate([[-np.inf], np.unique(scores_a)]) if thresh_a is None else np.sort(thresh_a)
+    thresh_b = np.concatenate([np.unique(scores_b), [np.inf]]) if thresh_b is None else np.sort(thresh_b)
+
+    # a cell is selected for thresh_a[i] < score_a, i.e. i < rows, and thresh_b[j] > score_b, i.e. j >= columns
+    rows = np.searchsorted(thresh_a, scores_a, side='left')
+    columns = np.searchsorted(thresh_b, scores_b, side='right')
+    gains = np.zeros((len(thresh_a) + 1, len(thresh_b) + 1), dtype=np.int64)
+    np.add.at(gains, (rows, columns), gain)
+    # sum over rows > i and columns <= j
+    gains = np.cumsum(np.cumsum(gains[::-1], axis=0)[::-1][1:], axis=1)[:, :-1]
+    return thresh_a, thresh_b, gains
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Indexed queries over the errors of one system of error_analysis.Systems.
+
+The attributes of every predicted cell (feature, gold and predicted value,
+genus, family and controlled genus of its language) are coded once and an
+inverted index (cells sorted by the attribute, with the bounds of every
+value) is built for each of them, so a query only touches the cells of its
+rarest attribute value. The tables are grouped numpy reductions over the
+attribute codes.
+
+    index = error_index.ErrorIndex(systems, 'lang_embedding.csv')
+    index.confusions(feature='Order_of_Subject,_Object_and_Verb', controlled_genus='Mayan')
+    index.summary('genus')
+
+python3 error_index.py ../outputs/lang_embedding.csv --feature Order_of_Subject,_Object_and_Verb --controlled_genus Mayan
+"""
+import argparse
+
+import numpy as np
+
+import error_analysis
+from create_train_dev import CONTROLLED_GENERA
+
+ATTRIBUTES = ['feature', 'gold', 'predicted', 'genus', 'family', 'controlled_genus']
+OTHER_GENERA = 'other genera'
+
+
+class Posting:
+    """
+    Inverted index of one attribute: the cells sorted by the attribute code, with the bounds of every code.
+    """
+    def __init__(self, codes, names):
+        self.codes = codes
+        self.names = list(names)
+        self.name_index = {name: code for code, name in enumerate(self.names)}
+        self.order = np.argsort(codes, kind='stable')
+        self.bounds = np.searchsorted(codes[self.order], np.arange(len(self.names) + 1))
+
+    def cells(self, name):
+        code = self.name_index.get(name)
+        if code is None:
+            return self.order[:0]
+        return self.order[self.bounds[code]:self.bounds[code + 1]]
+
+
+class ErrorIndex:
+    def __init__(self, systems, system=0):
+        self.systems = systems
+        self.system = systems.index(system)
+        vocab = np.asarray(systems.vocab, dtype=object)
+        rows, cols = systems.rows, systems.cols
+        genus = systems.inp[rows, systems.columns.index('genus')]
+        family = systems.inp[rows, systems.columns.index('family')]
+        self.correct = systems.correct[self.system]
+
+        attributes = {
+            'feature': (cols, np.asarray(systems.columns, dtype=object)),
+            'gold': (systems.gold, vocab),
+            'predicted': (systems.predicted[self.system], vocab),
+            'genus': (genus, vocab),
+            'family': (family, vocab),
+        }
+        controlled = np.array([vocab[code] if vocab[code] in CONTROLLED_GENERA else OTHER_GENERA for code in genus], dtype=object)
+        self.index = {}
+        for name, (codes, names) in attributes.items():
+            # recode to the values that occur, so that every posting list is dense
+            used, codes = np.unique(codes, return_inverse=True)
+            self.index[name] = Posting(codes, names[used])
+        names, codes = np.unique(controlled, return_inverse=True)
+        self.index['controlled_genus'] = Posting(codes, names)
+
+    def cells(self, errors_only=True, **filters):
+        """
+        Indices of the (wrongly) predicted cells matching all the filters (attribute=value).
+        """
+        unknown = set(filters) - set(ATTRIBUTES)
+        if unknown:
+            raise ValueError('Unknown attributes {}, expected some of {}'.format(', '.join(sorted(unknown)), ', '.join(ATTRIBUTES)))
+        if filters:
+            # start from the shortest posting list and check the other attributes on its cells only
+            postings = sorted(((self.index[name], value) for name, value in filters.items()), key=lambda item: len(item[0].cells(item[1])))
+            cells = np.sort(postings[0][0].cells(postings[0][1]))
+            for posting, value in postings[1:]:
+                cells = cells[posting.codes[cells] == posting.name_index.get(value, -1)]
+        else:
+            cells = np.arange(self.systems.cells)
+        return cells[~self.correct[cells]] if errors_only else cells
+
+    def confusions(self, top=10, **filters):
+        """
+        The most frequent (gold, predicted, count) errors of the cells matching the filters.
+        """
+        cells = self.cells(**filters)
+        gold, predicted = self.index['gold'], self.index['predicted']
+        pairs = gold.codes[cells].astype(np.int64) * len(predicted.names) + predicted.codes[cells]
+        pairs, counts = np.unique(pairs, return_counts=True)
+        order = np.argsort(-counts, kind='stable')[:top]
+        return [(gold.names[pair // len(predicted.names)], predicted.names[pair % len(predicted.names)], int(count))
+                for pair, count in zip(pairs[order], counts[order])]
+
+    def summary(self, by='feature', **filters):
+        """
+        (value, cells, errors, accuracy) of every value of the attribute among the cells matching the filters,
+        the values with the most errors first.
+        """
+        posting = self.index[by]
+        cells = self.cells(errors_only=False, **filters)
+        codes = posting.codes[cells]
+        total = np.bincount(codes, minlength=len(posting.names))
+        errors = np.bincount(codes, weights=~self.correct[cells], minlength=len(posting.names)).astype(np.int64)
+        order = [code for code in np.lexsort((-total, -errors)) if total[code] > 0]
+        return [(posting.names[code], int(total[code]), int(errors[code]), 1 - errors[code] / total[code]) for code in order]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output_file", type=str, help="Predictions to analyse.")
+    parser.add_argument("--input_file", type=str, default="../data/dev_x.csv", help="Path to input file.")
+    parser.add_argument("--golden_file", type=str, default="../data/dev_y.csv", help="Path to file with golden values.")
+    for attribute in ATTRIBUTES:
+        parser.add_argument("--" + attribute, type=str, help="Only the cells with this {}.".format(attribute.replace('_', ' ')))
+    parser.add_argument("--by", type=str, default="feature", choices=ATTRIBUTES, help="Attribute of the summary table.")
+    parser.add_argument("--top", type=int, default=10, help="Number of the confusions and summary rows.")
+    args = parser.parse_args()
+
+    systems = error_analysis.Systems(args.input_file, args.golden_file, [args.output_file])
+    index = ErrorIndex(systems)
+    filters = {attribute: getattr(args, attribute) for attribute in ATTRIBUTES if getattr(args, attribute) is not None}
+
+    print("Top confusions", *["{}={}".format(k, v) for k, v in filters.items()])
+    print("gold", "predicted", "count", sep="\t")
+    for gold, predicted, count in index.confusions(args.top, **filters):
+        print(gold, predicted, count, sep="\t")
+    print()
+    print(args.by, "cells", "errors", "accuracy", sep="\t")
+    for value, cells, errors, accuracy in index.summary(args.by, **filters)[:args.top]:
+        print(value, cells, errors, "{:.2%}".format(accuracy), sep="\t")
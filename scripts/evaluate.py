@@ -1,13 +1,17 @@
 import numpy as np
 
-def evaluate(inp, output, golden_output):
+import instrumentation
+
+@instrumentation.timed('evaluate')
+def evaluate(inp, output, golden_output, unknown='?'):
     """
     Expectes three numpy arrays, where 
     inp is input matrix with ? in it, so script knows which values were predicted
     output is matrix of all values (even those that were not predicted)
     golden_ouput is 2D matrix of all golden values (even those that were not predicted)
+    The arrays can also be integer coded (see dataset_cache), then unknown is the code of '?'.
     """
-    should_predict = (inp == '?')
+    should_predict = (inp == unknown)
     total = np.sum(should_predict)
     predicted_right = np.sum(output[should_predict] == golden_output[should_predict])
     # Debugging of errors:
@@ -19,28 +23,89 @@ def evaluate(inp, output, golden_output):
     #print('correctly predicted', predicted_right, 'out of', total)
     return predicted_right / total 
 
-def compare(inp, output1, output2, golden_output):
-    should_predict = (inp == '?')
-    total = np.sum(should_predict)
-    predicted_right_1 = 0
-    predicted_right_2 = 0
-    predicted_right_any = 0
-    for i in range(len(should_predict)):
-        for j in range(len(should_predict[i])):
-            if should_predict[i,j]:
-                if output1[i,j] == golden_output[i,j]:
-                    predicted_right_1 += 1
-                if output2[i,j] == golden_output[i,j]:
-                    predicted_right_2 += 1
-                if output1[i,j] == golden_output[i,j] or output2[i,j] == golden_output[i,j]:
-                    predicted_right_any += 1
-    
-    return (predicted_right_1 / total, predicted_right_2 / total, predicted_right_any / total)
+def compare(inp, output1, output2, golden_output, unknown='?'):
+    result = compare_many(inp, [output1, output2], golden_output, unknown)
+    return (result['accuracy'][0], result['accuracy'][1], result['oracle'])
+
+def compare_many(inp, outputs, golden_output, unknown='?'):
+    """
+    Compares any number of systems at once. outputs is a (systems, rows, columns) array or a list of output
+    matrices, the other arguments are the same as for evaluate(). Returns a dict of
+    accuracy: (systems,) accuracy of every system
+    oracle: accuracy when a correct system is always picked (if there is one)
+    agreement: (systems, systems) ratio of the predicted cells where the two systems predict the same value
+    complementarity: (systems, systems) ratio of the errors of the row system which the column system predicts right
+    feature_accuracy: (systems, columns) accuracy of every system on every column (nan where nothing is predicted)
+    feature_total: (columns,) number of predicted cells of every column
+    """
+    outputs = np.asarray(outputs)
+    rows, columns = np.nonzero(inp == unknown)
+    total = len(rows)
+    predicted = outputs[:, rows, columns] # (systems, cells)
+    correct = np.asarray(predicted == golden_output[rows, columns], dtype=bool)
+    errors = (~correct).astype(np.int64)
+
+    both_wrong = errors @ errors.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        complementarity = 1 - both_wrong / errors.sum(axis=1)[:, np.newaxis]
+    agreement = np.array([np.sum(predicted == system, axis=1) for system in predicted]) / total
+
+    # per feature counts of all systems in one bincount, system s has the bins s*columns ... (s+1)*columns-1
+    n_systems, n_columns = len(outputs), inp.shape[1]
+    bins = (np.arange(n_systems)[:, np.newaxis] * n_columns + columns).ravel()
+    feature_correct = np.bincount(bins, weights=correct.ravel(), minlength=n_systems * n_columns).reshape(n_systems, n_columns)
+    feature_total = np.bincount(columns, minlength=n_columns)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        feature_accuracy = feature_correct / feature_total
+
+    return {
+        'accuracy': correct.sum(axis=1) / total,
+        'oracle': np.sum(correct.any(axis=0)) / total,
+        'agreement': agreement,
+        'complementarity': complementarity,
+        'feature_accuracy': feature_accuracy,
+        'feature_total': feature_total,
+    }
+
+def language_counts(inp, output, golden_output, unknown='?'):
+    """
+    Number of the correctly predicted and of all the predicted cells of every language (row).
+    """
+    should_predict = (inp == unknown)
+    correct = np.sum(should_predict & (output == golden_output), axis=1)
+    return correct, np.sum(should_predict, axis=1)
+
+def bootstrap(inp, output, golden_output, unknown='?', samples=10000, confidence=0.95, seed=0):
+    """
+    Bootstrap confidence interval of the accuracy, resampling the languages. All the resamples
+    are drawn as one (samples, languages) index matrix. Returns (accuracy, low, high).
+    """
+    correct, total = language_counts(inp, output, golden_output, unknown)
+    resamples = np.random.default_rng(seed).integers(len(total), size=(samples, len(total)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        accuracies = correct[resamples].sum(axis=1) / total[resamples].sum(axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.nanquantile(accuracies, [alpha, 1 - alpha])
+    return correct.sum() / total.sum(), low, high
+
+def permutation_test(inp, output1, output2, golden_output, unknown='?', samples=10000, seed=0):
+    """
+    Paired permutation test of the accuracy difference of two systems: the outputs of the two systems
+    are swapped for random subsets of languages, all the permutations at once as a (samples, languages)
+    sign matrix. Returns (accuracy1 - accuracy2, two-sided p-value).
+    """
+    correct1, total = language_counts(inp, output1, golden_output, unknown)
+    correct2, _ = language_counts(inp, output2, golden_output, unknown)
+    difference = (correct1 - correct2).astype(np.int64)
+    signs = np.random.default_rng(seed).choice(np.array([-1, 1]), size=(samples, len(difference)))
+    observed = np.abs(difference.sum())
+    extreme = np.sum(np.abs(signs @ difference) >= observed)
+    return difference.sum() / total.sum(), (extreme + 1) / (samples + 1)
 
 if __name__ == "__main__":
-    import pandas as pd
-    train_X = pd.read_csv('../data/train_x.csv').to_numpy()
-    train_y = pd.read_csv('../data/train_y.csv').to_numpy()
+    import dataset_cache
+    train_X = dataset_cache.read_csv('../data/train_x.csv').to_numpy()
+    train_y = dataset_cache.read_csv('../data/train_y.csv').to_numpy()
 
     output = train_y.copy()
     output[:,70:] = train_X[:,70:]
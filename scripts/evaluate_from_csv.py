@@ -1,5 +1,5 @@
 import argparse
-import pandas as pd
+import dataset_cache
 import evaluate
 
 
@@ -9,9 +9,19 @@ if __name__ == "__main__":
     parser.add_argument("--input_file", type=str, help="Path to input file.")
     parser.add_argument("--output_file", type=str, help="Path to output file.")
     parser.add_argument("--golden_file", type=str, help="Path to file with golden values.")
+    parser.add_argument("--output_file2", type=str, help="Path to output file of another system to compare with.")
+    parser.add_argument("--samples", type=int, default=10000, help="Number of bootstrap resamples and permutations, 0 to skip them.")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the bootstrap interval.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the resampling.")
     args = parser.parse_args()
 
-    inp = pd.read_csv(args.input_file).to_numpy()
-    out = pd.read_csv(args.output_file).to_numpy()
-    gold = pd.read_csv(args.golden_file).to_numpy()
-    print("Accuracy is {:.2%}".format(evaluate.evaluate(inp, out, gold)))
\ No newline at end of file
+    paths = [args.input_file, args.golden_file, args.output_file] + ([args.output_file2] if args.output_file2 else [])
+    _, (inp, gold, *outputs) = dataset_cache.load_aligned(*paths)
+    for out in outputs:
+        print("Accuracy is {:.2%}".format(evaluate.evaluate(inp, out, gold, dataset_cache.UNKNOWN)))
+        if args.samples:
+            _, low, high = evaluate.bootstrap(inp, out, gold, dataset_cache.UNKNOWN, args.samples, args.confidence, args.seed)
+            print("{:.0%} confidence interval is {:.2%} - {:.2%}".format(args.confidence, low, high))
+    if len(outputs) == 2 and args.samples:
+        difference, p_value = evaluate.permutation_test(inp, *outputs, gold, dataset_cache.UNKNOWN, args.samples, args.seed)
+        print("Difference is {:+.2%}, p-value of the paired permutation test is {:.4f}".format(difference, p_value))
@@ -0,0 +1,209 @@
+"""
+Shared encoding of the categorical columns (genus, family and the WALS
+features) used by all the model families.
+
+Every column has its own value codes: MISSING (0) for empty cells, UNKNOWN (1)
+for '?' and FIRST_VALUE (2) onwards for the values in sorted order, so the
+codes do not depend on the order of the data. The values of all columns also
+live in one flat space of vocab.size ids: value code c of column j has the
+global id vocab.offsets[j] + c - FIRST_VALUE (used for embeddings and one-hot
+encoding).
+
+    vocab = FeatureVocab.for_dataset(['../data/train_y.csv', '../data/dev_x.csv'])
+    codes = vocab.encode_table(dataset_cache.load_table('../data/dev_x.csv'))
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+import dataset_cache
+import instrumentation
+from dataset_cache import MISSING, UNKNOWN
+
+FIRST_VALUE = 2
+LANGUAGE_COLUMNS = ['wals_code', 'name', 'latitude', 'longitude', 'genus', 'family', 'countrycodes']
+CATEGORICAL_LANGUAGE_COLUMNS = ['genus', 'family']
+
+
+def default_columns(columns):
+    """
+    Genus, family and all the feature columns (those after countrycodes) of the table.
+    """
+    first_feature = list(columns).index('countrycodes') + 1
+    return CATEGORICAL_LANGUAGE_COLUMNS + list(columns[first_feature:])
+
+
+class FeatureVocab:
+    def __init__(self, columns, values):
+        self.columns = list(columns)
+        self.values = [list(column_values) for column_values in values] # sorted values of every column, without MISSING and UNKNOWN
+
+        self.column_index = {column: i for i, column in enumerate(self.columns)}
+        self.value_index = [{value: code for code, value in enumerate(column_values, FIRST_VALUE)} for column_values in self.values]
+        lengths = np.array([len(column_values) for column_values in self.values], dtype=np.int64)
+        self.sizes = lengths + FIRST_VALUE # number of codes of every column
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        self.size = int(lengths.sum()) # number of global ids
+        self.global_column = np.repeat(np.arange(len(self.columns)), lengths) # global id -> column
+        self.dtype = np.int8 if self.sizes.max(initial=0) <= np.iinfo(np.int8).max else np.int16
+
+    def __len__(self):
+        return len(self.columns)
+
+    @classmethod
+    def from_frames(cls, frames, columns=None):
+        """
+        Collects the values of the columns (default_columns of the first frame) from the DataFrames.
+        """
+        if columns is None:
+            columns = default_columns(frames[0].columns)
+        values = []
+        for column in columns:
+            column_values = set()
+            for frame in frames:
+                if column in frame.columns:
+                    column_values.update(str(value) for value in frame[column].dropna().unique())
+            column_values.discard('?')
+            values.append(sorted(column_values))
+        return cls(columns, values)
+
+    @classmethod
+    def from_tables(cls, tables, columns=None):
+        """
+        Collects the values of the columns (default_columns of the first table) from dataset_cache.CodedTables.
+        """
+        if columns is None:
+            columns = default_columns(tables[0].columns)
+        values = []
+        for column in columns:
+            column_values = set()
+            for table in tables:
+                if column in table.column_index:
+                    codes = np.unique(table.codes[:, table.column_index[column]])
+                    column_values.update(table.vocab[code] for code in codes if code not in (MISSING, UNKNOWN))
+            values.append(sorted(column_values))
+        return cls(columns, values)
+
+    @classmethod
+    def for_dataset(cls, paths, columns=None, cache_dir=None):
+        """
+        Vocabulary of the CSV files, built once and cached next to the dataset_cache files.
+        """
+        digest = hashlib.sha1()
+        for path in paths:
+            digest.update(dataset_cache.file_digest(path).encode())
+        digest.update(json.dumps(columns).encode())
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(paths[0])), dataset_cache.CACHE_DIR)
+        cache_path = os.path.join(cache_dir, 'feature_vocab.{}.json'.format(digest.hexdigest()[:16]))
+        if os.path.exists(cache_path):
+            return cls.load(cache_path)
+        vocab = cls.from_tables([dataset_cache.load_table(path) for path in paths], columns)
+        os.makedirs(cache_dir, exist_ok=True)
+        vocab.save(cache_path)
+        return vocab
+
+    def save(self, path):
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'columns': self.columns, 'values': self.values}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['columns'], data['values'])
+
+    def with_column(self, column, values):
+        """
+        Returns a new vocabulary with one more column at the end.
+        """
+        return FeatureVocab(self.columns + [column], self.values + [sorted(str(value) for value in set(values))])
+
+    def encode_value(self, column, value):
+        if pd.isnull(value) or value == '':
+            return MISSING
+        if value == '?':
+            return UNKNOWN
+        return self.value_index[self.column_index[column]].get(str(value), MISSING)
+
+    @instrumentation.timed('encode.table')
+    def encode_table(self, table):
+        """
+        Encodes the dataset_cache.CodedTable to a (rows, columns) code matrix. Unseen values and columns are MISSING.
+        """
+        result = np.full((table.shape[0], len(self.columns)), MISSING, dtype=self.dtype)
+        for j, column in enumerate(self.columns):
+            if column not in table.column_index:
+                continue
+            # translate the codes of the table to the codes of this column
+            mapping = np.full(len(table.vocab), MISSING, dtype=self.dtype)
+            mapping[UNKNOWN] = UNKNOWN
+            for value, code in self.value_index[j].items():
+                table_code = table.code(value)
+                if table_code >= 0:
+                    mapping[table_code] = code
+            result[:, j] = mapping[table.codes[:, table.column_index[column]]]
+        return result
+
+    @instrumentation.timed('encode.frame')
+    def encode_frame(self, frame):
+        """
+        Encodes the DataFrame to a (rows, columns) code matrix. Unseen values and columns are MISSING.
+        """
+        result = np.full((frame.shape[0], len(self.columns)), MISSING, dtype=self.dtype)
+        for j, column in enumerate(self.columns):
+            if column not in frame.columns:
+                continue
+            values, uniques = pd.factorize(frame[column])
+            mapping = np.array([self.encode_value(column, value) for value in uniques] + [MISSING], dtype=self.dtype)
+            result[:, j] = mapping[values] # factorize marks nan with -1, the last item
+        return result
+
+    def transform(self, rows):
+        """
+        One-hot encodes rows given as lists of strings ('' for missing), a replacement of OneHotEncoder.transform.
+        """
+        codes = np.array([[self.encode_value(column, value) for column, value in zip(self.columns, row)] for row in rows], dtype=self.dtype)
+        return self.one_hot(codes.reshape(-1, len(self.columns)))
+
+    @property
+    def categories_(self):
+        """
+        Values of every column, the same as OneHotEncoder.categories_.
+        """
+        return [np.array(column_values, dtype=object) for column_values in self.values]
+
+    def decode(self, codes):
+        """
+        Converts a (rows, columns) code matrix back to strings, nan for MISSING and '?' for UNKNOWN.
+        """
+        result = np.empty(codes.shape, dtype=object)
+        for j, column_values in enumerate(self.values):
+            result[:, j] = self.decode_column(j, codes[:, j])
+        return result
+
+    def decode_column(self, column, codes):
+        return np.array([np.nan, '?'] + self.values[column], dtype=object)[codes]
+
+    def global_ids(self, codes):
+        """
+        Global ids of the (rows, columns) code matrix, -1 where the value is MISSING or UNKNOWN.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        return np.where(codes >= FIRST_VALUE, codes - FIRST_VALUE + self.offsets, -1)
+
+    def one_hot(self, codes):
+        """
+        Sparse (rows, size) one-hot matrix of the code matrix, MISSING and UNKNOWN have no column.
+        """
+        ids = self.global_ids(codes)
+        rows, columns = np.nonzero(ids >= 0)
+        return scipy.sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, ids[rows, columns])),
+            shape=(ids.shape[0], self.size))
@@ -0,0 +1,179 @@
+"""
+Lightweight instrumentation of the hot paths: named timers, counters and the
+memory high-water mark, written as a JSON trace at the end of the run.
+
+It is off by default and then every call is a single flag check. Switch it on
+by setting the ST2020_TRACE environment variable to the path of the trace
+(or by calling enable(path)):
+
+    ST2020_TRACE=trace.json python3 run_transformer.py
+
+    with instrumentation.timer('model.train_on_batch'):
+        ...
+    instrumentation.count('model.predict_on_batch', len(batch))
+
+    @instrumentation.timed('data.load_table')
+    def load_table(path): ...
+
+The trace holds for every timer its count, total, mean and max seconds, the
+counters, the peak RSS and (up to MAX_EVENTS) the individual timed events,
+so the time spent in the input pipeline can be compared with the model steps.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+ENV_VARIABLE = 'ST2020_TRACE'
+MAX_EVENTS = 100000
+
+enabled = False
+_registered = False # write_trace is registered with atexit
+_path = None
+_start = None
+_timers = {} # name -> [count, total, max]
+_counters = {}
+_events = [] # (name, start, duration)
+_null = contextlib.nullcontext()
+
+
+def enable(path=None):
+    """
+    Starts collecting, the trace is written to path (if given) when the process exits.
+    """
+    global enabled, _registered, _path, _start
+    if not _registered:
+        atexit.register(write_trace)
+        _registered = True
+    enabled, _path = True, path
+    if _start is None:
+        _start = time.perf_counter()
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    global _start
+    _timers.clear()
+    _counters.clear()
+    _events.clear()
+    _start = time.perf_counter()
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        add_time(self.name, self.start, time.perf_counter() - self.start)
+
+
+def timer(name):
+    """
+    Context manager measuring the wall time of its block under the name.
+    """
+    return _Timer(name) if enabled else _null
+
+
+def timed(name):
+    """
+    Decorator measuring every call of the function under the name.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with _Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_time(name, start, duration):
+    stats = _timers.get(name)
+    if stats is None:
+        stats = _timers[name] = [0, 0.0, 0.0]
+    stats[0] += 1
+    stats[1] += duration
+    stats[2] = max(stats[2], duration)
+    if len(_events) < MAX_EVENTS:
+        _events.append((name, start - _start, duration))
+
+
+def count(name, value=1):
+    """
+    Adds value to the counter of the name.
+    """
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def merge(timers, counters):
+    """
+    Adds the timers and counters of another trace (e.g. of a worker process) to the collected ones.
+    """
+    for name, stats in timers.items():
+        own = _timers.get(name)
+        if own is None:
+            own = _timers[name] = [0, 0.0, 0.0]
+        own[0] += stats['count']
+        own[1] += stats['total']
+        own[2] = max(own[2], stats['max'])
+    for name, value in counters.items():
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def peak_rss_mb():
+    """
+    Memory high-water mark of the process in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024 # bytes on macOS, KiB on Linux
+
+
+def trace():
+    """
+    The collected statistics as a JSON serializable dict.
+    """
+    return {
+        'argv': sys.argv,
+        'wall_seconds': time.perf_counter() - _start if _start is not None else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'timers': {name: {'count': n, 'total': total, 'mean': total / n, 'max': longest}
+                   for name, (n, total, longest) in sorted(_timers.items(), key=lambda item: -item[1][1])},
+        'counters': dict(sorted(_counters.items())),
+        'events': [{'name': name, 'start': start, 'duration': duration} for name, start, duration in _events],
+    }
+
+
+def write_trace(path=None):
+    path = path or _path
+    if path is None:
+        return
+    if multiprocessing.parent_process() is not None:
+        # the workers of a process pool write their own traces next to the one of the main process
+        root, extension = os.path.splitext(path)
+        path = '{}.{}{}'.format(root, os.getpid(), extension)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(trace(), f, indent=1)
+    os.replace(tmp, path)
+
+
+if os.environ.get(ENV_VARIABLE):
+    enable(os.environ[ENV_VARIABLE])
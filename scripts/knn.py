@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Vectorized k nearest neighbours of knn.ipynb over feature_vocab code matrices.
+
+The distances of all the (query, train) language pairs are sparse one-hot
+matrix products: the masked Hamming distance of the notebook (the number of
+the columns minus the equal known values, a missing or unknown value always
+differs) or the overlap distance (one minus the share of the equal values
+among the columns known in both languages). The neighbours are sorted once
+and the votes of every predicted cell are cumulated along the neighbour axis,
+so the accuracy of every k from 1 to the number of the train languages comes
+from a single pass. predictors.KnnPredictor predicts with one k.
+
+python3 knn.py --train ../data/train_y.csv --input ../data/dev_x.csv --golden ../data/dev_y.csv --output ../outputs/knn.csv
+python3 knn.py --train ../data/train_x.csv --input ../data/train_x.csv --golden ../data/train_y.csv
+"""
+import argparse
+import csv
+
+import numpy as np
+import scipy.sparse
+
+import dataset_cache
+from dataset_cache import MISSING, UNKNOWN
+from feature_vocab import FIRST_VALUE, FeatureVocab
+
+METRICS = ['hamming', 'overlap']
+
+
+def known(codes):
+    """
+    Sparse (rows, columns) indicator of the known values of the code matrix.
+    """
+    return scipy.sparse.csr_matrix((np.asarray(codes) >= FIRST_VALUE).astype(np.float32))
+
+
+def distances(vocab, codes, train_codes, metric='hamming'):
+    """
+    Dense (queries, train languages) distances of the code matrices.
+    """
+    matches = (vocab.one_hot(codes) @ vocab.one_hot(train_codes).T).toarray()
+    if metric == 'hamming':
+        return codes.shape[1] - matches
+    if metric == 'overlap':
+        both = (known(codes) @ known(train_codes).T).toarray()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(both > 0, 1 - matches / both, 1.0)
+    raise ValueError('Unknown metric {}, expected one of {}'.format(metric, ', '.join(METRICS)))
+
+
+def neighbours(distances, exclude=None):
+    """
+    (queries, train languages) indices of the train languages from the nearest one (the first one of the ties)
+    and the (queries, train languages) mask of the excluded ones among them (e.g. the query language itself).
+    """
+    order = np.argsort(distances, axis=1, kind='stable')
+    if exclude is None:
+        return order, np.zeros(order.shape, dtype=bool)
+    return order, np.take_along_axis(exclude, order, axis=1)
+
+
+def neighbour_values(train_codes, order, excluded, rows, cols, k=None):
+    """
+    (cells, k) values of the feature of the cells (rows, cols) in the k nearest languages of their rows
+    (all of them by default), MISSING for the excluded ones.
+    """
+    order, excluded = order[rows, :k], excluded[rows, :k]
+    values = np.asarray(train_codes)[order, cols[:, np.newaxis]].astype(np.int64)
+    values[excluded | (values < FIRST_VALUE)] = MISSING
+    return values
+
+
+def vote(values, size):
+    """
+    The most frequent value of every row of (cells, k) neighbour values and its share, MISSING and nan without votes.
+    Of the ties wins the value met first among the nearest neighbours, like Counter.most_common of the notebook.
+    """
+    cells = np.broadcast_to(np.arange(len(values))[:, np.newaxis], values.shape)
+    counts = np.bincount((cells * size + values).ravel(), minlength=len(values) * size).reshape(len(values), size)
+    counts[:, :FIRST_VALUE] = 0
+    first = np.full(counts.shape, values.shape[1])
+    np.minimum.at(first, (cells, values), np.broadcast_to(np.arange(values.shape[1]), values.shape))
+    best = np.argmax(counts * (values.shape[1] + 1) - first, axis=1)
+    total = counts.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, best, MISSING), np.where(total > 0, counts[np.arange(len(values)), best] / total, np.nan)
+
+
+def sweep(values, size, fallback, gold, batch_elements=50000000):
+    """
+    Numbers of the correct predictions of the cells with every k from 1 to the number of the neighbours, from the
+    (cells, neighbours) neighbour values: the value with the most votes among the first k (as in vote()), or the
+    fallback value of the cell without any vote.
+    """
+    neighbours = values.shape[1]
+    correct = np.zeros(neighbours, dtype=np.int64)
+    batch = max(1, batch_elements // (neighbours * size))
+    for start in range(0, len(values), batch):
+        end = min(start + batch, len(values))
+        votes = values[start:end, :, np.newaxis] == np.arange(FIRST_VALUE, size)
+        counts = np.cumsum(votes, axis=1, dtype=np.int64) # (cells, k, values)
+        # the ties are broken by the first vote of the value, which is the same for all the k reaching it
+        first = np.where(votes.any(axis=1), votes.argmax(axis=1), neighbours)
+        best = np.argmax(counts * (neighbours + 1) - first[:, np.newaxis, :], axis=2)
+        predicted = np.where(counts.max(axis=2) > 0, best + FIRST_VALUE, fallback[start:end, np.newaxis])
+        correct += np.sum(predicted == gold[start:end, np.newaxis], axis=0)
+    return correct
+
+
+def most_common(vocab, codes):
+    """
+    The most frequent value of every column of the code matrix (the ties as in vote()) and its share.
+    """
+    values = np.where(codes >= FIRST_VALUE, codes, MISSING).T.astype(np.int64)
+    return vote(values, int(vocab.sizes.max()))
+
+
+def gold_cells(vocab, golden, rows, cols):
+    """
+    Gold codes of the cells, -1 for the values unknown to the vocabulary, so that they never match a prediction.
+    """
+    gold = vocab.encode_frame(golden)[rows, cols].astype(np.int64)
+    return np.where(gold >= FIRST_VALUE, gold, -1)
+
+
+def same_language(frame, train):
+    return frame['wals_code'].to_numpy(dtype=object)[:, np.newaxis] == train['wals_code'].to_numpy(dtype=object)
+
+
+if __name__ == "__main__":
+    import predictors
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train", type=str, default="../data/train_y.csv", help="Languages of the neighbours.")
+    parser.add_argument("--input", type=str, default="../data/dev_x.csv", help="File with ? in the cells to predict.")
+    parser.add_argument("--golden", type=str, default="../data/dev_y.csv", help="File with the golden values of the input.")
+    parser.add_argument("--metric", type=str, default="hamming", choices=METRICS, help="Distance of the languages.")
+    parser.add_argument("--max_k", type=int, help="The largest k of the sweep, all the train languages by default.")
+    parser.add_argument("--output", type=str, help="Write the predictions with the best k here.")
+    args = parser.parse_args()
+
+    train = dataset_cache.read_csv(args.train)
+    masked = dataset_cache.read_csv(args.input)
+    vocab = FeatureVocab.from_frames([train])
+    train_codes, codes = vocab.encode_frame(train), vocab.encode_frame(masked)
+    rows, cols = np.nonzero(codes == UNKNOWN)
+    gold = gold_cells(vocab, dataset_cache.read_csv(args.golden), rows, cols)
+    fallback, _ = most_common(vocab, train_codes)
+    order, excluded = neighbours(distances(vocab, codes, train_codes, args.metric), same_language(masked, train))
+    values = neighbour_values(train_codes, order, excluded, rows, cols, args.max_k)
+    correct = sweep(values, int(vocab.sizes[cols].max(initial=FIRST_VALUE)), fallback[cols], gold)
+
+    accuracy = correct / len(rows)
+    best = 0
+    for k, k_accuracy in enumerate(accuracy, 1):
+        if k_accuracy > best:
+            print(k, "{:.2%}".format(k_accuracy), sep="\t")
+            best = k_accuracy
+    best_k = int(np.argmax(accuracy)) + 1
+    print("Best k {} with accuracy {:.2%} of {} cells".format(best_k, accuracy[best_k - 1], len(rows)))
+
+    if args.output:
+        values, _ = predictors.KnnPredictor(vocab, best_k, args.metric).fit(train).predict(masked)
+        # keep the original header, pandas renames the empty index column
+        with open(args.input) as f:
+            header = next(csv.reader(f))
+        values.to_csv(args.output, index=False, header=header, na_rep='nan')
@@ -1,87 +1,75 @@
 import numpy as np
 import tensorflow as tf
-import pandas as pd
 from sklearn.metrics.pairwise import euclidean_distances
-from collections import Counter
 import evaluate
+import dataset_cache
+import instrumentation
+import knn
+import sigtyp_writer
+from dataset_cache import UNKNOWN
+from feature_vocab import FIRST_VALUE, FeatureVocab
 
-class MostCommon:
-    def __init__(self, data):
-        self.global_counters = [Counter() for _ in range(data.shape[1])]
-        for lang in data:
-            for feature_idx in range(data.shape[1]):
-                if type(lang[feature_idx]) is str and lang[feature_idx] != '?':
-                    self.global_counters[feature_idx][lang[feature_idx]] += 1
-        
-    def __call__(self, x, idx):
-        return self.global_counters[idx].most_common(1)[0][0]
-
-        
 class KNN(tf.keras.callbacks.Callback):
-    def __init__(self, neighbours):
-        self.neighbours = neighbours   
-        self.x = pd.read_csv('../../data/train_x.csv').drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']).to_numpy()
-        self.x_to_predict = pd.read_csv('../../data/dev_x.csv').drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']).to_numpy()
-        self.golden = pd.read_csv('../../data/dev_y.csv').drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']).to_numpy()
-        self.most_common = MostCommon(self.x)     
-
+    """
+    Accuracy on dev of the k nearest train languages in the language embedding space, for every k of neighbours.
+    The neighbours are ranked once per evaluation (argpartition of the largest k) and the votes of all the k are
+    cumulated in one pass (knn.sweep), the evaluation runs every `every` epochs.
+    """
+    def __init__(self, neighbours, every=1):
+        self.neighbours = np.array(sorted(neighbours))
+        self.every = every
+        train = dataset_cache.read_csv('../../data/train_x.csv')
+        self.vocab = FeatureVocab.from_frames([train])
+        self.x = self.vocab.encode_frame(train)
+        x_to_predict = self.vocab.encode_frame(dataset_cache.read_csv('../../data/dev_x.csv'))
+        self.rows, self.cols = np.nonzero(x_to_predict == UNKNOWN)
+        self.golden = knn.gold_cells(self.vocab, dataset_cache.read_csv('../../data/dev_y.csv'), self.rows, self.cols)
+        self.fallback = knn.most_common(self.vocab, self.x)[0][self.cols]
+        self.size = int(self.vocab.sizes[self.cols].max(initial=FIRST_VALUE))
+        self.dev_languages = len(x_to_predict)
+
+    @instrumentation.timed('callback.knn')
     def on_epoch_end(self, epoch, logs=None):
-        results = {}
-        for n in self.neighbours:
-            train = self.model.get_layer('langs').get_weights()[0][:1125]
-            dev = self.model.get_layer('langs').get_weights()[0][1125:]
-            dist_matrix = euclidean_distances(dev, train)
-
-            self.closest = []
-            for i in dist_matrix:
-                self.closest.append(np.argsort(i)[1:])
-
-            x_to_predict = np.array(self.x_to_predict, copy=True)
-            results[n] = self.knn(n, self.x, x_to_predict, self.golden, self.closest, self.most_common)
-        
+        if (epoch + 1) % self.every:
+            return
+        embeddings = self.model.get_layer('langs').get_weights()[0]
+        train = embeddings[:len(self.x)]
+        dev = embeddings[len(self.x):len(self.x) + self.dev_languages]
+        dist_matrix = euclidean_distances(dev, train)
+
+        # the nearest train language is skipped as in the notebook, hence one more
+        k_max = min(self.neighbours.max() + 1, len(train))
+        nearest = np.argpartition(dist_matrix, k_max - 1, axis=1)[:, :k_max]
+        closest = np.take_along_axis(nearest, np.argsort(np.take_along_axis(dist_matrix, nearest, axis=1), axis=1, kind='stable'), axis=1)[:, 1:]
+        values = knn.neighbour_values(self.x, closest, np.zeros(closest.shape, dtype=bool), self.rows, self.cols)
+        correct = knn.sweep(values, self.size, self.fallback, self.golden)
+        neighbours = self.neighbours[self.neighbours <= closest.shape[1]]
+        accuracy = correct[neighbours - 1] / len(self.rows)
+
         print()
-        for n, acc in np.array(list(results.items()))[np.argsort(list(results.values()))[-10:]]:
-            print("{}: {}".format(n, acc))
+        for i in np.argsort(accuracy, kind='stable')[-10:]:
+            print("{}: {}".format(neighbours[i], accuracy[i]))
         print()
 
-    def knn(self, k, x, x_to_predict, golden, distance_matrix_sorted, fall_back):
-        tmp = np.array(x_to_predict, copy=True)
-        for i in range(len(x_to_predict)):
-            closest_langs = distance_matrix_sorted[i][:k]
-            should_fill = x_to_predict[i] == '?'
-            known = x[closest_langs][:,should_fill]
-            counters = [Counter() for _ in range(len(known[0]))]
-            for j in known:
-                for l in range(len(j)):
-                    if type(j[l]) is str and j[l] != '?':
-                        counters[l][j[l]] += 1
-        
-            for counter, idx in zip(counters, np.argwhere(should_fill==True)):
-                idx=idx[0]
-                prediction = counter.most_common(1)
-                if len(prediction) == 0:
-                    prediction = fall_back(x_to_predict[i], idx)
-                else:
-                    prediction = prediction[0][0]
-                    
-                x_to_predict[i][idx] = prediction          
-
-        acc = evaluate.evaluate(tmp, x_to_predict, golden)
-        return acc
-
 class Filler(tf.keras.callbacks.Callback):
-    def __init__(self, feature_maps, feature_maps_int):
-        self.x_to_predict = pd.read_csv('../../data/dev_x.csv').drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']).to_numpy()
-        self.golden = pd.read_csv('../../data/dev_y.csv').drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']).to_numpy()
-        self.test_x = pd.read_csv('../../data/test_x.csv').drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']).to_numpy()
+    def __init__(self, feature_maps, feature_maps_int, vocab=None):
+        self.x_to_predict = dataset_cache.read_csv('../../data/dev_x.csv').drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']).to_numpy()
+        self.golden = dataset_cache.read_csv('../../data/dev_y.csv').drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']).to_numpy()
         self.feature_maps = feature_maps
         self.feature_maps_int = feature_maps_int
+        self.vocab = vocab # FeatureVocab of the columns after the name, used for the SIGTYP submission of the test data
 
         self.best = 0
 
-        self.form = pd.read_csv('../../data/dev_x.csv')
+        self.form = dataset_cache.read_csv('../../data/dev_x.csv')
         self.columns = self.form.columns
+        # test_x.csv has an index column instead of Unnamed: 0, another order of the features and not all of them,
+        # its columns are matched to those of dev (and train) by name
+        self.test_form = dataset_cache.read_csv('../../data/test_x.csv').rename(columns={'index': 'Unnamed: 0'}).reindex(columns=self.columns)
+        self.test_x = self.test_form.drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']).to_numpy()
+        self.test_columns = list(self.test_form.columns.drop(['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes']))
 
+    @instrumentation.timed('callback.filler')
     def on_epoch_end(self, epoch, logs=None):
         result = self.fill(np.array(self.x_to_predict, copy=True), self.golden)
         print()
@@ -92,13 +80,14 @@ class Filler(tf.keras.callbacks.Callback):
 
 
         
-    def write_results(self, predicted, name):
-        form_copy = np.array(self.form.to_numpy(), copy=True)
-        result = np.concatenate([form_copy[:,:8], predicted[:,3:]], axis=1)
-        
-        result = pd.DataFrame(data=result, columns=self.columns)
-        result = result.fillna('nan')
-        result.to_csv(name, index=False)
+    @instrumentation.timed('write.csv')
+    def write_results(self, predicted, name, form=None):
+        if form is None:
+            form = self.form
+        # language columns of the form followed by the predicted features, streamed row by row
+        rows = (list(language) + list(features) for language, features in zip(form.to_numpy()[:,:8], predicted[:,3:]))
+        with open(name, 'w') as f:
+            sigtyp_writer.write_csv(f, self.columns, rows)
 
 
     def fill(self, x_to_predict, golden):
@@ -112,6 +101,7 @@ class Filler(tf.keras.callbacks.Callback):
                 lang_ids = np.array([cnt+1125]*len(possible_values))
                 # column_ids = np.array([j]*len(possible_values))
                 prob = self.model.predict_on_batch((lang_ids, possible_values))
+                instrumentation.count('model.predict_on_batch')
                 prediction = np.argmax(prob)
                 predicted_feature = possible_values[prediction]
                 x_to_predict[cnt][j] = self.feature_maps_int[j][predicted_feature]
@@ -128,9 +118,13 @@ class Filler(tf.keras.callbacks.Callback):
             self.fill_test()
         return acc
 
+    @instrumentation.timed('callback.filler.test')
     def fill_test(self):
         tmp = np.array(self.test_x, copy=True)
         fill_with_probs = np.array(self.test_x, copy=True)
+        if self.vocab is not None:
+            codes = self.vocab.encode_frame(self.test_form)
+            scores = np.full(codes.shape, np.nan)
 
         cnt = 0
         for line in self.test_x:
@@ -139,22 +133,18 @@ class Filler(tf.keras.callbacks.Callback):
                 possible_values = np.array(list(self.feature_maps[j].values()))
                 lang_ids = np.array([cnt+1208]*len(possible_values))
                 prob = self.model.predict_on_batch((lang_ids, possible_values))
+                instrumentation.count('model.predict_on_batch')
                 prediction = np.argmax(prob)
                 predicted_feature = possible_values[prediction]
                 tmp[cnt][j] = self.feature_maps_int[j][predicted_feature]
                 fill_with_probs[cnt][j] = np.max(prob)
+                if self.vocab is not None:
+                    column = self.vocab.column_index[self.test_columns[j]]
+                    codes[cnt][column] = predicted_feature - self.vocab.offsets[column] + FIRST_VALUE
+                    scores[cnt][column] = np.max(prob)
             cnt += 1
 
-        form_copy = pd.read_csv('../../data/test_x.csv').to_numpy()
-        result = np.concatenate([form_copy[:,:8], tmp[:,3:]], axis=1)
-        
-        result = pd.DataFrame(data=result, columns=self.columns)
-        result = result.fillna('nan')
-        result.to_csv('test_filled.csv', index=False)
-
-        form_copy = pd.read_csv('../../data/test_x.csv').to_numpy()
-        result = np.concatenate([form_copy[:,:8], fill_with_probs[:,3:]], axis=1)
-        
-        result = pd.DataFrame(data=result, columns=self.columns)
-        result = result.fillna('nan')
-        result.to_csv('test_filled_probs.csv', index=False)
+        self.write_results(tmp, 'test_filled.csv', self.test_form)
+        self.write_results(fill_with_probs, 'test_filled_probs.csv', self.test_form)
+        if self.vocab is not None:
+            sigtyp_writer.write_submission('test_filled.tab', self.test_form, self.vocab, codes, scores, 'test_filled-scores.csv', '../../data/test_blinded.csv')
@@ -4,15 +4,18 @@ from sklearn.cluster import KMeans
 import pickle 
 from collections import defaultdict 
 import sklearn
+import dataset_cache
+import instrumentation
+from feature_vocab import FeatureVocab
 
 class Dataset():
     def __init__(self, clusters):
-        self.train_x = pd.read_csv('../../data/train_x.csv')
-        self.train_y = pd.read_csv('../../data/train_y.csv')
-        self.dev_x = pd.read_csv('../../data/dev_x.csv')
-        self.dev_y = pd.read_csv('../../data/dev_y.csv')
+        self.train_x = dataset_cache.read_csv('../../data/train_x.csv')
+        self.train_y = dataset_cache.read_csv('../../data/train_y.csv')
+        self.dev_x = dataset_cache.read_csv('../../data/dev_x.csv')
+        self.dev_y = dataset_cache.read_csv('../../data/dev_y.csv')
         
-        self.test_x = pd.read_csv('../../data/test_x.csv')
+        self.test_x = dataset_cache.read_csv('../../data/test_x.csv')
 
         self.kmeans = self.create_kmeans(self.train_x['latitude'].to_numpy(), self.train_x['longitude'].to_numpy(), clusters)
 
@@ -27,17 +30,21 @@ class Dataset():
         self.lang_to_int = {}
         self.int_to_lang = {}
 
-        self.feature_maps = [{} for i in range(self.train_x.shape[1])]
-        self.feature_maps_int = [{} for i in range(self.train_x.shape[1])]
+        # column 0 is the language name, the vocabulary covers the other columns
+        self.vocab = FeatureVocab.for_dataset(['../../data/train_y.csv', '../../data/dev_x.csv']).with_column('cluster', range(clusters))
+        self.feature_maps = [{}]
+        self.feature_maps_int = [{}]
+        for column_id, values in enumerate(self.vocab.values):
+            global_ids = range(self.vocab.offsets[column_id], self.vocab.offsets[column_id] + len(values))
+            self.feature_maps.append(dict(zip(values, global_ids)))
+            self.feature_maps_int.append(dict(zip(global_ids, values)))
 
-        self.feature_id_to_column_id = {}
-        self.all_features = []
-        
-        self.global_feature_id = 0
-        self.train_dataset = self.create_dataset(pd.concat([self.train_y, self.dev_x]))
-        # self.train_dataset = self.create_dataset(pd.concat([self.train_y, self.test_x]))
+        self.feature_id_to_column_id = self.vocab.global_column + 1
+        self.global_feature_id = self.vocab.size
+
+        self.train_dataset, self.all_features = self.create_dataset(pd.concat([self.train_y, self.dev_x]))
+        # self.train_dataset, self.all_features = self.create_dataset(pd.concat([self.train_y, self.test_x]))
         
-        self.all_features = np.array(self.all_features)
         self.class_weights = sklearn.utils.class_weight.compute_class_weight('balanced', np.unique(self.all_features), self.all_features)
         print(self.class_weights)
 
@@ -50,32 +57,16 @@ class Dataset():
 
 
     def create_dataset(self, dataset):
-        dataset = dataset.to_numpy()
+        global_ids = self.vocab.global_ids(self.vocab.encode_frame(dataset))
 
         new_dataset = []
-        for line in dataset:
-            new_line = []
-            self.add_lang(line[0])
-            new_line.append(self.lang_to_int[line[0]])
-
-            for feature, column_id in zip(line[1:], range(1, line.shape[0])):
-                if not pd.isnull(feature) and feature != '?':
-                    self.add_feature_value(column_id,feature)
-                    new_line.append((column_id, self.feature_maps[column_id][feature]))
-            
-            new_dataset.append(np.array(new_line))
+        for lang_name, line in zip(dataset['name'], global_ids):
+            self.add_lang(lang_name)
+            column_ids = np.flatnonzero(line >= 0)
+            new_line = [self.lang_to_int[lang_name]] + list(zip(column_ids + 1, line[column_ids]))
+            new_dataset.append(np.array(new_line, dtype=object))
         
-        return np.array(new_dataset)
-                
-    def add_feature_value(self, column_id, feature_value):
-        if feature_value not in self.feature_maps[column_id]:
-            self.feature_maps[column_id][feature_value] = self.global_feature_id
-            self.feature_maps_int[column_id][self.global_feature_id] = feature_value
-            self.feature_id_to_column_id[self.global_feature_id] = column_id
-            self.global_feature_id += 1
-
-        self.all_features.append(self.feature_maps[column_id][feature_value])
-
+        return np.array(new_dataset, dtype=object), global_ids[global_ids >= 0]
 
     def add_lang(self, lang_name):
         if lang_name not in self.lang_to_int:
@@ -84,30 +75,32 @@ class Dataset():
 
     def preprocess(self, dataset):
         dataset['cluster'] = self.kmeans.predict(np.hstack([dataset['latitude'].to_numpy().reshape(-1, 1), dataset['longitude'].to_numpy().reshape(-1, 1)]))
-        return dataset.drop(columns=['Unnamed: 0', 'wals_code', 'latitude', 'longitude', 'countrycodes'])
+        # test_x.csv has an index column instead of Unnamed: 0
+        return dataset.drop(columns=['Unnamed: 0', 'index', 'wals_code', 'latitude', 'longitude', 'countrycodes'], errors='ignore')
 
     def batch_generator(self, batch_size=512):
         while True:
-            idxs = np.random.randint(0, self.train_dataset.shape[0], size=batch_size)
-            batch = []
-            for idx in idxs:
-                if np.random.uniform() < 0.5:
-                    while True:
-                        feature_id = np.random.randint(1, self.global_feature_id)
-                        column_id = self.feature_id_to_column_id[feature_id]
-                        if (column_id, feature_id) not in self.train_dataset[idx]:
-                            break
-
-                    label = 0
-                    # if np.random.uniform() < 0.05:
-                    #     label = 1
-                    batch.append((self.train_dataset[idx][0], column_id, feature_id, label, self.class_weights[feature_id]))
-                else:
-                    feature_id = np.random.randint(1, len(self.train_dataset[idx]))
-                    column_id, feature_id = self.train_dataset[idx][feature_id]
-                    label = 1
-                    # if np.random.uniform() < 0.05:
-                    #     label = 0
-                    batch.append((self.train_dataset[idx][0], column_id, feature_id, label, self.class_weights[feature_id]))
-            batch = np.array(batch)
+            with instrumentation.timer('batch.lang_embedding'):
+                idxs = np.random.randint(0, self.train_dataset.shape[0], size=batch_size)
+                batch = []
+                for idx in idxs:
+                    if np.random.uniform() < 0.5:
+                        while True:
+                            feature_id = np.random.randint(1, self.global_feature_id)
+                            column_id = self.feature_id_to_column_id[feature_id]
+                            if (column_id, feature_id) not in self.train_dataset[idx]:
+                                break
+
+                        label = 0
+                        # if np.random.uniform() < 0.05:
+                        #     label = 1
+                        batch.append((self.train_dataset[idx][0], column_id, feature_id, label, self.class_weights[feature_id]))
+                    else:
+                        feature_id = np.random.randint(1, len(self.train_dataset[idx]))
+                        column_id, feature_id = self.train_dataset[idx][feature_id]
+                        label = 1
+                        # if np.random.uniform() < 0.05:
+                        #     label = 0
+                        batch.append((self.train_dataset[idx][0], column_id, feature_id, label, self.class_weights[feature_id]))
+                batch = np.array(batch)
             yield (batch[:, 0], batch[:, 2]), batch[:, 3] # ignoring column_id
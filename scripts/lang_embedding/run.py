@@ -2,6 +2,8 @@
 from lang_embedding.model import Model
 from lang_embedding.dataset import Dataset
 
+KNN_EVERY = 1 # evaluate the KNN of the language embeddings every this many epochs
+
 for cluster in [300]:
     for embedding_size in [512]:
         for dropout in [0.5]:
@@ -15,7 +17,7 @@ for cluster in [300]:
 
             model = Model(langs_num, feature_val_num, dropout, embedding_size)
 
-            model.train(dataset.batch_generator(), 200, 1000, dataset.feature_maps, dataset.feature_maps_int)
+            model.train(dataset.batch_generator(), 200, 1000, dataset.feature_maps, dataset.feature_maps_int, dataset.vocab, KNN_EVERY)
             with open("logs.txt", "a") as myfile:
                 myfile.write('-'*50)
                 myfile.write('\n')
\ No newline at end of file
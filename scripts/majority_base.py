@@ -3,48 +3,33 @@
 
 # Rudolf Rosa
 
-import sys
-from collections import defaultdict
+# The most frequent value of every feature across all languages,
+# see count_store.CountStore.
+
+import argparse
 import csv
 
+import dataset_cache
+import predictors
+
 
 import logging
 logging.basicConfig(
     format='%(asctime)s %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S',
-    level=logging.DEBUG)
-    #level=logging.WARN)
-
-# feat -> count
-counts = defaultdict(dict)
-with open('../data/train_y.csv') as train:
-    d2 = csv.DictReader(train)
-    for dictline in d2:
-        for feat in dictline:
-            value = dictline[feat]
-            if value:
-                logging.debug('Feature {} has value {}'.format(feat, value))
-                counts[feat][value] = counts[feat].get(value, 0) + 1
-
-allfeats = list(dictline.keys())
-
-# precompute maxima
-# feat -> maxvalue
-maxes = defaultdict(dict)
-logging.info('Most frequent values across all languages, with counts')
-for feat in allfeats:
-    maxes[feat] = max(counts[feat], key=counts[feat].get)
-
-# predict
-with open('../data/dev_x.csv') as dev, open('output', 'w') as output:
-    d2 = csv.DictReader(dev)
-    outwriter = csv.DictWriter(output, allfeats)
-    outwriter.writeheader()
-    for dictline in d2:
-        for feat in dictline:
-            if dictline[feat] == '?':
-                # predict
-                dictline[feat] = maxes[feat]
-                logging.debug('Predicting {} for {}'.format(dictline[feat], feat))
-        outwriter.writerow(dictline)
-
+    level=logging.INFO)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--train', default='../data/train_y.csv', help='Train file with all the values.')
+parser.add_argument('--input', default='../data/dev_x.csv', help='File with ? in the cells to predict.')
+parser.add_argument('--output', default='output', help='Where to write the predictions.')
+args = parser.parse_args()
+
+predictor = predictors.BackoffPredictor(levels=[], alpha=0)
+predictor.fit(dataset_cache.read_csv(args.train))
+values, _ = predictor.predict(dataset_cache.read_csv(args.input))
+
+# keep the original header, pandas renames the empty index column
+with open(args.input) as f:
+    header = next(csv.reader(f))
+values.to_csv(args.output, index=False, header=header, na_rep='nan')
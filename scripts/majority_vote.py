@@ -3,86 +3,68 @@
 
 # Rudolf Rosa
 
-import sys
-from collections import defaultdict
+# Majority vote of the languages of the same family, backing off to all
+# languages; with --levels also genus and geographic zone, with smoothing.
+# See predictors.BackoffPredictor and count_store.CountStore (--store keeps
+# the train counts between the runs).
+
+import argparse
 import csv
+import os
+
+import count_store
+import dataset_cache
+import predictors
 
 
 import logging
 logging.basicConfig(
     format='%(asctime)s %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S',
-    level=logging.DEBUG)
-    #level=logging.WARN)
-
-CODE = 1
-FAM = 6
-
-# lang family -> lang code -> feature -> value
-data = defaultdict(dict)
-
-with open('../data/train_y.csv') as train:
-    d2 = csv.DictReader(train)
-    for dictline in d2:
-        code = dictline['wals_code']
-        fam = dictline['family']
-        data[fam][code] = dictline
-
-allfeats = list(dictline.keys())
-allfamilies = set(data.keys())
-
-# family -> feature -> value -> count
-counts = defaultdict(dict)
-for feat in allfeats:
-    counts[0][feat] = defaultdict(int)
-for family in allfamilies:
-    for feat in allfeats:
-        counts[family][feat] = defaultdict(int)
-    for lang in data[family]:
-        for feat in data[family][lang]:
-            value = data[family][lang][feat]
-            if value:
-                counts[family][feat][value] += 1
-                counts[0][feat][value] += 1
-
-# precompute maxima
-# family -> feat -> maxvalue
-maxes = defaultdict(dict)
-# all languages
-logging.info('Most frequent values across all languages, with counts')
-for feat in allfeats:
-    maxvalue = max(counts[0][feat], key=counts[0][feat].get)
-    maxes[0][feat] = maxvalue
-    maxcount = counts[0][feat][maxvalue]
-    logging.info(feat + ': ' + maxvalue + ' ' + str(maxcount))
-# per family
-for family in allfamilies:
-    for feat in allfeats:
-        #logging.debug(family + " " + feat)
-        if counts[family][feat]:
-            maxvalue = max(counts[family][feat], key=counts[family][feat].get)
-            assert counts[family][feat][maxvalue] != 0
-        else:
-            maxvalue = maxes[0][feat]
-        maxes[family][feat] = maxvalue
+    level=logging.INFO)
 
-# predict
+parser = argparse.ArgumentParser()
+parser.add_argument('--train', default='../data/train_y.csv', help='Train file with all the values.')
+parser.add_argument('--input', default='../data/dev_x.csv', help='File with ? in the cells to predict.')
+parser.add_argument('--output', default='output', help='Where to write the predictions.')
+parser.add_argument('--scores', help='Where to write the probabilities of the predictions.')
+parser.add_argument('--levels', nargs='*', default=['family'], choices=['genus', 'family', 'zone'],
+                    help='Backoff levels from the most specific one, all languages are always the last one.')
+parser.add_argument('--alpha', type=float, default=0, help='Smoothing towards the next level, 0 is the plain majority.')
+parser.add_argument('--min_count', type=int, default=1, help='Back off from groups with fewer values of the feature.')
+parser.add_argument('--zone_size', type=float, default=10, help='Size of the zone grid cells in degrees.')
+parser.add_argument('--store', help='Count store of the train data, built and saved here if it does not exist yet. It has to match --train, --levels and --zone_size.')
+parser.add_argument('--train_on_dev', default='no', choices=['no', 'blind'],
+                    help='blind: also count the values left visible in the input, like train_and_predict_dz.pl.')
+args = parser.parse_args()
 
-with open('../data/dev_x.csv') as dev, open('output', 'w') as output:
-    d2 = csv.DictReader(dev)
-    outwriter = csv.DictWriter(output, allfeats)
-    outwriter.writeheader()
-    for dictline in d2:
-        family = dictline['family']
-        for feat in dictline:
-            if dictline[feat] == '?':
-                # predict
-                if family in maxes:
-                    maxvalue = maxes[family][feat]
-                    logging.debug('Predicting {} for {} based on {}'.format(maxvalue, feat, family))
-                else:
-                    maxvalue = maxes[0][feat]
-                    logging.debug('Predicting {} for {}'.format(maxvalue, feat))
-                dictline[feat] = maxvalue
-        outwriter.writerow(dictline)
+dev = dataset_cache.read_csv(args.input)
+train_digest = dataset_cache.file_digest(args.train)
+if args.store and os.path.exists(args.store):
+    store = count_store.CountStore.load(args.store)
+    levels = tuple(level for level in args.levels if level != 'global') + ('global',)
+    if store.levels != levels or ('zone' in levels and store.zone_size != args.zone_size):
+        parser.error('the store {} has the levels {} and zone size {}, not those of the arguments'.format(
+            args.store, ' '.join(store.levels), store.zone_size))
+    if store.train_digest != train_digest:
+        parser.error('the store {} was not built from {}'.format(args.store, args.train))
+    logging.info('Loaded the counts of {} languages from {}'.format(len(store.languages), args.store))
+    predictor = predictors.BackoffPredictor(alpha=args.alpha, min_count=args.min_count, store=store)
+else:
+    predictor = predictors.BackoffPredictor(levels=args.levels, alpha=args.alpha, min_count=args.min_count, zone_size=args.zone_size)
+    predictor.fit(dataset_cache.read_csv(args.train))
+    if args.store:
+        predictor.store.train_digest = train_digest
+        predictor.store.save(args.store)
+if args.train_on_dev == 'blind':
+    # only the input languages are added to the counts
+    predictor.add(dev)
+values, scores = predictor.predict(dev)
+logging.info('Predicted {} values'.format(int(scores.notna().sum().sum())))
 
+# keep the original header, pandas renames the empty index column
+with open(args.input) as f:
+    header = next(csv.reader(f))
+values.to_csv(args.output, index=False, header=header, na_rep='nan')
+if args.scores:
+    scores.to_csv(args.scores, index=False, header=header, na_rep='inf')
@@ -0,0 +1,96 @@
+"""
+Vectorized masking of the known feature values, used to create the train/dev
+inputs (train_x.csv, dev_x.csv) and repeated-masking evaluations.
+
+All functions take `known`, a boolean (languages x features) matrix of the
+cells that have a value, and return a boolean (replicas x languages x
+features) matrix of the cells to hide. Only known cells are ever hidden.
+All replicas are drawn at once from one numpy Generator.
+
+    rng = np.random.default_rng(42)
+    masks = masking.make_masks(known, 100, 'exact_k', rng, k=3)
+    inputs = masking.apply_masks(codes, masks)  # UNKNOWN in the hidden cells
+"""
+import numpy as np
+
+import dataset_cache
+
+
+def bernoulli_masks(known, replicas, rng, rate=0.5):
+    """
+    Hides every known value independently with probability rate.
+    """
+    return (rng.random((replicas,) + known.shape, dtype=np.float32) < rate) & known
+
+
+def exact_k_masks(known, replicas, rng, k):
+    """
+    Hides exactly k known values of every language (all of them if the language has fewer).
+    k is a number, or an int array of shape (languages,) or (replicas, languages).
+    """
+    known_count = known.sum(axis=1)
+    k = np.minimum(np.broadcast_to(k, (replicas, known.shape[0])), known_count)
+    # random keys, unknown cells get a key larger than any random one so that they are never among the k smallest
+    keys = rng.random((replicas,) + known.shape, dtype=np.float32)
+    keys[:, ~known] = 2
+    # the (k+1)-th smallest key is the threshold, pad so that k == features does not overflow
+    sorted_keys = np.concatenate([np.sort(keys, axis=2), np.full(keys.shape[:2] + (1,), 3, dtype=np.float32)], axis=2)
+    threshold = np.take_along_axis(sorted_keys, k[:, :, np.newaxis], axis=2)
+    return keys < threshold
+
+
+def area_masks(known, replicas, rng, areas, rate=0.5):
+    """
+    Hides whole feature areas (e.g. Phonology, Word Order), every area of every language with probability rate.
+    areas is an array of shape (features,) with the area of every feature.
+    """
+    _, area_ids = np.unique(np.asarray(areas), return_inverse=True)
+    hidden_areas = rng.random((replicas, known.shape[0], area_ids.max() + 1), dtype=np.float32) < rate
+    return hidden_areas[:, :, area_ids] & known
+
+
+def matching_masks(known, replicas, rng, hidden_counts):
+    """
+    Hides k known values of every language, k is sampled from hidden_counts (e.g. from blinded_hidden_counts()),
+    so that the masks follow the same distribution of hidden values per language as the test data.
+    At least one known value is always kept visible.
+    """
+    k = rng.choice(np.asarray(hidden_counts), size=(replicas, known.shape[0]))
+    k = np.minimum(k, np.maximum(known.sum(axis=1) - 1, 0))
+    return exact_k_masks(known, replicas, rng, k)
+
+
+def blinded_hidden_counts(file_path='../data/test_blinded.csv'):
+    """
+    Returns the number of '?' values of every language in the blinded SIGTYP file.
+    """
+    import create_normalized_format
+    rows = create_normalized_format.iter_sigtyp_rows(file_path)
+    next(rows) # header
+    return np.array([np.sum(value_ids == dataset_cache.UNKNOWN) for _, _, value_ids in rows])
+
+
+SCHEMES = {
+    'bernoulli': bernoulli_masks,
+    'exact_k': exact_k_masks,
+    'area': area_masks,
+    'matching': matching_masks,
+}
+
+
+def make_masks(known, replicas=1, scheme='bernoulli', rng=None, **kwargs):
+    """
+    Creates replicas masks of the known cells with one of the SCHEMES, kwargs are passed to the scheme.
+    rng is a numpy Generator or a seed.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError('Unknown masking scheme {}, expected one of {}'.format(scheme, ', '.join(SCHEMES)))
+    rng = np.random.default_rng(rng)
+    return SCHEMES[scheme](np.asarray(known, dtype=bool), replicas, rng, **kwargs)
+
+
+def apply_masks(data, masks, unknown=dataset_cache.UNKNOWN):
+    """
+    Returns replicas copies of data with unknown in the masked cells.
+    """
+    return np.where(masks, np.asarray(unknown, dtype=data.dtype), data[np.newaxis])
@@ -3,23 +3,45 @@
 
 # Rudolf Rosa
 
+import argparse
 import sys
 import csv
 from collections import OrderedDict
 
+import numpy as np
+
+import error_analysis
+
 import logging
 logging.basicConfig(
     format='%(asctime)s %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S',
     level=logging.INFO)
 
-dev_x = csv.DictReader(open(sys.argv[1]))
-out_1 = csv.DictReader(open(sys.argv[2]))
-out_1_scores = csv.DictReader(open(sys.argv[3]))
-out_2 = csv.DictReader(open(sys.argv[4]))
-out_2_scores = csv.DictReader(open(sys.argv[5]))
-thresh_1 = float(sys.argv[6])
-thresh_2 = float(sys.argv[7])
+parser = argparse.ArgumentParser()
+parser.add_argument('files', nargs=5, help='dev_x out_1 out_1_scores out_2 out_2_scores')
+parser.add_argument('thresh_1', type=float, nargs='?')
+parser.add_argument('thresh_2', type=float, nargs='?')
+parser.add_argument('--golden_file', help='Without thresholds, use the best ones on this gold file (e.g. dev_y.csv).')
+args = parser.parse_args()
+
+if args.thresh_2 is None:
+    if args.golden_file is None:
+        parser.error('either the thresholds or --golden_file are needed')
+    # sweep all the threshold pairs at once, see compare_scores_thresh.py
+    systems = error_analysis.Systems(args.files[0], args.golden_file, args.files[1:5:2], args.files[2:5:2])
+    thresholds_1, thresholds_2, accuracy = systems.threshold_surface(0, 1)
+    i, j = np.unravel_index(np.argmax(accuracy), accuracy.shape)
+    thresh_1, thresh_2 = thresholds_1[i], thresholds_2[j]
+    logging.info('Best thresholds {} {} with accuracy {:.2%}'.format(thresh_1, thresh_2, accuracy[i, j]))
+else:
+    thresh_1, thresh_2 = args.thresh_1, args.thresh_2
+
+dev_x = csv.DictReader(open(args.files[0]))
+out_1 = csv.DictReader(open(args.files[1]))
+out_1_scores = csv.DictReader(open(args.files[2]))
+out_2 = csv.DictReader(open(args.files[3]))
+out_2_scores = csv.DictReader(open(args.files[4]))
 
 # DESCRIPTION
 # Uses out_1 if score_1 > thresh_1 and score_2 < thresh_2
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+#coding: utf-8
+
+"""
+Merges the predictions of any number of systems by their scores (the Perl
+-scores.csv files, lang_embedding_probs.csv, ...; 'none' for a system
+without scores, e.g. the MLP predictions).
+
+The merge rules are fit on dev separately for every group of features (all
+features at once, every feature, or every feature area): the base system is
+the most accurate one in the group, then the other systems greedily override
+it where their score is above a threshold and the score of the base system
+below another one, each threshold pair found at once from the gain surface
+(error_analysis.gain_surface) over the dev cells. Groups with fewer than --min_cells dev
+cells use the rule fit on all features. The rules are then applied to all the
+test cells at once.
+
+python3 merge_systems.py --group feature \
+    --dev_input ../data/dev_x.csv --dev_gold ../data/dev_y.csv \
+    --dev ../outputs/cond_prob_info_nous_latlon2d-dev.csv ../outputs/cond_prob_info_nous_latlon2d-dev-scores.csv \
+    --dev ../outputs/lang_embedding.csv ../outputs/lang_embedding_probs.csv \
+    --test_input ../data/test_x.csv \
+    --test ../outputs/cond_prob_info_nous_latlon2d-test.csv ../outputs/cond_prob_info_nous_latlon2d-test-scores.csv \
+    --test ../outputs/lang_embedding_test.csv ../outputs/lang_embedding_test_probs.csv \
+    --output ../outputs/merge-test.csv
+"""
+
+import argparse
+import csv
+import json
+
+import numpy as np
+import pandas as pd
+
+import dataset_cache
+import error_analysis
+
+import logging
+logging.basicConfig(
+    format='%(asctime)s %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+    level=logging.INFO)
+
+GLOBAL = '*'
+
+
+def fit_rule(correct, scores, min_gain=1):
+    """
+    Fits the rule of one group from the (systems, cells) correct and scores matrices of its dev cells.
+    Returns (base system, [(system, threshold, base threshold), ...]), an override uses the system where
+    its score > threshold and the score of the base system < base threshold.
+    """
+    accuracy = correct.sum(axis=1)
+    base = int(np.argmax(accuracy))
+    base_scores = base_score(scores, base)
+    current = correct[base].copy()
+    overrides = []
+    for system in np.argsort(-accuracy, kind='stable'):
+        if system == base:
+            continue
+        # the gain of every threshold pair from one sort and cumulative sum, see compare_scores_thresh.py
+        gain = correct[system].astype(np.int64) - current
+        thresholds, base_thresholds, gains = error_analysis.gain_surface(gain, scores[system], base_scores)
+        i, j = np.unravel_index(np.argmax(gains), gains.shape)
+        if gains[i, j] < min_gain:
+            continue
+        override = (int(system), float(thresholds[i]), float(base_thresholds[j]))
+        overrides.append(override)
+        used = uses(override, scores, base_scores)
+        current[used] = correct[system, used]
+    return base, overrides
+
+
+def base_score(scores, base):
+    # a base system without scores never blocks an override
+    return np.where(np.isnan(scores[base]), -np.inf, scores[base])
+
+
+def uses(override, scores, base_scores):
+    system, threshold, base_threshold = override
+    return (scores[system] > threshold) & (base_scores < base_threshold)
+
+
+def apply_rule(rule, scores):
+    """
+    Returns the chosen system of every cell given the (systems, cells) scores.
+    """
+    base, overrides = rule
+    base_scores = base_score(scores, base)
+    choice = np.full(scores.shape[1], base)
+    for override in overrides:
+        choice[uses(override, scores, base_scores)] = override[0]
+    return choice
+
+
+def cell_groups(systems, group, areas=None):
+    """
+    Name of the group of every predicted cell.
+    """
+    if group == 'global':
+        return np.full(systems.cells, GLOBAL, dtype=object)
+    names = np.asarray(systems.columns, dtype=object)[systems.cols]
+    if group == 'area':
+        names = np.array([areas.get(name, GLOBAL) for name in names], dtype=object)
+    return names
+
+
+def fit(systems, group='feature', areas=None, min_cells=20, min_gain=1):
+    """
+    Fits the rules of all the groups on the dev Systems, returns {group name: rule}, GLOBAL is the fallback.
+    """
+    rules = {GLOBAL: fit_rule(systems.correct, systems.scores, min_gain)}
+    if group != 'global':
+        groups = cell_groups(systems, group, areas)
+        names, group_ids = np.unique(groups, return_inverse=True)
+        order = np.argsort(group_ids, kind='stable')
+        bounds = np.searchsorted(group_ids[order], np.arange(len(names) + 1))
+        for g, name in enumerate(names):
+            cells = order[bounds[g]:bounds[g + 1]]
+            if name != GLOBAL and len(cells) >= min_cells:
+                rules[name] = fit_rule(systems.correct[:, cells], systems.scores[:, cells], min_gain)
+    return rules
+
+
+def merge(systems, rules, group='feature', areas=None):
+    """
+    Returns the merged codes of the predicted cells of the Systems.
+    """
+    groups = cell_groups(systems, group, areas)
+    choice = apply_rule(rules[GLOBAL], systems.scores)
+    for name, rule in rules.items():
+        if name != GLOBAL:
+            cells = groups == name
+            choice[cells] = apply_rule(rule, systems.scores[:, cells])
+    return systems.predicted[choice, np.arange(systems.cells)]
+
+
+def read_areas(args):
+    if args.areas:
+        with open(args.areas) as f:
+            return {row['feature']: row['area'] for row in csv.DictReader(f)}
+    if args.wals:
+        import wals_cldf
+        wals = wals_cldf.load_wals(args.wals)
+        return dict(zip(wals.feature_names, wals.parameters['Area']))
+    raise ValueError('--group area needs --areas or --wals')
+
+
+def write_merged(path, systems, input_file, merged):
+    frame = dataset_cache.read_csv(input_file)
+    values = frame.to_numpy(dtype=object)
+    values[systems.rows, systems.cols] = np.asarray(systems.vocab, dtype=object)[merged]
+    pd.DataFrame(values, columns=frame.columns).fillna('nan').to_csv(path, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dev_input', default='../data/dev_x.csv', help='Dev input with ? in the predicted cells.')
+    parser.add_argument('--dev_gold', default='../data/dev_y.csv', help='Dev gold values.')
+    parser.add_argument('--dev', nargs=2, action='append', metavar=('PREDICTIONS', 'SCORES'), default=[], help='Dev predictions of one system and their scores (or none).')
+    parser.add_argument('--test_input', default='../data/test_x.csv', help='Test input with ? in the predicted cells.')
+    parser.add_argument('--test', nargs=2, action='append', metavar=('PREDICTIONS', 'SCORES'), default=[], help='Test predictions of the same systems in the same order.')
+    parser.add_argument('--output', help='Where to write the merged test predictions.')
+    parser.add_argument('--group', choices=['global', 'feature', 'area'], default='feature', help='Fit the rules for all features at once, every feature or every feature area.')
+    parser.add_argument('--areas', help='CSV with feature,area columns for --group area.')
+    parser.add_argument('--wals', help='WALS CLDF folder to read the feature areas from for --group area.')
+    parser.add_argument('--min_cells', type=int, default=20, help='Groups with fewer dev cells use the rule of all features.')
+    parser.add_argument('--min_gain', type=int, default=1, help='Minimal number of dev cells an override has to fix.')
+    parser.add_argument('--rules', help='Save the fit rules to this JSON file (or load them from it if there is no --dev).')
+    args = parser.parse_args()
+    if args.test and not args.output:
+        parser.error('--test needs --output')
+
+    areas = read_areas(args) if args.group == 'area' else None
+    score_path = lambda path: None if path == 'none' else path
+
+    if args.dev:
+        dev = error_analysis.Systems(args.dev_input, args.dev_gold, [p for p, _ in args.dev], [score_path(s) for _, s in args.dev])
+        rules = fit(dev, args.group, areas, args.min_cells, args.min_gain)
+        for name, accuracy in zip(dev.names, dev.accuracy()):
+            logging.info('Dev accuracy of {}: {:.2%}'.format(name, accuracy))
+        logging.info('Dev accuracy of the merge (fit on dev): {:.2%}'.format(np.mean(merge(dev, rules, args.group, areas) == dev.gold)))
+        if args.rules:
+            with open(args.rules, 'w') as f:
+                json.dump({name: [base, overrides] for name, (base, overrides) in rules.items()}, f, indent=1)
+    elif args.rules:
+        with open(args.rules) as f:
+            rules = {name: (base, [tuple(override) for override in overrides]) for name, (base, overrides) in json.load(f).items()}
+    else:
+        parser.error('either --dev or --rules are needed')
+
+    if args.test:
+        if args.dev and len(args.test) != len(args.dev):
+            parser.error('--test needs the same systems as --dev')
+        test = error_analysis.Systems(args.test_input, None, [p for p, _ in args.test], [score_path(s) for _, s in args.test])
+        merged = merge(test, rules, args.group, areas)
+        write_merged(args.output, test, args.test_input, merged)
+        logging.info('Merged {} test cells of {} systems'.format(test.cells, len(test)))
@@ -3,10 +3,15 @@
 
 # Rudolf Rosa
 
+import os
 import sys
 import csv
 
-from sklearn.preprocessing import OneHotEncoder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy as np
+from feature_vocab import FeatureVocab, FIRST_VALUE
+from dataset_cache import UNKNOWN
+import instrumentation
 from sklearn.neural_network import MLPRegressor
 
 import logging
@@ -33,13 +38,10 @@ with open('../../data/dev_x.csv') as test:
 M='mlpr_full'
 
 import pickle
-with open('../../models/'+M+'.onehot_encoder', 'rb') as f:
-    one_hotter = pickle.load(f)
+one_hotter = FeatureVocab.load('../../models/'+M+'.vocab')
 with open('../../models/'+M+'.model', 'rb') as f:
     regressor = pickle.load(f)
 
-feat_all_values = one_hotter.categories_
-
 # How many random options to generate
 N=10000
 
@@ -49,58 +51,39 @@ N=10000
 
 # TODO measure search error versus prediction error to find best params
 
-def generate_options(line):
-    options = list()
-    for _ in range(N):
-        options.append(generate_random_option(line))
-    return options
+# the options are code vectors of the vocabulary columns (feats_all without feats_remove)
+def encode(line):
+    return np.array([one_hotter.encode_value(feat, line[feat]) for feat in one_hotter.columns], dtype=one_hotter.dtype)
 
-import random
+# randomly fill each '?', all options at once
+def generate_options(codes):
+    options = np.tile(codes, (N, 1))
+    for column in np.flatnonzero(codes == UNKNOWN):
+        options[:, column] = np.random.randint(FIRST_VALUE, one_hotter.sizes[column], size=N)
+    return options
 
-# randomly fill each '?'
-def generate_random_option(line):
+def decode(line, option):
     new_line = line.copy()
-    for position in range(len(line)):
-        feat = feats_all[position]
-        if line[feat] == '?':
-            all_values = feat_all_values[position-len(feats_remove)]  # the removed feats are not encoded
-            new_line[feat] = random.choice(all_values)
+    for column in np.flatnonzero(encode(line) == UNKNOWN):
+        new_line[one_hotter.columns[column]] = one_hotter.values[column][option[column] - FIRST_VALUE]
     return new_line
 
-# convert to onehotter input format and convert ot onehot
-def onehot(options, one_hotter):
-    options_transformed = list()
-    for option in options:
-        line = list()
-        for feat in option:
-            if feat not in feats_remove:
-                if option[feat] == 'nan':
-                    line.append('')
-                else:
-                    line.append(option[feat])
-        options_transformed.append(line)
-    return one_hotter.transform(options_transformed)
-
-def find_max(options, predictions):
-    best_option = options[0]
-    best_prediction = predictions[0]
-    for option, prediction in zip(options, predictions):
-        if prediction > best_prediction:
-            best_prediction = prediction
-            best_option = option
-    return best_option, best_prediction
-
 
 # apply
 output = list()
 preds_sum = 0
 for line in test_data:
     logging.info('Predicting values for {}'.format(line['name']))
-    all_options = generate_options(line)
+    with instrumentation.timer('mlp.generate_options'):
+        all_options = generate_options(encode(line))
     #logging.info('Generated {} options'.format(len(all_options)))
-    all_options_onehot = onehot(all_options, one_hotter)
-    predictions = regressor.predict(all_options_onehot)
-    best_option, best_prediction = find_max(all_options, predictions)
+    with instrumentation.timer('mlp.one_hot'):
+        all_options_onehot = one_hotter.one_hot(all_options)
+    with instrumentation.timer('mlp.predict'):
+        predictions = regressor.predict(all_options_onehot)
+    instrumentation.count('mlp.options', len(all_options))
+    best = np.argmax(predictions)
+    best_option, best_prediction = decode(line, all_options[best]), predictions[best]
     logging.info('Selected option with predicted accuracy {}'.format(
                 best_prediction))
     preds_sum += best_prediction
@@ -3,10 +3,13 @@
 
 # Rudolf Rosa
 
+import os
 import sys
 import csv
 
-from sklearn.preprocessing import OneHotEncoder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from feature_vocab import FeatureVocab
+import instrumentation
 from sklearn.neural_network import MLPRegressor
 
 import logging
@@ -34,8 +37,7 @@ with open('../../data/dev_x.csv') as test:
 M='mlpr_full'
 
 import pickle
-with open('../../models/'+M+'.onehot_encoder', 'rb') as f:
-    one_hotter = pickle.load(f)
+one_hotter = FeatureVocab.load('../../models/'+M+'.vocab')
 with open('../../models/'+M+'.model', 'rb') as f:
     regressor = pickle.load(f)
 
@@ -113,10 +115,14 @@ for line in test_data:
     
     # randomly try some options
     # find best random option to start with
-    all_options = generate_random_options(line)
+    with instrumentation.timer('mlp.generate_options'):
+        all_options = generate_random_options(line)
     #logging.info('Generated {} options'.format(len(all_options)))
-    all_options_onehot = onehot(all_options, one_hotter)
-    predictions = regressor.predict(all_options_onehot)
+    with instrumentation.timer('mlp.one_hot'):
+        all_options_onehot = onehot(all_options, one_hotter)
+    with instrumentation.timer('mlp.predict'):
+        predictions = regressor.predict(all_options_onehot)
+    instrumentation.count('mlp.options', len(all_options))
     best_option, best_prediction = find_max(all_options, predictions)
 
     last_best_prediction = -1
@@ -126,12 +132,17 @@ for line in test_data:
                 best_prediction))
         last_best_prediction = best_prediction
         # take best option and change individual values
-        new_options = generate_options(line, best_option)
+        with instrumentation.timer('mlp.generate_options'):
+            new_options = generate_options(line, best_option)
         logging.info('Exploring {} options'.format(
                 len(new_options)))
         # score them
-        new_options_onehot = onehot(new_options, one_hotter)
-        predictions = regressor.predict(new_options_onehot)
+        with instrumentation.timer('mlp.one_hot'):
+            new_options_onehot = onehot(new_options, one_hotter)
+        with instrumentation.timer('mlp.predict'):
+            predictions = regressor.predict(new_options_onehot)
+        instrumentation.count('mlp.options', len(new_options))
+        instrumentation.count('mlp.hillclimb_steps')
         # take best
         best_option, best_prediction = find_max(
                 new_options, predictions)
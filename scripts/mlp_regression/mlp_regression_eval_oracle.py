@@ -3,10 +3,12 @@
 
 # Rudolf Rosa
 
+import os
 import sys
 import csv
 
-from sklearn.preprocessing import OneHotEncoder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from feature_vocab import FeatureVocab
 from sklearn.neural_network import MLPRegressor
 
 import logging
@@ -38,8 +40,7 @@ with open('../../data/dev_y.csv') as test:
 M='mlpr_full'
 
 import pickle
-with open('../../models/'+M+'.onehot_encoder', 'rb') as f:
-    one_hotter = pickle.load(f)
+one_hotter = FeatureVocab.load('../../models/'+M+'.vocab')
 with open('../../models/'+M+'.model', 'rb') as f:
     regressor = pickle.load(f)
 
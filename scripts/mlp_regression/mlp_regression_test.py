@@ -5,10 +5,12 @@
 
 # artificial setup: predict accuracies
 
+import os
 import sys
 import csv
 
-from sklearn.preprocessing import OneHotEncoder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from feature_vocab import FeatureVocab
 
 import logging
 logging.basicConfig(
@@ -35,8 +37,7 @@ with open('../../data/train_regression_tail.csv') as test:
 
 # load models
 import pickle
-with open('../../models/mlpr.onehot_encoder', 'rb') as f:
-    one_hotter = pickle.load(f)
+one_hotter = FeatureVocab.load('../../models/mlpr.vocab')
 with open('../../models/mlpr.model', 'rb') as f:
     regressor = pickle.load(f)
 
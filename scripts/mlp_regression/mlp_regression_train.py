@@ -3,10 +3,12 @@
 
 # Rudolf Rosa
 
+import os
 import sys
-import csv
 
-from sklearn.preprocessing import OneHotEncoder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dataset_cache
+from feature_vocab import FeatureVocab
 
 import logging
 logging.basicConfig(
@@ -18,30 +20,20 @@ logging.basicConfig(
 # TODO encode countrycodes (set)
 # TODO handle rare values for family (if count < N, replace with RARE)
 # TODO handle rare values for genus (if count < N, replace with FAMILY_family)
-feats_remove = {'','wals_code','name','latitude','longitude','countrycodes', 'ACCURACY'}
+feats_remove = {'','Unnamed: 0','wals_code','name','latitude','longitude','countrycodes', 'ACCURACY'}
 
 # load training data 
 M='100000'
 
-train_data = list()
-train_labels = list()
-#with open('../../data/train_regression.csv') as train:
-with open('../../data/train_regression_'+M+'.csv') as train:
-    d2 = csv.DictReader(train)
-    for dictline in d2:
-        train_line = list()
-        for feat in dictline:
-            if feat not in feats_remove:
-                train_line.append(dictline[feat])        
-        train_data.append(train_line)
-        train_labels.append(float(dictline['ACCURACY']))
-
-# sklearn.preprocessing.OneHotEncoder
-one_hotter = OneHotEncoder(handle_unknown='ignore')
-one_hotter.fit(train_data)
+#train = dataset_cache.load_table('../../data/train_regression.csv')
+train = dataset_cache.load_table('../../data/train_regression_'+M+'.csv')
+train_labels = train.numeric[:, train.numeric_columns.index('ACCURACY')]
+
+# shared feature encoding, see feature_vocab.py
+one_hotter = FeatureVocab.from_tables([train], [feat for feat in train.columns if feat not in feats_remove])
 logging.debug(one_hotter.categories_)
 
-train_data_onehot = one_hotter.transform(train_data)
+train_data_onehot = one_hotter.one_hot(one_hotter.encode_table(train))
 logging.debug(train_data_onehot)
 
 # sklearn.neural_network.MLPRegressor
@@ -52,8 +44,7 @@ regressor.fit(train_data_onehot, train_labels)
 
 # save trained model
 import pickle
-with open('../../models/mlpr_'+M+'.onehot_encoder', 'wb') as f:
-    pickle.dump(one_hotter, f)
+one_hotter.save('../../models/mlpr_'+M+'.vocab')
 with open('../../models/mlpr_'+M+'.model', 'wb') as f:
     pickle.dump(regressor, f)
 
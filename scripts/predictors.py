@@ -0,0 +1,375 @@
+"""
+Common interface of the prediction methods, so that they can be driven
+programmatically (see benchmark.py and cross_validation.py).
+
+A Predictor is fit on a DataFrame in the normalized CSV format (train_y.csv)
+and predicts a masked DataFrame of the same format (dev_x.csv), returning the
+values with every '?' filled in and the scores of the predicted cells (nan
+elsewhere):
+
+    predictor = predictors.create('family_majority').fit(dataset_cache.read_csv('../data/train_y.csv'))
+    values, scores = predictor.predict(dataset_cache.read_csv('../data/dev_x.csv'))
+
+The count based methods (majority_base.py, majority_vote.py, knn.ipynb) are
+reimplemented over feature_vocab code matrices. The neural methods
+(lang_embedding, transformer, mlp_regression) train in their own scripts with
+fixed data paths, PrecomputedPredictor serves their written outputs.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+import count_store
+import create_train_dev
+import dataset_cache
+import knn
+from dataset_cache import MISSING, UNKNOWN
+from feature_vocab import FIRST_VALUE, FeatureVocab, CATEGORICAL_LANGUAGE_COLUMNS
+
+
+class Predictor:
+    name = None
+
+    def fit(self, train):
+        """
+        Fits the predictor on the DataFrame with all the known values, returns self.
+        """
+        return self
+
+    def predict(self, masked):
+        """
+        Returns (values, scores): the masked DataFrame with the '?' cells predicted (they stay '?'
+        where the predictor has no prediction) and a float DataFrame of the same shape with the scores.
+        """
+        raise NotImplementedError()
+
+
+def column_counts(codes, sizes):
+    """
+    (columns, max size) counts of the value codes of every column, MISSING and UNKNOWN are not counted.
+    """
+    counts = np.zeros((codes.shape[1], sizes.max()), dtype=np.int64)
+    np.add.at(counts, (np.broadcast_to(np.arange(codes.shape[1]), codes.shape), codes), 1)
+    counts[:, :FIRST_VALUE] = 0
+    return counts
+
+
+def best_of(counts):
+    """
+    The most frequent code of every row of counts (the first one of the ties, MISSING without counts) and its share.
+    """
+    best = counts.argmax(axis=-1)
+    total = counts.sum(axis=-1)
+    best_count = np.take_along_axis(counts, best[..., np.newaxis], axis=-1)[..., 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, best, MISSING), np.where(total > 0, best_count / total, np.nan)
+
+
+class CodedPredictor(Predictor):
+    """
+    Predictor working on feature_vocab code matrices: subclasses implement fit_codes() and predict_codes().
+    """
+    def __init__(self, vocab=None):
+        self.vocab = vocab
+
+    def fit(self, train):
+        if self.vocab is None:
+            self.vocab = FeatureVocab.from_frames([train])
+        self.fit_codes(self.vocab.encode_frame(train), train)
+        return self
+
+    def predict(self, masked):
+        codes = self.vocab.encode_frame(masked)
+        predicted, scores = self.predict_codes(codes, masked)
+        return self.to_frames(masked, codes, predicted, scores)
+
+    def fit_codes(self, codes, frame):
+        raise NotImplementedError()
+
+    def predict_codes(self, codes, frame):
+        """
+        Returns the (rows, columns) predicted codes and scores of the UNKNOWN cells of codes.
+        """
+        raise NotImplementedError()
+
+    def to_frames(self, masked, codes, predicted, scores):
+        values = masked.copy()
+        score_frame = pd.DataFrame(np.nan, index=masked.index, columns=masked.columns)
+        for j, column in enumerate(self.vocab.columns):
+            if column not in masked.columns:
+                continue
+            cells = (codes[:, j] == UNKNOWN) & (predicted[:, j] >= FIRST_VALUE)
+            if not cells.any():
+                continue
+            values[column] = values[column].astype(object)
+            values.loc[cells, column] = self.vocab.decode_column(j, predicted[cells, j])
+            score_frame.loc[cells, column] = scores[cells, j]
+        return values, score_frame
+
+
+class MajorityPredictor(CodedPredictor):
+    """
+    The most frequent train value of every feature (majority_base.py), scored by its relative frequency.
+    """
+    name = 'majority'
+
+    def fit_codes(self, codes, frame):
+        self.best, self.share = best_of(column_counts(codes, self.vocab.sizes))
+
+    def predict_codes(self, codes, frame):
+        shape = codes.shape
+        return np.broadcast_to(self.best, shape), np.broadcast_to(self.share, shape)
+
+
+class GroupMajorityPredictor(CodedPredictor):
+    """
+    The most frequent train value of every feature among the languages of the same group (family,
+    majority_vote.py), the global one for the groups without the feature or unseen in train.
+    """
+    name = 'family_majority'
+
+    def __init__(self, vocab=None, group='family'):
+        super().__init__(vocab)
+        self.group = group
+
+    def fit_codes(self, codes, frame):
+        group = codes[:, self.vocab.column_index[self.group]].astype(np.int64)
+        columns = codes.shape[1]
+        counts = np.zeros((self.vocab.sizes[self.vocab.column_index[self.group]], columns, self.vocab.sizes.max()), dtype=np.int64)
+        np.add.at(counts, (group[:, np.newaxis], np.arange(columns), codes), 1)
+        counts[:, :, :FIRST_VALUE] = 0
+        self.global_best, self.global_share = best_of(counts.sum(axis=0))
+        self.best, self.share = best_of(counts)
+
+    def predict_codes(self, codes, frame):
+        group = codes[:, self.vocab.column_index[self.group]].astype(np.int64)
+        best, share = self.best[group], self.share[group]
+        fallback = best == MISSING
+        return np.where(fallback, self.global_best, best), np.where(fallback, self.global_share, share)
+
+
+class KnnPredictor(CodedPredictor):
+    """
+    Vote of the k nearest train languages (knn.ipynb, see knn.py) by the masked Hamming distance of the code vectors,
+    where missing and unknown values always differ, or by the overlap distance. A language never votes for itself
+    (the same wals_code). Cells without votes fall back to the most common value of the feature (the ties of both
+    broken like Counter.most_common of the notebook). Scored by the share of the votes.
+    """
+    name = 'knn'
+
+    def __init__(self, vocab=None, k=10, metric='hamming'):
+        super().__init__(vocab)
+        self.k = k
+        self.metric = metric
+
+    def fit_codes(self, codes, frame):
+        self.train = np.asarray(codes, dtype=np.int64)
+        self.train_frame = frame
+        self.fallback, self.fallback_share = knn.most_common(self.vocab, self.train)
+
+    def predict_codes(self, codes, frame):
+        order, excluded = knn.neighbours(knn.distances(self.vocab, codes, self.train, self.metric), knn.same_language(frame, self.train_frame))
+        rows, cols = np.nonzero(codes == UNKNOWN)
+        best, share = knn.vote(knn.neighbour_values(self.train, order, excluded, rows, cols, self.k), int(self.vocab.sizes[cols].max(initial=FIRST_VALUE)))
+        predicted = np.broadcast_to(self.fallback, codes.shape).copy()
+        scores = np.broadcast_to(self.fallback_share, codes.shape).copy()
+        voted = best != MISSING
+        predicted[rows[voted], cols[voted]] = best[voted]
+        scores[rows[voted], cols[voted]] = share[voted]
+        return predicted, scores
+
+
+class BackoffPredictor(CodedPredictor):
+    """
+    Hierarchical backoff over the (group, feature, value) count tensors of a count_store.CountStore with the levels
+    (genus, family, zone, i.e. a latitude/longitude grid cell of zone_size degrees, and always global at the end).
+    The value distribution of a cell is smoothed from the uniform one through the global level up to the most specific
+    one, p = (counts + alpha * p_next) / (total + alpha), a level whose group has fewer than min_count values of the
+    feature is skipped. With alpha=0 and min_count=1 this is the plain majority of the first level with the feature,
+    read from the cached majorities of the store. Scored by the probability of the predicted value.
+    Languages can be added to or removed from the counts (add() and remove()) without refitting.
+    """
+    name = 'backoff'
+
+    def __init__(self, vocab=None, levels=('genus', 'family', 'zone'), alpha=1.0, min_count=1, zone_size=10.0, store=None):
+        super().__init__(vocab if store is None else store.vocab)
+        self.levels = levels
+        self.alpha = alpha
+        self.min_count = max(min_count, 1)
+        self.zone_size = zone_size
+        self.store = store
+
+    def fit_codes(self, codes, frame):
+        self.store = count_store.CountStore.build(self.vocab, self.levels, codes, frame, self.zone_size)
+
+    def add(self, frame):
+        self.store.add(self.vocab.encode_frame(frame), frame)
+
+    def remove(self, frame):
+        self.store.remove(self.vocab.encode_frame(frame), frame)
+
+    def distributions(self, codes, frame, rows, cols):
+        """
+        (cells, values) smoothed value distributions of the cells given by rows and cols.
+        """
+        store = self.store
+        values = np.arange(store.values)
+        sizes = self.vocab.sizes[cols][:, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = ((values >= FIRST_VALUE) & (values < sizes)) / (sizes - FIRST_VALUE)
+            for level, counts in reversed(list(zip(store.levels, store.counts))):
+                cell_counts = counts[store.groups(level, codes, frame)[rows], cols]
+                total = cell_counts.sum(axis=1, keepdims=True)
+                p = np.where(total >= self.min_count, (cell_counts + self.alpha * p) / (total + self.alpha), p)
+        return np.nan_to_num(p)
+
+    def predict_codes(self, codes, frame):
+        rows, cols = np.nonzero(codes == UNKNOWN)
+        if self.alpha == 0 and self.min_count == 1:
+            best, confidence = self.store.majority(codes, frame, rows, cols)
+        else:
+            p = self.distributions(codes, frame, rows, cols)
+            best = p.argmax(axis=1)
+            confidence = p[np.arange(len(best)), best]
+        predicted = np.array(codes, copy=True)
+        predicted[rows, cols] = best
+        scores = np.full(codes.shape, np.nan)
+        scores[rows, cols] = confidence
+        return predicted, scores
+
+
+class GeoKnnPredictor(CodedPredictor):
+    """
+    Areal vote: every cell is predicted by the k nearest train languages having the feature, by the great-circle
+    distance on a haversine BallTree built once in fit, with the weight 1 / (distance + distance_scale) km. The list
+    of the neighbours_searched nearest languages is queried once per language (and cached by its coordinates) and
+    serves all its features, the votes of all the query languages are counted in batches. Cells without a vote in
+    the list fall back to the majority value.
+    Scored by the share of the winning weight. A language never votes for itself (the same wals_code).
+    """
+    name = 'geo_knn'
+
+    def __init__(self, vocab=None, k=10, distance_scale=100.0, neighbours_searched=300, batch_cells=50000000):
+        super().__init__(vocab)
+        self.k = k
+        self.distance_scale = distance_scale
+        self.neighbours_searched = neighbours_searched
+        self.batch_cells = batch_cells
+        self.neighbour_cache = {}
+
+    def fit_codes(self, codes, frame):
+        from sklearn.neighbors import BallTree
+        self.train = np.asarray(codes, dtype=np.int64)
+        # genus and family are never predicted, leaving them out keeps the value axis short
+        self.features = np.ones(len(self.vocab), dtype=bool)
+        self.features[[self.vocab.column_index[column] for column in CATEGORICAL_LANGUAGE_COLUMNS if column in self.vocab.column_index]] = False
+        self.values = int(self.vocab.sizes[self.features].max())
+        self.train_values = np.where(self.features & (self.train >= FIRST_VALUE), self.train, MISSING)
+        self.train_languages = frame['wals_code'].to_numpy(dtype=object)
+        self.tree = BallTree(np.radians(self.coordinates(frame)), metric='haversine')
+        self.neighbour_cache = {}
+        self.majority = MajorityPredictor(self.vocab)
+        self.majority.fit_codes(codes, frame)
+
+    @staticmethod
+    def coordinates(frame):
+        return np.nan_to_num(frame[['latitude', 'longitude']].to_numpy(dtype=np.float64))
+
+    def neighbours(self, frame):
+        """
+        (languages, neighbours_searched) indices of the nearest train languages sorted by the distance and their distances in km.
+        """
+        keys = [tuple(point) for point in self.coordinates(frame)]
+        missing = [key for key in dict.fromkeys(keys) if key not in self.neighbour_cache]
+        if missing:
+            distances, indices = self.tree.query(np.radians(missing), k=min(self.neighbours_searched, len(self.train)))
+            for key, row_indices, row_distances in zip(missing, indices, distances * create_train_dev.EARTH_RADIUS):
+                self.neighbour_cache[key] = (row_indices, row_distances)
+        indices = np.stack([self.neighbour_cache[key][0] for key in keys])
+        distances = np.stack([self.neighbour_cache[key][1] for key in keys])
+        return indices, distances
+
+    def votes(self, codes, frame):
+        """
+        (languages, columns, values) distance weighted votes of the k nearest train languages having the feature.
+        """
+        indices, distances = self.neighbours(frame)
+        # the language itself does not vote
+        itself = self.train_languages[indices] == frame['wals_code'].to_numpy(dtype=object)[:, np.newaxis]
+        columns = codes.shape[1]
+        votes = np.zeros((len(codes), columns, self.values))
+        batch = max(1, self.batch_cells // (indices.shape[1] * columns))
+        for start in range(0, len(codes), batch):
+            end = min(start + batch, len(codes))
+            values = self.train_values[indices[start:end]] # (batch, neighbours, columns)
+            values[itself[start:end]] = MISSING
+            known = values != MISSING
+            use = known & (np.cumsum(known, axis=1) <= self.k)
+            weights = np.broadcast_to((1 / (distances[start:end] + self.distance_scale))[:, :, np.newaxis], use.shape)
+            rows = np.broadcast_to(np.arange(end - start)[:, np.newaxis, np.newaxis], use.shape)
+            cells = ((rows * columns + np.arange(columns)) * self.values + values)[use]
+            votes[start:end] = np.bincount(cells, weights=weights[use], minlength=(end - start) * columns * self.values).reshape(end - start, columns, self.values)
+        return votes
+
+    def predict_codes(self, codes, frame):
+        votes = self.votes(codes, frame)
+        best = votes.argmax(axis=2)
+        total = votes.sum(axis=2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = np.take_along_axis(votes, best[:, :, np.newaxis], axis=2)[:, :, 0] / total
+        fallback, fallback_share = self.majority.predict_codes(codes, frame)
+        missing = total == 0
+        return np.where(missing, fallback, best), np.where(missing, fallback_share, share)
+
+
+class PrecomputedPredictor(Predictor):
+    """
+    Serves the written predictions (and scores, e.g. lang_embedding_probs.csv or the -scores.csv files) of a method
+    trained by its own script. The languages are matched by wals_code and the columns by name, the rows of
+    the scores are those of the predictions.
+    """
+    def __init__(self, name, predictions, scores=None):
+        self.name = name
+        self.predictions = predictions
+        self.scores = scores
+
+    def predict(self, masked):
+        predictions = dataset_cache.read_csv(self.predictions).set_index('wals_code')
+        unknown = masked == '?'
+        values, scores = masked.copy(), pd.DataFrame(np.nan, index=masked.index, columns=masked.columns)
+        columns = [column for column in masked.columns if column in predictions.columns and unknown[column].any()]
+        rows = predictions.index.get_indexer(masked['wals_code'])
+        found = rows >= 0
+        if self.scores is not None:
+            # the score files have no language columns, their rows are those of the predictions
+            table = dataset_cache.load_table(self.scores)
+            score_matrix = pd.DataFrame(table.score_matrix(), columns=table.columns)
+        for column in columns:
+            cells = unknown[column].to_numpy() & found
+            values[column] = values[column].astype(object)
+            values.loc[cells, column] = predictions[column].to_numpy()[rows[cells]]
+            if self.scores is not None and column in score_matrix.columns:
+                scores.loc[cells, column] = score_matrix[column].to_numpy()[rows[cells]]
+        return values, scores
+
+
+PREDICTORS = {
+    'majority': MajorityPredictor,
+    'family_majority': GroupMajorityPredictor,
+    'genus_majority': functools.partial(GroupMajorityPredictor, group='genus'),
+    'knn': KnnPredictor,
+    'backoff': BackoffPredictor,
+    'geo_knn': GeoKnnPredictor,
+}
+
+
+def create(name, **kwargs):
+    """
+    Creates one of the PREDICTORS by its name.
+    """
+    if name not in PREDICTORS:
+        raise ValueError('Unknown predictor {}, expected one of {}'.format(name, ', '.join(PREDICTORS)))
+    predictor = PREDICTORS[name](**kwargs)
+    predictor.name = name
+    return predictor
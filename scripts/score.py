@@ -1,13 +1,28 @@
 #!/usr/bin/env python3
 
 from collections import defaultdict, Counter
+import argparse
+import csv
+import functools
+import json
+import multiprocessing
 import os.path
-import sys
+import re
+
+import numpy as np
 
 
 DATA_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")) + "/"
 MISSING = defaultdict(lambda: defaultdict(lambda: set()))
 
+# Values containing TAB come either glued to the next feature or followed by "|" and the rest
+# of the value, one compiled pattern repairs both in a single pass over the feature string.
+TAB_VALUE_RE = re.compile(r"double negation(\|(?:Word|Prefix)&NoDoubleNeg|(?=[A-Z]))")
+
+
+def repair_tab_value(match):
+    return "double negation" if match.group(1) else "double negation|"
+
 
 class Sample:
     def __init__(self, line):
@@ -46,38 +61,11 @@ class Sample:
             "controlled_genus": genus if genus in FileTriple.controlled_genera else FileTriple.controlled_genera[-1],
         }
         self.features = {
-            k.lower(): v.split()[0]
-            for k, v in [
-                kv.split("=")
-                for kv in (
-                    "|".join(feature_pieces)
-                    .replace(
-                        "double negationPosition_of_negative",
-                        "double negation|Position_of_negative",
-                    )
-                    .replace(
-                        "double negationSVONeg_Order",
-                        "double negation|SVONeg_Order",
-                    )
-                    .replace(
-                        "double negationSNegVO_Order",
-                        "double negation|SNegVO_Order",
-                    )
-                    .replace(
-                        "double negationPreverbal_Negative",
-                        "double negation|Preverbal_Negative",
-                    )
-                    .replace(
-                        "1 Separate word, no double negation|Word&NoDoubleNeg",
-                        "1 Separate word, no double negation",
-                    )
-                    .replace(
-                        "2 Prefix, no double negation|Prefix&NoDoubleNeg",
-                        "2 Prefix, no double negation",
-                    )
-                    .replace(" (= ", " (EQUALS ")
-                ).split("|")
-            ]
+            k.lower(): v.split(None, 1)[0]
+            for k, _, v in (
+                kv.partition("=")
+                for kv in TAB_VALUE_RE.sub(repair_tab_value, "|".join(feature_pieces)).split("|")
+            )
         }
         assert all([v == "?" or v == str(int(v)) for v in self.features.values()])
 
@@ -111,6 +99,17 @@ class TestFile:
                         assert self.genus2family[s.lang["genus"]] == s.lang["family"]
             self.lang_values = dict(self.lang_values)
             self.available_feature_values = dict(self.available_feature_values)
+        self.groups = {}
+
+    def group_ids(self, kind, field_name):
+        """Names of the groups of a lang or features field and the group id of every sample (-1 if it has no value)."""
+        if (kind, field_name) not in self.groups:
+            names = list((self.lang_values if kind == "lang" else self.available_feature_values)[field_name])
+            index = {name: i for i, name in enumerate(names)}
+            fields = [getattr(s, kind) for s in self.id2sample.values()]
+            ids = np.array([index[f[field_name]] if field_name in f else -1 for f in fields], dtype=np.int64)
+            self.groups[kind, field_name] = names, ids
+        return self.groups[kind, field_name]
 
 
 def average(scorepairs, mode):
@@ -127,17 +126,46 @@ def average(scorepairs, mode):
         raise ValueError(f"Illegal averaging mode {mode}")
 
 
+def grouped_average(group_ids, groups, numerators, denominators, mode):
+    """The same as average() for every group at once, samples with group id -1 are left out."""
+    selected = group_ids >= 0
+    group_ids, numerators, denominators = group_ids[selected], numerators[selected], denominators[selected]
+    counts = np.bincount(group_ids, minlength=groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if mode == "micro" or mode == "single":
+            if mode == "single" and np.any(counts != 1):
+                raise ValueError("Averaging mode single needs exactly one sample per group")
+            numerator = np.bincount(group_ids, weights=numerators, minlength=groups)
+            denominator = np.bincount(group_ids, weights=denominators, minlength=groups)
+            return np.where(denominator > 0, numerator / np.where(denominator > 0, denominator, 1), np.nan)
+        elif mode == "macro":
+            ratios = numerators / np.where(denominators > 0, denominators, np.nan)
+            return np.bincount(group_ids, weights=ratios, minlength=groups) / counts
+        else:
+            raise ValueError(f"Illegal averaging mode {mode}")
+
+
+@functools.lru_cache(maxsize=None)
+def read_reference(data_path=DATA_PATH):
+    """Parses the gold and blinded test files once, the blinded samples keep only the "?" features."""
+    gold = TestFile(data_path + "test_gold.csv")
+    mask = TestFile(data_path + "test_blinded.csv")
+    for s in mask.id2sample.values():
+        for k in [k for k, v in s.features.items() if v != "?"]:
+            del s.features[k]
+    return gold, mask
+
+
 class FileTriple:
     controlled_genera = sorted(["Mayan", "Tucanoan", "Madang", "Mahakiranti", "Northern Pama-Nyungan", "Nilotic", "other genera"])
 
-    def __init__(self, participant_filename):
+    def __init__(self, participant_filename, data_path=DATA_PATH):
         self.name = os.path.basename(participant_filename).replace('.tsv', '')
-        self.gold = TestFile(DATA_PATH + "test_gold.csv")
-        self.mask = TestFile(DATA_PATH + "test_blinded.csv")
+        self.gold, self.mask = read_reference(data_path)
         self.pred = TestFile(participant_filename)
-        for s in self.mask.id2sample.values():
-            for k in [k for k, v in s.features.items() if v != "?"]:
-                del s.features[k]
+        # every gold sample is scored once, all the breakdowns are grouped reductions of these
+        scores = np.array([self.score_sample(s) for s in self.gold.id2sample.values()], dtype=np.int64).reshape(-1, 2)
+        self.numerators, self.denominators = scores[:, 0], scores[:, 1]
 
     def score_sample(self, s):
         i = s.lang["id"]
@@ -163,34 +191,31 @@ class FileTriple:
                     MISSING[self.name][i].add(k)
         return numerator, denominator
 
-    def accuracy_per_field(self, name_container, get_field, field_name, mode):
-        return sorted(
-            [
-                (
-                    name,
-                    average(
-                        [
-                            self.score_sample(s)
-                            for s in self.gold.id2sample.values()
-                            if field_name in get_field(s)
-                            and get_field(s)[field_name] == name
-                        ],
-                        mode,
-                    ),
-                )
-                for name in name_container[field_name]
-            ]
-        )
+    def accuracy(self, mode):
+        return float(grouped_average(np.zeros(len(self.numerators), dtype=np.int64), 1, self.numerators, self.denominators, mode)[0])
+
+    def accuracy_per_field(self, kind, field_name, mode):
+        names, group_ids = self.gold.group_ids(kind, field_name)
+        accuracies = grouped_average(group_ids, len(names), self.numerators, self.denominators, mode)
+        return sorted(zip(names, accuracies.tolist()))
+
+    def accuracy_per_feature(self):
+        """Accuracy of the predictions of every feature over all languages."""
+        numerators, denominators = Counter(), Counter()
+        for i, mask in self.mask.id2sample.items():
+            feats_mask = mask.features
+            feats_gold = self.gold.id2sample[i].features
+            feats_pred = self.pred.id2sample[i].features if i in self.pred.id2sample else {}
+            for k in feats_mask:
+                denominators[k] += 1
+                numerators[k] += feats_pred.get(k) == feats_gold[k]
+        return sorted((k, numerators[k] / denominators[k]) for k in denominators)
 
     def accuracy_per_lang_field(self, field_name, mode):
-        return self.accuracy_per_field(
-            self.gold.lang_values, lambda s: s.lang, field_name, mode
-        )
+        return self.accuracy_per_field("lang", field_name, mode)
 
     def accuracy_per_feature_field(self, field_name, mode):
-        return self.accuracy_per_field(
-            self.gold.available_feature_values, lambda s: s.features, field_name, mode
-        )
+        return self.accuracy_per_field("features", field_name, mode)
 
     def print_accuracies(self):
         print("Accuracies per language:")
@@ -210,35 +235,89 @@ class FileTriple:
                     print(f"{name}\t{acc:.4f}")
 
 
-filetriples = [FileTriple(filename) for filename in sys.argv[1:]]
-ex = filetriples[0]
+def score_record(participant_filename, data_path=DATA_PATH):
+    """Scores one submission, returns a JSON serializable record."""
+    triple = FileTriple(participant_filename, data_path)
+    missing = MISSING[triple.name]
+    return {
+        "submission": triple.name,
+        "filename": participant_filename,
+        "overall": triple.accuracy("micro"),
+        "controlled_genus": dict(triple.accuracy_per_lang_field("controlled_genus", "micro")),
+        "features": dict(triple.accuracy_per_feature()),
+        "missing_features": sum(len(features) for features in missing.values()),
+        "missing_languages": len(missing),
+    }
+
 
-for mode in ("micro",):  #, "macro"):
-    print("\n# Averaging:", mode, "\n")
-    print("submission", *ex.controlled_genera, sep="\t")
-    print("number of languages", *[len([s for s in ex.mask.id2sample.values() if s.lang["controlled_genus"] == g]) for g in ex.controlled_genera], sep="\t")
-    for triple in filetriples:
-        print(triple.name, *[
-            acc for _, acc in triple.accuracy_per_lang_field("controlled_genus", mode)
-        ], sep="\t")
+def init_worker(data_path):
+    # forked workers inherit the parsed reference, spawned ones parse it once here
+    read_reference(data_path)
+
+
+def score_many(filenames, data_path=DATA_PATH, jobs=None):
+    """Scores the submissions in a process pool, returns their records in the order of filenames."""
+    read_reference(data_path)
+    if jobs == 1 or len(filenames) <= 1:
+        return [score_record(filename, data_path) for filename in filenames]
+    with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(data_path,)) as pool:
+        return pool.map(functools.partial(score_record, data_path=data_path), filenames)
+
+
+def write_json(records, filename):
+    with open(filename, "w") as f:
+        for record in records:
+            print(json.dumps(record), file=f)
+
+
+def write_csv(records, filename):
+    """One row per submission, the controlled genus and feature accuracies are flattened to their own columns."""
+    rows = []
+    for record in records:
+        row = {k: v for k, v in record.items() if not isinstance(v, dict)}
+        for group in ("controlled_genus", "features"):
+            row.update({f"{group}:{name}": acc for name, acc in record[group].items()})
+        rows.append(row)
+    fieldnames = list(dict.fromkeys(k for row in rows for k in row))
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_report(records, data_path=DATA_PATH):
+    _, mask = read_reference(data_path)
+    controlled_genera = FileTriple.controlled_genera
+    print("\n# Averaging:", "micro", "\n")
+    print("submission", *controlled_genera, sep="\t")
+    print("number of languages", *[len([s for s in mask.id2sample.values() if s.lang["controlled_genus"] == g]) for g in controlled_genera], sep="\t")
+    for record in records:
+        print(record["submission"], *record["controlled_genus"].values(), sep="\t")
     print("\noverall:")
-    for triple in filetriples:
-        print(
-            triple.name,
-            average(
-                [
-                    triple.score_sample(s)
-                    for s in triple.gold.id2sample.values()
-                ],
-                mode,
-            ),
-            sep="\t"
-        )
-
-
-print("\n# Errors\n")
-for triple in filetriples:
-    missing_features = 0
-    if MISSING[triple.name]:
-        broken_langs = [(lang, len(MISSING[triple.name][lang])) for lang in MISSING[triple.name]]
-        print(f"{triple.name} missing {sum([c for _, c in broken_langs])}/2417 features in {len(broken_langs)}/149 languages!")
+    for record in records:
+        print(record["submission"], record["overall"], sep="\t")
+
+    print("\n# Errors\n")
+    for record in records:
+        if record["missing_languages"]:
+            print(f"{record['submission']} missing {record['missing_features']}/2417 features in {record['missing_languages']}/149 languages!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("submissions", nargs="+", help="Submission files in the SIGTYP format.")
+    parser.add_argument("--data_path", default=DATA_PATH, help="Folder with test_gold.csv and test_blinded.csv.")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument("--json", help="Write one JSON record per submission to this file.")
+    parser.add_argument("--csv", help="Write one CSV row per submission to this file.")
+    parser.add_argument("--quiet", action="store_true", help="Do not print the text report.")
+    args = parser.parse_args()
+
+    data_path = os.path.join(args.data_path, "")
+    records = score_many(args.submissions, data_path, args.jobs)
+    if args.json:
+        write_json(records, args.json)
+    if args.csv:
+        write_csv(records, args.csv)
+    if not args.quiet:
+        print_report(records, data_path)
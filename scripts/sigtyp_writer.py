@@ -0,0 +1,155 @@
+"""
+Streaming writers of predictions given as code matrices (see feature_vocab).
+
+write_submission() emits the SIGTYP submission format directly, i.e. the same
+output as convert_prediction_to_sigtyp.pl:
+
+    wals_code<TAB>name<TAB>family<TAB>feature=value|feature=value...
+
+with lowercased feature names, and optionally the matching -scores.csv in the
+format of Sigtypio::write_scores ('inf' where there is no score). The
+'feature=value' strings are built once per vocabulary, every line is then
+only a join of the looked up tokens. fill_blinded() keeps the languages and
+the feature order of the blinded file and replaces only its '?' values, like
+the Perl script does.
+"""
+import csv
+
+import numpy as np
+
+import create_normalized_format
+import instrumentation
+from dataset_cache import MISSING
+from feature_vocab import CATEGORICAL_LANGUAGE_COLUMNS
+
+SUBMISSION_HEADER = ['wals_code', 'name', 'family', 'features']
+# values containing TAB, in test_blinded.csv the part after the TAB and the '|' are missing
+TAB_VALUES = {
+    'Verb-Initial_with_Preverbal_Negative=1 Separate word, no double negation': 'Word&NoDoubleNeg',
+    'Verb-Initial_with_Preverbal_Negative=2 Prefix, no double negation': 'Prefix&NoDoubleNeg',
+}
+
+
+def feature_tokens(vocab, lowercase=True):
+    """
+    For every vocabulary column an object array code -> 'feature=value' ('' for MISSING).
+    """
+    tokens = []
+    for column, values in zip(vocab.columns, vocab.values):
+        name = column.lower() if lowercase else column
+        tokens.append(np.array([''] + ['{}={}'.format(name, value) for value in ['?'] + values], dtype=object))
+    return tokens
+
+
+def feature_columns(vocab):
+    """
+    Vocabulary columns that are WALS features (not genus or family).
+    """
+    return [j for j, column in enumerate(vocab.columns) if column not in CATEGORICAL_LANGUAGE_COLUMNS]
+
+
+def iter_feature_strings(vocab, codes, columns=None, lowercase=True):
+    """
+    Yields the '|' separated features of every row of the code matrix, MISSING cells are left out.
+    """
+    if columns is None:
+        columns = feature_columns(vocab)
+    tokens = feature_tokens(vocab, lowercase)
+    for row in np.asarray(codes):
+        yield '|'.join(tokens[j][row[j]] for j in columns if row[j] != MISSING)
+
+
+def write_sigtyp(file, languages, vocab, codes, header=SUBMISSION_HEADER, lowercase=True):
+    """
+    Writes the SIGTYP lines, languages is an iterable of the leading fields of every line
+    (e.g. (wals_code, name, family) for the submission format).
+    """
+    print('\t'.join(header), file=file)
+    for fields, features in zip(languages, iter_feature_strings(vocab, codes, lowercase=lowercase)):
+        print('\t'.join(fields), features, sep='\t', file=file)
+
+
+def split_features(features):
+    """
+    Splits the feature string of a SIGTYP line to 'feature=value' items, repairs the values containing TAB.
+    """
+    first, tab, rest = features.partition('\t')
+    if tab:
+        for prefix, tail in TAB_VALUES.items():
+            if first.endswith(prefix) and not rest.startswith(tail):
+                first += '\t' + tail
+                tab = '|'
+        features = first + tab + rest
+    return features.split('|')
+
+
+def iter_filled_lines(blinded_path, wals_codes, vocab, codes, lowercase=True):
+    """
+    Yields (wals_code, name, family, features) of every language of the blinded SIGTYP file with the '?' values
+    replaced by the predictions, i.e. the code matrix rows of the same wals_codes. '?' stays where there is no prediction.
+    """
+    rows = {wals_code: i for i, wals_code in enumerate(wals_codes)}
+    values = [np.array(['?', '?'] + column_values, dtype=object) for column_values in vocab.values]
+    with create_normalized_format.open_sigtyp(blinded_path) as f:
+        next(f) # header
+        for line in f:
+            main_features, features = create_normalized_format.split_line(line.rstrip('\r\n'))
+            i = rows.get(main_features[0])
+            filled = []
+            for feature in split_features(features):
+                name, _, value = feature.partition('=')
+                if value == '?' and i is not None and name in vocab.column_index:
+                    j = vocab.column_index[name]
+                    value = values[j][codes[i][j]]
+                filled.append('{}={}'.format(name.lower() if lowercase else name, value))
+            yield main_features[0], main_features[1], main_features[5], '|'.join(filled)
+
+
+def fill_blinded(path, blinded_path, wals_codes, vocab, codes):
+    """
+    Writes the blinded SIGTYP file completed with the predictions in the submission format.
+    """
+    with open(path, 'w') as f:
+        print('\t'.join(SUBMISSION_HEADER), file=f)
+        for fields in iter_filled_lines(blinded_path, wals_codes, vocab, codes):
+            print('\t'.join(fields), file=f)
+
+
+def write_scores(file, columns, vocab, scores):
+    """
+    Writes the scores of the vocabulary columns as a CSV with the given columns, 'inf' where there is no score (nan).
+    """
+    positions = [vocab.column_index.get(column) for column in columns]
+    writer = csv.writer(file, lineterminator='\n')
+    writer.writerow(columns)
+    for row in np.asarray(scores, dtype=np.float64):
+        writer.writerow(['inf' if j is None or np.isnan(row[j]) else repr(float(row[j])) for j in positions])
+
+
+def write_csv(file, columns, rows):
+    """
+    Streams rows to a CSV file with nan written as 'nan', like DataFrame.fillna('nan').to_csv(index=False).
+    """
+    writer = csv.writer(file, lineterminator='\n')
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(['nan' if value is None or (isinstance(value, float) and np.isnan(value)) else value for value in row])
+
+
+@instrumentation.timed('write.submission')
+def write_submission(path, languages, vocab, codes, scores=None, scores_path=None, blinded_path=None):
+    """
+    Writes the SIGTYP submission file of the predicted code matrix (rows of the languages DataFrame,
+    columns of the vocabulary). With blinded_path, only the '?' values of the blinded file are filled in,
+    otherwise all the non-missing values are written. If scores_path is given, the (rows, vocabulary columns)
+    scores are written as -scores.csv with the columns of the languages DataFrame.
+    """
+    if blinded_path is not None:
+        fill_blinded(path, blinded_path, languages['wals_code'], vocab, codes)
+    else:
+        fields = languages[['wals_code', 'name', 'family']].fillna('').astype(str).to_numpy()
+        with open(path, 'w') as f:
+            write_sigtyp(f, fields, vocab, codes)
+    if scores_path is not None:
+        with open(scores_path, 'w') as f:
+            write_scores(f, list(languages.columns), vocab, scores)
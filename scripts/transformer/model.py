@@ -3,13 +3,15 @@ import numpy as np
 from transformer.layers import Encoder
 from transformer.layers import CustomSchedule
 
+import dataset_cache
 import evaluate
+import instrumentation
 import os
 
 class Model():
-    def __init__(self, num_of_features, label_encoders, embedding_size, dev_x_mask, dev_x, dev_y):
+    def __init__(self, num_of_features, column_sizes, embedding_size, dev_x_mask, dev_x, dev_y):
         self.num_of_features = num_of_features
-        self.label_encoders = label_encoders
+        self.column_sizes = column_sizes
         # self.model = self.create_model(2048)
         self.model = self.create_attention_model(256)
         self.dev_x_mask = dev_x_mask
@@ -40,7 +42,7 @@ class Model():
         inputs = []
         for i in range(self.num_of_features):
             inputs.append(tf.keras.layers.Input(shape=1))
-            x = tf.keras.layers.Embedding(len(self.label_encoders[i].classes_), d_model)(inputs[-1])
+            x = tf.keras.layers.Embedding(self.column_sizes[i], d_model)(inputs[-1])
             outs.append(x)
 
         outs = tf.reshape(outs, [-1, self.num_of_features, d_model])
@@ -49,7 +51,7 @@ class Model():
         outpus = []
         for i in range(self.num_of_features):
             x = tf.keras.layers.Dense(64, tf.nn.relu)(outputs[:, i, :])
-            outpus.append(tf.keras.layers.Dense(len(self.label_encoders[i].classes_), activation=tf.nn.softmax, name='output_{}'.format(i))(x))
+            outpus.append(tf.keras.layers.Dense(self.column_sizes[i], activation=tf.nn.softmax, name='output_{}'.format(i))(x))
         
         return tf.keras.Model(inputs=inputs, outputs=outpus)
         
@@ -58,11 +60,11 @@ class Model():
         predictions = np.array(predictions)
         predictions = np.transpose(predictions)
         tmp = np.array(self.dev_x, copy=True)
-        tmp[self.dev_x_mask] = '?'
+        tmp[self.dev_x_mask] = dataset_cache.UNKNOWN
         dev_x = np.array(self.dev_x, copy=True)
         dev_x[self.dev_x_mask] = predictions[self.dev_x_mask]
 
-        return evaluate.evaluate(tmp, dev_x, self.dev_y)
+        return evaluate.evaluate(tmp, dev_x, self.dev_y, dataset_cache.UNKNOWN)
 
     @tf.function
     def train_on_batch(self, x, y, masks, class_weights):
@@ -86,7 +88,9 @@ class Model():
             print('Starting {} epoch'.format(epoch))
             cnt = 0
             for batch in train:
-                losses = self.model.train_on_batch(batch[0], batch[1], class_weight=class_weights, reset_metrics=False, sample_weight=batch[2])
+                with instrumentation.timer('model.train_on_batch'):
+                    losses = self.model.train_on_batch(batch[0], batch[1], class_weight=class_weights, reset_metrics=False, sample_weight=batch[2])
+                instrumentation.count('model.train_batches')
                 # losses = self.train_on_batch(batch[0], batch[1], np.array(list(batch[2].values())), class_weights)
                 print("Loss {}".format(np.sum(losses)))
                 print("Accuracy {}".format(np.mean([i.result() for i in self.model.metrics])))
@@ -98,11 +102,12 @@ class Model():
                     break
                                 
             self.accuracy.reset_states()
-            for x, y in dev:
-                probs = self.model.predict_on_batch(x)
-                for i in range(len(probs)):
-                    self.accuracy(y[i], probs[i])
-                break
+            with instrumentation.timer('model.dev_eval'):
+                for x, y in dev:
+                    probs = self.model.predict_on_batch(x)
+                    for i in range(len(probs)):
+                        self.accuracy(y[i], probs[i])
+                    break
 
             print("Dev accuracy {}".format(self.accuracy.result()))
             self.accuracy.reset_states()
@@ -0,0 +1,151 @@
+"""
+Python reader of the WALS CLDF dump (the same files as Sigtypio::read_wals:
+languages.csv, parameters.csv, codes.csv and values.csv).
+
+values.csv is streamed once into a sparse CSR language x parameter matrix of
+value codes, following the conventions of feature_vocab: MISSING (0) for no
+value and FIRST_VALUE + Number - 1 for the WALS value with that Number. The
+result is cached as memory-mapped arrays keyed by the content of the four
+files, so later runs load all of WALS in milliseconds.
+
+    wals = wals_cldf.load_wals('../data/wals-2020/cldf')
+    wals.matrix          # csr_matrix (languages x parameters)
+    wals.languages       # DataFrame with ID, Name, Macroarea, ..., Genus, Family
+    wals.vocab()         # FeatureVocab with the SIGTYP feature names and values
+"""
+import csv
+import hashlib
+import json
+import os
+from array import array
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+import dataset_cache
+from feature_vocab import FeatureVocab, FIRST_VALUE
+
+LANGUAGE_HEADER = ['ID', 'Name', 'Macroarea', 'Latitude', 'Longitude', 'Glottocode', 'ISO639P3code', 'Family', 'Subfamily', 'Genus', 'ISO_codes', 'Samples_100', 'Samples_200']
+PARAMETER_HEADER = ['ID', 'Name', 'Description', 'Contributor_ID', 'Chapter', 'Area']
+CODE_HEADER = ['ID', 'Parameter_ID', 'Name', 'Description', 'Number', 'icon']
+VALUE_HEADER = ['ID', 'Language_ID', 'Parameter_ID', 'Value', 'Code_ID', 'Comment', 'Source', 'Example_ID']
+
+LANGUAGE_COLUMNS = ['ID', 'Name', 'Macroarea', 'Latitude', 'Longitude', 'Glottocode', 'ISO639P3code', 'Family', 'Genus']
+FORMAT_VERSION = 2
+
+
+def read_rows(path, expected_header):
+    """
+    Yields the rows of the CLDF table as lists, checks the header first.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if header != expected_header:
+            raise ValueError('Unexpected headers in {}: {}'.format(os.path.basename(path), ','.join(header)))
+        yield from reader
+
+
+class Wals:
+    def __init__(self, languages, parameters, code_names, matrix):
+        self.languages = languages # DataFrame of LANGUAGE_COLUMNS, one row per matrix row
+        self.parameters = parameters # DataFrame with ID, Name, Area, one row per matrix column
+        self.code_names = code_names # code_names[j][number - 1] is the name of value number of parameter j
+        self.matrix = matrix # csr_matrix (languages x parameters) of value codes
+
+        self.language_index = {language: i for i, language in enumerate(languages['ID'])}
+        self.parameter_index = {parameter: j for j, parameter in enumerate(parameters['ID'])}
+
+    @property
+    def feature_names(self):
+        """
+        Parameter names in the SIGTYP format, e.g. Order_of_Subject,_Object_and_Verb.
+        """
+        return [' '.join(name.split()).replace(' ', '_') for name in self.parameters['Name']]
+
+    def vocab(self):
+        """
+        FeatureVocab of the parameters with SIGTYP values such as '1 SOV', ordered by the WALS number,
+        so that the matrix codes are the vocabulary codes.
+        """
+        values = [['{} {}'.format(number, name) for number, name in enumerate(names, 1)] for names in self.code_names]
+        return FeatureVocab(self.feature_names, values)
+
+    def codes(self, dtype=np.int16):
+        """
+        Dense (languages x parameters) code matrix.
+        """
+        return self.matrix.toarray().astype(dtype)
+
+
+def read_wals(path):
+    """
+    Parses the CLDF tables, values.csv is streamed row by row.
+    """
+    languages = pd.DataFrame(list(read_rows(os.path.join(path, 'languages.csv'), LANGUAGE_HEADER)), columns=LANGUAGE_HEADER)[LANGUAGE_COLUMNS]
+    languages[['Latitude', 'Longitude']] = languages[['Latitude', 'Longitude']].apply(pd.to_numeric, errors='coerce')
+    parameters = pd.DataFrame(list(read_rows(os.path.join(path, 'parameters.csv'), PARAMETER_HEADER)), columns=PARAMETER_HEADER)[['ID', 'Name', 'Area']]
+    language_index = {language: i for i, language in enumerate(languages['ID'])}
+    parameter_index = {parameter: j for j, parameter in enumerate(parameters['ID'])}
+
+    # code id -> (parameter, number)
+    code_names = [[] for _ in parameter_index]
+    code_numbers = {}
+    for code_id, parameter_id, name, _, number, _ in read_rows(os.path.join(path, 'codes.csv'), CODE_HEADER):
+        j, number = parameter_index[parameter_id], int(number)
+        names = code_names[j]
+        names.extend([''] * (number - len(names)))
+        names[number - 1] = name
+        code_numbers[code_id] = number
+
+    rows, columns, data = array('i'), array('i'), array('h')
+    for _, language_id, parameter_id, _, code_id, *_ in read_rows(os.path.join(path, 'values.csv'), VALUE_HEADER):
+        if language_id not in language_index or parameter_id not in parameter_index or code_id not in code_numbers:
+            continue
+        rows.append(language_index[language_id])
+        columns.append(parameter_index[parameter_id])
+        data.append(FIRST_VALUE + code_numbers[code_id] - 1)
+    rows, columns, data = np.frombuffer(rows, dtype=np.int32), np.frombuffer(columns, dtype=np.int32), np.frombuffer(data, dtype=np.int16)
+    # a language with several values of a parameter keeps the first one of values.csv, the sparse matrix
+    # constructor would add them up into another code
+    _, first = np.unique(rows.astype(np.int64) * len(parameter_index) + columns, return_index=True)
+    matrix = scipy.sparse.csr_matrix((data[first], (rows[first], columns[first])), shape=(len(language_index), len(parameter_index)))
+    return Wals(languages, parameters, code_names, matrix)
+
+
+def load_wals(path, cache_dir=None, refresh=False):
+    """
+    Loads WALS from the cache of memory-mapped arrays, reading the CLDF tables first if needed.
+    """
+    digest = hashlib.sha1(str(FORMAT_VERSION).encode()) # the caches of older versions are rebuilt
+    for name in ('languages.csv', 'parameters.csv', 'codes.csv', 'values.csv'):
+        digest.update(dataset_cache.file_digest(os.path.join(path, name)).encode())
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.abspath(path), dataset_cache.CACHE_DIR)
+    prefix = os.path.join(cache_dir, 'wals.{}'.format(digest.hexdigest()[:16]))
+    arrays = ('indptr', 'indices', 'data')
+
+    if refresh or not os.path.exists(prefix + '.json'):
+        wals = read_wals(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in arrays:
+            np.save('{}.{}.npy'.format(prefix, name), getattr(wals.matrix, name))
+        meta = {
+            'version': FORMAT_VERSION,
+            'shape': wals.matrix.shape,
+            'languages': wals.languages.to_dict(orient='list'),
+            'parameters': wals.parameters.to_dict(orient='list'),
+            'code_names': wals.code_names,
+        }
+        tmp = '{}.{}.tmp'.format(prefix, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, prefix + '.json') # the json is written last, it marks a complete cache
+        return wals
+
+    with open(prefix + '.json') as f:
+        meta = json.load(f)
+    indptr, indices, data = [np.load('{}.{}.npy'.format(prefix, name), mmap_mode='r') for name in arrays]
+    matrix = scipy.sparse.csr_matrix((data, indices, indptr), shape=tuple(meta['shape']))
+    return Wals(pd.DataFrame(meta['languages']), pd.DataFrame(meta['parameters']), meta['code_names'], matrix)